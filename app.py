@@ -3,229 +3,274 @@ import pandas as pd
 import plotly.express as px
 from datetime import datetime, date
 import numpy as np
-import json
+import cProfile
+import logging
 import os
+import time
+import uuid
+from contextlib import contextmanager
+
+from planilha.armazenamento import (
+    MODO_PERSISTENCIA, DadosAlterados, carregar_dados, compactar_dados, descartar_alteracoes, salvar_dados,
+    usar_sqlite
+)
+from planilha.estatisticas import (
+    GRUPOS_RISCO, JANELAS_ROI, NIVEL_CONFIANCA, REAMOSTRAGENS_BOOTSTRAP, analisar_risco, calcular_bootstrap,
+    calcular_desempenho_mensal as _calcular_desempenho_mensal, calcular_stats_agrupados,
+    calcular_stats_por as _calcular_stats_por, metricas_jogos, opcoes_periodo, resultados_por
+)
+from planilha.extratos import (
+    CAMPOS_IMPORTACAO, FORMATOS_EXPORTACAO, MAX_LINHAS_XLSX, blocos_jogos, carregar_mapeamento,
+    colunas_extrato, e_excel, exportar_blocos, filtrar_jogos, formatos_disponiveis, guardar_mapeamento, ler_extrato,
+    operacoes_extrato, operacoes_lote, preparar_lote_jogos, sugerir_coluna, tabela_exportacao
+)
+from planilha.modelo import (
+    COLUNAS_JOGO, MESES, aplicar_operacao, criar_estrutura_vazia, format_currency, format_percent, format_profit,
+    registo_entidade
+)
+from planilha.perfil import (
+    FASES_PERFIL, PERFIL_ATIVO, configurar as configurar_perfil, medido, novo_registo, perfil_atual
+)
+
+# Arquivo com o cProfile de uma execução ({} é a data e hora)
+CPROFILE_FILE = "perfil_{}.prof"
+
+# O perfil da execução em curso fica no estado da sessão
+configurar_perfil(lambda: st.session_state.get('perfil_execucao'))
+
+
+def iniciar_perfil():
+    """Começa o perfil desta execução; as gravações ainda não mostradas (fragmentos, execuções interrompidas)
+    passam para ela"""
+    anterior = st.session_state.get('perfil_execucao')
+    gravacoes = bytes_escritos = 0
+    if anterior:
+        if anterior['cprofile'] is not None:
+            anterior['cprofile'].disable()
+        gravacoes = anterior['gravacoes'] - anterior['mostrado'][0]
+        bytes_escritos = anterior['bytes'] - anterior['mostrado'][1]
+
+    cprofile = None
+    if st.session_state.pop('pedir_cprofile', False):
+        cprofile = cProfile.Profile()
+        cprofile.enable()
+    registo = novo_registo()
+    registo.update(gravacoes=gravacoes, bytes=bytes_escritos, cprofile=cprofile)
+    st.session_state.perfil_execucao = registo
+
+
+@contextmanager
+def medir_pagina(pagina):
+    """Mede o tempo total da página despachada pelo main()"""
+    perfil = perfil_atual()
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        if perfil is not None:
+            perfil['pagina'], perfil['tempo_pagina'] = pagina, time.perf_counter() - inicio
 
-# Nome do arquivo para salvar os dados
-DATA_FILE = "dados_apostas.json"
 
+@medido('formatar')
+def coluna_moeda(rotulo, com_sinal=False):
+    """Coluna de tabela com valores numéricos apresentados como moeda (com sinal para lucros)"""
+    return st.column_config.NumberColumn(rotulo, format="€%+.2f" if com_sinal else "€%.2f")
 
-def convert_numpy_types(value):
-    """Converte tipos numpy para tipos nativos do Python"""
-    if isinstance(value, (np.integer, np.floating, np.bool_)):
-        return value.item()
-    elif isinstance(value, np.ndarray):
-        return value.tolist()
-    return value
 
+@medido('formatar')
+def coluna_percentagem(rotulo):
+    """Coluna de tabela com valores numéricos apresentados como porcentagem"""
+    return st.column_config.NumberColumn(rotulo, format="%.2f%%")
 
-def format_currency(value):
-    """Formata valores como moeda"""
-    try:
-        return f"€{float(value):.2f}"
-    except (ValueError, TypeError):
-        return value
 
+@medido('grafico')
+def mostrar_grafico(criar, *args, **kwargs):
+    """Constrói o gráfico com a função do Plotly Express dada e mostra-o na largura da página"""
+    st.plotly_chart(criar(*args, **kwargs), width='stretch')
 
-def format_percent(value):
-    """Formata valores como porcentagem"""
-    try:
-        return f"{float(value):.2f}%"
-    except (ValueError, TypeError):
-        return value
-
-
-def carregar_dados():
-    """Carrega os dados do arquivo JSON se existir"""
-    if os.path.exists(DATA_FILE):
-        try:
-            with open(DATA_FILE, 'r', encoding='utf-8') as f:
-                # Verifica se o arquivo não está vazio
-                if os.stat(DATA_FILE).st_size == 0:
-                    return None
-
-                dados = json.load(f)
-
-                # Verifica se os dados têm a estrutura esperada
-                if not all(key in dados for key in ['equipas', 'campeonatos', 'estrategias', 'tags', 'mensal']):
-                    st.warning("Estrutura de dados inválida no arquivo. Criando nova estrutura.")
-                    return None
-
-                # Converter os DataFrames
-                dados['equipas'] = pd.DataFrame(dados['equipas'])
-                dados['campeonatos'] = pd.DataFrame(dados['campeonatos'])
-                dados['estrategias'] = pd.DataFrame(dados['estrategias'])
-
-                # Converter os DataFrames mensais
-                for mes in dados['mensal']:
-                    df = pd.DataFrame(dados['mensal'][mes])
-                    if 'Data' in df.columns:
-                        try:
-                            df['Data'] = pd.to_datetime(df['Data']).dt.date
-                        except:
-                            df['Data'] = datetime.now().date()
-                    dados['mensal'][mes] = df
-
-                return dados
-        except json.JSONDecodeError:
-            st.warning("Arquivo de dados corrompido. Criando nova estrutura.")
-            return None
-        except Exception as e:
-            st.error(f"Erro inesperado ao carregar dados: {str(e)}")
-            return None
-    return None
-
-
-def salvar_dados():
-    """Salva os dados no arquivo JSON"""
-    try:
-        # Função para converter objetos date para string
-        def date_converter(obj):
-            if isinstance(obj, date):
-                return obj.isoformat()
-            raise TypeError(f"Object of type {type(obj)} is not JSON serializable")
-
-        dados_para_salvar = {
-            'equipas': st.session_state.dados['equipas'].to_dict(),
-            'campeonatos': st.session_state.dados['campeonatos'].to_dict(),
-            'estrategias': st.session_state.dados['estrategias'].to_dict(),
-            'tags': st.session_state.dados['tags'],
-            'mensal': {}
-        }
-
-        # Converter DataFrames mensais, tratando as datas
-        for mes in st.session_state.dados['mensal']:
-            df = st.session_state.dados['mensal'][mes].copy()
-            if 'Data' in df.columns:
-                df['Data'] = df['Data'].astype(str)  # Converte datas para string
-            dados_para_salvar['mensal'][mes] = df.to_dict()
-
-        with open(DATA_FILE, 'w', encoding='utf-8') as f:
-            json.dump(dados_para_salvar, f, default=date_converter, ensure_ascii=False, indent=4)
-    except Exception as e:
-        st.error(f"Erro ao salvar dados: {str(e)}")
 
+def periodo_selecionado():
+    """(inicio, fim) do período escolhido na barra lateral; (None, None) para todos os anos"""
+    return st.session_state.get('periodo', (None, None))
 
-# Initialize data structure
-if 'dados' not in st.session_state:
-    dados_carregados = carregar_dados()
-    meses = [
-        'Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho',
-        'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro'
-    ]
 
-    if dados_carregados:
-        st.session_state.dados = dados_carregados
-    else:
-        st.session_state.dados = {
-            'equipas': pd.DataFrame(columns=['Nome']),
-            'campeonatos': pd.DataFrame(columns=['Nome', 'Temporada', 'Jogos']),
-            'estrategias': pd.DataFrame(columns=['Nome', 'Descrição', 'Equipa', 'Tags']),
-            'tags': ["Normal", "Arbitrage", "Value Bet", "Sure Bet"],
-            'mensal': {
-                mes: pd.DataFrame(columns=[
-                    'Data', 'Competição', 'Casa', 'Visitante',
-                    'Estrategia', 'Tag', 'Stake', 'Profit/Loss', '% Stake'
-                ])
-                for mes in meses
-            }
-        }
-
-
-def calcular_stats_campeonato(nome_campeonato):
-    """Calculate statistics for a specific championship"""
-    stats = {
-        'total_jogos': 0,
-        'total_stake': 0,
-        'total_profit': 0,
-        'greens': 0,
-        'reds': 0,
-        'roi': 0
-    }
+def concatenar_jogos():
+    """Jogos do período selecionado (só lê as partições desse período)"""
+    return st.session_state.dados['jogos'].periodo(*periodo_selecionado())
 
-    for mes in st.session_state.dados['mensal'].values():
-        jogos_camp = mes[mes['Competição'] == nome_campeonato]
-        if not jogos_camp.empty:
-            stats['total_jogos'] += len(jogos_camp)
-            stats['total_stake'] += jogos_camp['Stake'].sum()
-            stats['total_profit'] += jogos_camp['Profit/Loss'].sum()
-            stats['greens'] += len(jogos_camp[jogos_camp['Profit/Loss'] >= 0])
-            stats['reds'] += len(jogos_camp[jogos_camp['Profit/Loss'] < 0])
-
-    if stats['total_stake'] > 0:
-        stats['roi'] = (stats['total_profit'] / stats['total_stake']) * 100
-
-    # Converter valores numpy para tipos nativos do Python
-    return {k: convert_numpy_types(v) for k, v in stats.items()}
-
-
-def calcular_stats_equipa(nome_equipa):
-    """Calculate statistics for a specific team"""
-    stats = {
-        'Mercados': 0,
-        'Greens': 0,
-        'Reds': 0,
-        'Stake Total': 0,
-        'Profit/Loss': 0,
-        'ROI (%)': 0
-    }
 
-    for mes in st.session_state.dados['mensal'].values():
-        jogos_equipa = mes[(mes['Casa'] == nome_equipa) | (mes['Visitante'] == nome_equipa)]
-        if not jogos_equipa.empty:
-            stats['Mercados'] += len(jogos_equipa)
-            stats['Stake Total'] += jogos_equipa['Stake'].sum()
-            stats['Profit/Loss'] += jogos_equipa['Profit/Loss'].sum()
-            stats['Greens'] += len(jogos_equipa[jogos_equipa['Profit/Loss'] >= 0])
-            stats['Reds'] += len(jogos_equipa[jogos_equipa['Profit/Loss'] < 0])
+@st.cache_data(max_entries=256, show_spinner=False)
+def _agregado_em_cache(nome, id_dados, versao, periodo, parametros, _calcular):
+    """Só corre quando a combinação (dados, versão, período, parâmetros) ainda não está em cache"""
+    st.session_state.cache_agregados['calculos'] += 1
+    return _calcular()
 
-    if stats['Stake Total'] > 0:
-        stats['ROI (%)'] = (stats['Profit/Loss'] / stats['Stake Total']) * 100
 
-    # Converter valores numpy para tipos nativos do Python
-    return {k: convert_numpy_types(v) for k, v in stats.items()}
+@medido('agregar')
+def obter_agregado(nome, calcular, *parametros):
+    """Resultado de um agregado do período selecionado, em cache até à próxima alteração dos dados"""
+    contadores = st.session_state.setdefault('cache_agregados', {'pedidos': 0, 'calculos': 0})
+    contadores['pedidos'] += 1
+    return _agregado_em_cache(
+        nome, st.session_state.id_dados, st.session_state.get('versao_dados', 0),
+        periodo_selecionado(), parametros, calcular
+    )
 
 
-def atualizar_campeonatos():
-    """Update championship data based on games"""
-    campeonatos = st.session_state.dados['campeonatos'].copy()
+def obter_stats_agrupados():
+    """Devolve as estatísticas agrupadas do período selecionado, recalculando apenas após alterações nos dados"""
+    return obter_agregado(
+        'stats_agrupados', lambda: calcular_stats_agrupados(st.session_state.dados, *periodo_selecionado())
+    )
+
+
+def calcular_stats_por(coluna, nomes):
+    """Profit/Stake/ROI/Greens/Reds de cada nome de uma coluna (Estrategia, Tag...), pela ordem dada"""
+    stats = obter_agregado(
+        'stats_por', lambda: _calcular_stats_por(st.session_state.dados, coluna, *periodo_selecionado()), coluna
+    )
+    return stats.reindex(pd.Index(nomes).unique(), fill_value=0)
+
+
+def calcular_desempenho_mensal():
+    """Stake, Profit e ROI de cada mês com jogos no período (em cache até à próxima alteração)"""
+    return obter_agregado(
+        'desempenho_mensal', lambda: _calcular_desempenho_mensal(st.session_state.dados, *periodo_selecionado())
+    )
+
+
+def ultimos_jogos(quantidade=5):
+    """Os jogos mais recentes do período selecionado (em cache até à próxima alteração)"""
+    return obter_agregado(
+        'ultimos_jogos', lambda: st.session_state.dados['jogos'].ultimos(quantidade, *periodo_selecionado()), quantidade
+    )
+
+
+def obter_analise_risco(coluna=None, banca_inicial=0.0):
+    """Análise de risco do período selecionado, em cache até à próxima alteração dos dados"""
+    return obter_agregado('risco', lambda: analisar_risco(concatenar_jogos(), coluna, banca_inicial),
+                          coluna, banca_inicial)
+
+
+def obter_bootstrap(coluna):
+    """Intervalos do ROI de uma coluna no período selecionado, em cache até à próxima alteração dos dados"""
+    with st.spinner("A calcular os intervalos de confiança..."):
+        return obter_agregado('bootstrap', lambda: calcular_bootstrap(concatenar_jogos()))[coluna]
+
+
+def registrar(*operacoes):
+    """Aplica as operações aos dados da sessão e persiste-as"""
+    if not operacoes:
+        return
+    # Qualquer alteração muda a versão e, com ela, a chave dos agregados em cache
+    st.session_state.versao_dados = st.session_state.get('versao_dados', 0) + 1
+    try:
+        # No SQLite os jogos são escritos logo ao aplicar, por isso o conflito pode surgir já aqui
+        for op in operacoes:
+            aplicar_operacao(st.session_state.dados, op)
+        salvar_dados(st.session_state.dados, *operacoes)
+    except Exception as e:
+        # A operação pode ter ficado aplicada só em memória: a sessão volta aos dados gravados
+        descartar_alteracoes(st.session_state.dados)
+        carregar_sessao()
+        if isinstance(e, DadosAlterados):
+            # Outra sessão gravou entretanto: estes dados ficaram para trás
+            st.session_state.dados_recarregados = (
+                "Os dados foram alterados noutra sessão e foram recarregados; a última alteração não foi gravada."
+            )
+        else:
+            st.error(f"Erro ao salvar dados: {str(e)}. A alteração não foi gravada.")
 
-    for idx, campeonato in campeonatos.iterrows():
-        stats = calcular_stats_campeonato(campeonato['Nome'])
-        st.session_state.dados['campeonatos'].at[idx, 'Jogos'] = stats['total_jogos']
 
-    salvar_dados()
+def atualizar_campeonatos():
+    """Update championship data based on games"""
+    # A coluna Jogos conta os jogos de todos os anos, seja qual for o período selecionado
+    stats = calcular_stats_agrupados(st.session_state.dados)
+    campeonatos = st.session_state.dados['campeonatos']
+    jogos = campeonatos['Nome'].map(stats['campeonatos']['total_jogos']).fillna(0).astype(int)
+
+    # Só regista os campeonatos cuja contagem mudou
+    alterados = jogos[jogos != campeonatos['Jogos']]
+    registrar(*[
+        {'entidade': 'campeonato', 'acao': 'atualizar', 'indice': idx, 'registro': {'Jogos': total}}
+        for idx, total in alterados.items()
+    ])
 
 
 def adicionar_equipa_se_nao_existir(nome_equipa):
-    """Automatically add team if it doesn't exist"""
-    if nome_equipa and nome_equipa not in st.session_state.dados['equipas']['Nome'].tolist():
-        nova_equipa = pd.DataFrame([{'Nome': nome_equipa}])
-        st.session_state.dados['equipas'] = pd.concat(
-            [st.session_state.dados['equipas'], nova_equipa],
-            ignore_index=True
-        )
-        salvar_dados()
+    """Automatically add team if it doesn't exist; returns the canonical name"""
+    if not nome_equipa:
+        return nome_equipa
+    existente = registo_entidade(st.session_state.dados, 'equipa').procurar(nome_equipa)
+    if existente is None:
+        registrar({'entidade': 'equipa', 'acao': 'adicionar', 'registro': {'Nome': nome_equipa}})
+    return existente or nome_equipa
 
 
 def adicionar_campeonato_se_nao_existir(nome_campeonato):
-    """Automatically add championship if it doesn't exist"""
-    if nome_campeonato and nome_campeonato not in st.session_state.dados['campeonatos']['Nome'].tolist():
-        novo_campeonato = pd.DataFrame([{
+    """Automatically add championship if it doesn't exist; returns the canonical name"""
+    if not nome_campeonato:
+        return nome_campeonato
+    existente = registo_entidade(st.session_state.dados, 'campeonato').procurar(nome_campeonato)
+    if existente is None:
+        # Jogos já gravados com este nome (ex.: de antes de o campeonato ser registado) entram na contagem
+        registrar({'entidade': 'campeonato', 'acao': 'adicionar', 'registro': {
             'Nome': nome_campeonato,
             'Temporada': datetime.now().year,
-            'Jogos': 0
-        }])
-        st.session_state.dados['campeonatos'] = pd.concat(
-            [st.session_state.dados['campeonatos'], novo_campeonato],
-            ignore_index=True
-        )
-        salvar_dados()
+            'Jogos': st.session_state.dados['resumo'].jogos_com('campeonato', nome_campeonato)
+        }})
+    return existente or nome_campeonato
+
+
+def nome_canonico(entidade, nome):
+    """Nome registado que corresponde ao nome escrito (ex.: 'benfica' -> 'Benfica'), ou o próprio nome"""
+    return registo_entidade(st.session_state.dados, entidade).procurar(nome) or nome
+
+
+def adicionar_jogos_em_lote(jogos):
+    """Valida e insere um lote de jogos, registando equipas e campeonatos novos numa só gravação"""
+    df, erros = preparar_lote_jogos(jogos)
+    if erros or df.empty:
+        return 0, erros
+
+    registrar(*operacoes_lote(st.session_state.dados, df))
+    return len(df), []
+
+
+# Jogos mostrados em cada página do seletor de jogos a editar
+JOGOS_POR_PAGINA = 50
+
+# Linhas em branco da grelha de jogos do dia (cresce ao colar ou acrescentar linhas)
+LINHAS_GRELHA = 5
+
+
+if PERFIL_ATIVO:
+    iniciar_perfil()
+
+
+def carregar_sessao():
+    """Carrega os dados gravados para o estado da sessão"""
+    avisos = {logging.WARNING: st.warning, logging.ERROR: st.error}
+    st.session_state.dados = carregar_dados(lambda nivel, mensagem: avisos[nivel](mensagem)) or criar_estrutura_vazia()
+    # Identifica estes dados em memória nas chaves da cache de agregados (partilhada entre sessões)
+    st.session_state.id_dados = uuid.uuid4().hex
+    if st.session_state.dados.pop('converter_formato', False):
+        compactar_dados(st.session_state.dados)
+
+
+# Initialize data structure
+if 'dados' not in st.session_state:
+    carregar_sessao()
+    # Corrige contagens de jogos gravadas por versões anteriores (só grava se mudarem); vem do resumo,
+    # por isso não lê as partições do armazenamento colunar
+    atualizar_campeonatos()
+
+if 'dados_recarregados' in st.session_state:
+    st.warning(st.session_state.pop('dados_recarregados'))
 
 
 def show_painel():
     st.title("🏠 Painel Principal")
-    atualizar_campeonatos()
 
     col1, col2, col3 = st.columns(3)
     with col1:
@@ -236,82 +281,151 @@ def show_painel():
         st.metric("Total de Estratégias", len(st.session_state.dados['estrategias']))
 
     st.subheader("📊 Desempenho Mensal")
-    performance = []
-    total_stake = total_profit = 0
-
-    for month, df in st.session_state.dados['mensal'].items():
-        if not df.empty:
-            stake = df['Stake'].sum()
-            profit = df['Profit/Loss'].sum()
-            roi = (profit / stake * 100) if stake != 0 else 0
-
-            performance.append({
-                'Mês': month,
-                'Stake Total': stake,
-                'Profit Total': profit,
-                'ROI (%)': roi
-            })
-
-            total_stake += stake
-            total_profit += profit
-
-    total_roi = (total_profit / total_stake * 100) if total_stake != 0 else 0
-    performance.append({
-        'Mês': 'TOTAL',
-        'Stake Total': total_stake,
-        'Profit Total': total_profit,
-        'ROI (%)': total_roi
-    })
-
-    df_perf = pd.DataFrame(performance)
-
-    # Formatar valores
-    df_perf['Stake Total'] = df_perf['Stake Total'].apply(format_currency)
-    df_perf['Profit Total'] = df_perf['Profit Total'].apply(
-        lambda x: format_currency(x).replace('€', '€+') if x >= 0 else format_currency(x)
-    )
-    df_perf['ROI (%)'] = df_perf['ROI (%)'].apply(format_percent)
+    df_perf = calcular_desempenho_mensal()
 
     st.dataframe(
         df_perf,
+        column_config={
+            'Stake Total': coluna_moeda('Stake Total'),
+            'Profit Total': coluna_moeda('Profit Total', com_sinal=True),
+            'ROI (%)': coluna_percentagem('ROI (%)')
+        },
         hide_index=True
     )
 
     st.subheader("📈 Evolução do ROI Mensal")
     if len(df_perf) > 1:
-        df_plot = df_perf[df_perf['Mês'] != 'TOTAL'].copy()
-        df_plot['ROI (%)'] = df_plot['ROI (%)'].str.replace('%', '').astype(float)
+        df_plot = df_perf[df_perf['Mês'] != 'TOTAL']
 
-        fig = px.line(
+        mostrar_grafico(
+            px.line,
             df_plot,
             x='Mês', y='ROI (%)',
             title="ROI por Mês",
             markers=True
         )
-        st.plotly_chart(fig, use_container_width=True)
 
     st.subheader("📅 Últimos Jogos")
-    all_games = []
-    for month, df in st.session_state.dados['mensal'].items():
-        if not df.empty:
-            all_games.extend(df.to_dict('records'))
-
-    if all_games:
-        df_games = pd.DataFrame(all_games).sort_values('Data', ascending=False).head(5)
-        df_games['Stake'] = df_games['Stake'].apply(format_currency)
-        df_games['Profit/Loss'] = df_games['Profit/Loss'].apply(
-            lambda x: format_currency(x).replace('€', '€+') if x >= 0 else format_currency(x)
-        )
-        df_games['% Stake'] = df_games['% Stake'].apply(format_percent)
+    df_games = ultimos_jogos(5)
 
-        st.dataframe(df_games, hide_index=True)
+    if not df_games.empty:
+        st.dataframe(
+            df_games,
+            column_config={
+                'Data': st.column_config.DateColumn('Data', format='DD/MM/YYYY'),
+                'Stake': coluna_moeda('Stake'),
+                'Profit/Loss': coluna_moeda('Profit/Loss', com_sinal=True),
+                '% Stake': coluna_percentagem('% Stake')
+            },
+            hide_index=True
+        )
     else:
         st.info("Nenhum jogo registrado ainda.")
 
 
-def show_equipas():
-    st.title("⚽ Equipas")
+def mostrar_perfil():
+    """Painel da barra lateral com o perfil desta execução; grava o cProfile se esta execução o pediu"""
+    perfil = perfil_atual()
+    if perfil is None:
+        return
+    total = time.perf_counter() - perfil['inicio']
+    if perfil['cprofile'] is not None:
+        perfil['cprofile'].disable()
+        arquivo = CPROFILE_FILE.format(datetime.now().strftime('%Y%m%d_%H%M%S'))
+        perfil['cprofile'].dump_stats(arquivo)
+        perfil['cprofile'] = None
+        st.session_state.cprofile_gravado = arquivo
+
+    with st.sidebar.expander("⏱️ Perfil da execução", expanded=False):
+        fases = list(perfil['fases'].values())
+        st.dataframe(
+            pd.DataFrame({
+                'Fase': list(FASES_PERFIL.values()) + ["Outros"],
+                'Tempo (ms)': np.array(fases + [total - sum(fases)]) * 1000
+            }),
+            column_config={'Tempo (ms)': st.column_config.NumberColumn('Tempo (ms)', format="%.1f")},
+            hide_index=True
+        )
+        st.caption(f"{perfil['pagina']}: {perfil['tempo_pagina'] * 1000:.0f} ms · execução: {total * 1000:.0f} ms")
+        st.caption(f"salvar_dados: {perfil['gravacoes']} chamadas · {perfil['bytes'] / 1024:.1f} KB escritos")
+        perfil['mostrado'] = (perfil['gravacoes'], perfil['bytes'])
+
+        if st.button("🧪 Gravar cProfile da próxima execução"):
+            st.session_state.pedir_cprofile = True
+            st.rerun()
+        if 'cprofile_gravado' in st.session_state:
+            st.caption(f"Último cProfile: {st.session_state.cprofile_gravado} (abrir com `python -m pstats`)")
 
+
+def com_intervalos(tabela, coluna, chave):
+    """Junta à tabela de desempenho o intervalo de confiança do ROI e a probabilidade de ROI positivo"""
+    return tabela.join(obter_bootstrap(coluna), on=chave)
+
+
+def colunas_intervalos():
+    """Configuração das colunas acrescentadas por com_intervalos"""
+    return {
+        rotulo: coluna_percentagem(rotulo)
+        for rotulo in (f"IC {NIVEL_CONFIANCA:.0%} Inf (%)", f"IC {NIVEL_CONFIANCA:.0%} Sup (%)", "P(ROI > 0) (%)")
+    }
+
+
+def mostrar_intervalos(tabela, chave, roi, titulo):
+    """Gráfico do ROI de cada nome com o seu intervalo de confiança, colorido pela probabilidade de ROI > 0"""
+    inferior, superior = f"IC {NIVEL_CONFIANCA:.0%} Inf (%)", f"IC {NIVEL_CONFIANCA:.0%} Sup (%)"
+    tabela = tabela.dropna(subset=[inferior]).assign(
+        acima=lambda df: df[superior] - df[roi],
+        abaixo=lambda df: df[roi] - df[inferior]
+    )
+    if tabela.empty:
+        return
+    mostrar_grafico(
+        px.scatter,
+        tabela,
+        x=chave,
+        y=roi,
+        error_y='acima',
+        error_y_minus='abaixo',
+        color='P(ROI > 0) (%)',
+        range_color=[0, 100],
+        title=titulo,
+        labels={roi: 'ROI (%)'},
+        color_continuous_scale='RdYlGn'
+    )
+    st.caption(
+        f"Intervalo de {NIVEL_CONFIANCA:.0%} do ROI por bootstrap "
+        f"({REAMOSTRAGENS_BOOTSTRAP} reamostragens dos jogos): "
+        "com poucos jogos o intervalo é largo e o ROI pontual diz pouco."
+    )
+
+
+def mostrar_uso(dimensao, nome):
+    """Mostra em quantos jogos o nome é usado (contagem mantida no resumo) e devolve esse número"""
+    jogos = st.session_state.dados['resumo'].jogos_com(dimensao, nome)
+    st.caption(f"🔗 Usado por {jogos} jogo(s)")
+    return jogos
+
+
+def mostrar_duplicados(entidade):
+    """Lista os nomes que só diferem na escrita e junta-os de uma vez no nome canónico"""
+    duplicados = registo_entidade(st.session_state.dados, entidade).duplicados()
+    if not duplicados:
+        return
+    with st.expander(f"🧹 Nomes duplicados ({len(duplicados)})", expanded=False):
+        st.dataframe(
+            pd.DataFrame({'Nome': list(duplicados), 'Junta em': list(duplicados.values())}),
+            hide_index=True,
+            width='stretch'
+        )
+        if st.button("🔗 Juntar duplicados", key=f"fundir_{entidade}"):
+            registrar({'entidade': entidade, 'acao': 'fundir', 'nomes': duplicados})
+            st.success(f"{len(duplicados)} nome(s) juntados!")
+            st.rerun()
+
+
+@st.fragment
+def gerir_equipas():
+    """Formulários de adicionar e editar equipas"""
     col1, col2 = st.columns(2)
 
     # Seção para adicionar nova equipa (inicia fechada)
@@ -323,15 +437,10 @@ def show_equipas():
                 if st.form_submit_button("Adicionar"):
                     if not new_name:
                         st.error("O nome da equipa é obrigatório!")
-                    elif new_name in st.session_state.dados['equipas']['Nome'].tolist():
-                        st.warning("Esta equipa já existe!")
+                    elif registo_entidade(st.session_state.dados, 'equipa').procurar(new_name):
+                        st.warning(f"Esta equipa já existe ({nome_canonico('equipa', new_name)})!")
                     else:
-                        nova_equipa = pd.DataFrame([{'Nome': new_name}])
-                        st.session_state.dados['equipas'] = pd.concat(
-                            [st.session_state.dados['equipas'], nova_equipa],
-                            ignore_index=True
-                        )
-                        salvar_dados()
+                        registrar({'entidade': 'equipa', 'acao': 'adicionar', 'registro': {'Nome': new_name}})
                         st.success("Equipa adicionada com sucesso!")
                         st.rerun()
 
@@ -348,6 +457,7 @@ def show_equipas():
                 idx = st.session_state.dados['equipas'][
                     st.session_state.dados['equipas']['Nome'] == equipa_selecionada
                     ].index[0]
+                jogos_em_uso = mostrar_uso('equipa', equipa_selecionada)
 
                 with st.form("editar_equipa_form"):
                     novo_nome = st.text_input(
@@ -361,69 +471,52 @@ def show_equipas():
                         if st.form_submit_button("💾 Salvar Alterações"):
                             if not novo_nome:
                                 st.error("O nome não pode ser vazio!")
-                            elif novo_nome != equipa_selecionada and novo_nome in st.session_state.dados['equipas'][
-                                'Nome'].tolist():
+                            elif registo_entidade(st.session_state.dados, 'equipa').outro(
+                                    novo_nome, equipa_selecionada):
                                 st.warning("Já existe uma equipa com este nome!")
                             else:
-                                # Atualiza o nome da equipa
-                                st.session_state.dados['equipas'].at[idx, 'Nome'] = novo_nome
-
-                                # Atualiza todos os jogos que referenciam esta equipa
-                                for mes in st.session_state.dados['mensal']:
-                                    df_mes = st.session_state.dados['mensal'][mes]
-                                    df_mes.loc[df_mes['Casa'] == equipa_selecionada, 'Casa'] = novo_nome
-                                    df_mes.loc[df_mes['Visitante'] == equipa_selecionada, 'Visitante'] = novo_nome
-
-                                salvar_dados()
+                                # Atualiza o nome da equipa e todos os jogos que a referenciam
+                                registrar({
+                                    'entidade': 'equipa', 'acao': 'atualizar', 'indice': idx,
+                                    'registro': {'Nome': novo_nome}
+                                })
                                 st.success("Equipa atualizada com sucesso!")
                                 st.rerun()
 
                     with col_del:
                         if st.form_submit_button("🗑️ Remover Equipa"):
                             # Verifica se a equipa está sendo usada em algum jogo
-                            em_uso = False
-                            for mes in st.session_state.dados['mensal']:
-                                df_mes = st.session_state.dados['mensal'][mes]
-                                if (equipa_selecionada in df_mes['Casa'].values or
-                                        equipa_selecionada in df_mes['Visitante'].values):
-                                    em_uso = True
-                                    break
-
-                            if em_uso:
+                            if jogos_em_uso:
                                 st.warning("Esta equipa está em uso e não pode ser removida!")
                             else:
-                                st.session_state.dados['equipas'] = st.session_state.dados['equipas'].drop(
-                                    idx).reset_index(drop=True)
-                                salvar_dados()
+                                registrar({'entidade': 'equipa', 'acao': 'remover', 'indice': idx})
                                 st.success("Equipa removida com sucesso!")
                                 st.rerun()
             else:
                 st.info("Nenhuma equipa cadastrada para edição")
 
-    # Seção de estatísticas (permanece igual)
-    st.subheader("📋 Estatísticas das Equipas")
-    if not st.session_state.dados['equipas'].empty:
-        equipas_stats = []
 
-        for _, equipa in st.session_state.dados['equipas'].iterrows():
-            stats = calcular_stats_equipa(equipa['Nome'])
-            equipas_stats.append({
-                'Equipa': equipa['Nome'],
-                **stats
-            })
+def show_equipas():
+    st.title("⚽ Equipas")
 
-        df_stats = pd.DataFrame(equipas_stats)
+    gerir_equipas()
 
-        # Formatar valores
-        df_stats['Stake Total'] = df_stats['Stake Total'].apply(format_currency)
-        df_stats['Profit/Loss'] = df_stats['Profit/Loss'].apply(
-            lambda x: format_currency(x).replace('€', '€+') if x >= 0 else format_currency(x)
-        )
-        df_stats['ROI (%)'] = df_stats['ROI (%)'].apply(format_percent)
+    mostrar_duplicados('equipa')
+
+    # Seção de estatísticas (permanece igual)
+    st.subheader("📋 Estatísticas das Equipas")
+    if not st.session_state.dados['equipas'].empty:
+        nomes = st.session_state.dados['equipas']['Nome']
+        df_stats = obter_stats_agrupados()['equipas'].reindex(nomes.values, fill_value=0)
+        df_stats = df_stats.reset_index(drop=True)
+        df_stats.insert(0, 'Equipa', nomes.values)
 
         st.dataframe(
             df_stats,
             column_config={
+                "Stake Total": coluna_moeda("Stake Total"),
+                "Profit/Loss": coluna_moeda("Profit/Loss", com_sinal=True),
+                "ROI (%)": coluna_percentagem("ROI (%)"),
                 "Greens": st.column_config.ProgressColumn(
                     "Greens",
                     format="%d",
@@ -438,17 +531,14 @@ def show_equipas():
                 )
             },
             hide_index=True,
-            use_container_width=True
+            width='stretch'
         )
 
         st.subheader("📊 Performance por Equipa")
         if len(df_stats) > 1:
-            df_plot = df_stats.copy()
-            df_plot['Profit/Loss'] = df_plot['Profit/Loss'].str.replace('€+', '').str.replace('€', '').astype(float)
-            df_plot['ROI (%)'] = df_plot['ROI (%)'].str.replace('%', '').astype(float)
-
-            fig = px.bar(
-                df_plot.sort_values('Profit/Loss', ascending=False),
+            mostrar_grafico(
+                px.bar,
+                df_stats.sort_values('Profit/Loss', ascending=False),
                 x='Equipa',
                 y='Profit/Loss',
                 color='ROI (%)',
@@ -456,15 +546,13 @@ def show_equipas():
                 labels={'Profit/Loss': 'Lucro/Prejuízo (€)'},
                 color_continuous_scale='RdYlGn'
             )
-            st.plotly_chart(fig, use_container_width=True)
     else:
         st.info("Nenhuma equipa cadastrada ainda.")
 
 
-def show_campeonatos():
-    st.title("🏆 Campeonatos")
-    atualizar_campeonatos()
-
+@st.fragment
+def gerir_campeonatos():
+    """Formulários de adicionar e editar campeonatos"""
     col_add, col_edit = st.columns(2)
 
     # Seção para adicionar novo campeonato (inicia fechada)
@@ -475,20 +563,15 @@ def show_campeonatos():
                 season = st.text_input("Temporada*", str(datetime.now().year)).strip()
 
                 if st.form_submit_button("Salvar") and name and season:
-                    if name in st.session_state.dados['campeonatos']['Nome'].tolist():
-                        st.warning("Este campeonato já existe!")
+                    if registo_entidade(st.session_state.dados, 'campeonato').procurar(name):
+                        st.warning(f"Este campeonato já existe ({nome_canonico('campeonato', name)})!")
                     else:
-                        new_comp = pd.DataFrame([{
+                        registrar({'entidade': 'campeonato', 'acao': 'adicionar', 'registro': {
                             'Nome': name,
                             'Temporada': season,
                             'Jogos': 0
-                        }])
-                        st.session_state.dados['campeonatos'] = pd.concat(
-                            [st.session_state.dados['campeonatos'], new_comp],
-                            ignore_index=True
-                        )
+                        }})
                         st.success("Campeonato adicionado com sucesso!")
-                        salvar_dados()
                         st.rerun()
 
     # Seção para editar/remover campeonatos (inicia fechada)
@@ -504,6 +587,7 @@ def show_campeonatos():
                 idx = st.session_state.dados['campeonatos'][
                     st.session_state.dados['campeonatos']['Nome'] == campeonato_selecionado
                     ].index[0]
+                jogos_em_uso = mostrar_uso('campeonato', campeonato_selecionado)
 
                 with st.form("editar_campeonato_form"):
                     novo_nome = st.text_input(
@@ -522,67 +606,55 @@ def show_campeonatos():
                         if st.form_submit_button("💾 Salvar Alterações"):
                             if not novo_nome:
                                 st.error("O nome não pode ser vazio!")
-                            elif novo_nome != campeonato_selecionado and novo_nome in \
-                                    st.session_state.dados['campeonatos']['Nome'].tolist():
+                            elif registo_entidade(st.session_state.dados, 'campeonato').outro(
+                                    novo_nome, campeonato_selecionado):
                                 st.warning("Já existe um campeonato com este nome!")
                             else:
-                                # Atualiza o campeonato
-                                st.session_state.dados['campeonatos'].at[idx, 'Nome'] = novo_nome
-                                st.session_state.dados['campeonatos'].at[idx, 'Temporada'] = nova_temporada
-
-                                # Atualiza todos os jogos que referenciam este campeonato
-                                for mes in st.session_state.dados['mensal']:
-                                    df_mes = st.session_state.dados['mensal'][mes]
-                                    df_mes.loc[df_mes['Competição'] == campeonato_selecionado, 'Competição'] = novo_nome
-
-                                salvar_dados()
+                                # Atualiza o campeonato e todos os jogos que o referenciam
+                                registrar({
+                                    'entidade': 'campeonato', 'acao': 'atualizar', 'indice': idx,
+                                    'registro': {'Nome': novo_nome, 'Temporada': nova_temporada}
+                                })
                                 st.success("Campeonato atualizado com sucesso!")
                                 st.rerun()
 
                     with col_del:
                         if st.form_submit_button("🗑️ Remover"):
                             # Verifica se o campeonato está sendo usado em algum jogo
-                            em_uso = False
-                            for mes in st.session_state.dados['mensal']:
-                                if campeonato_selecionado in st.session_state.dados['mensal'][mes]['Competição'].values:
-                                    em_uso = True
-                                    break
-
-                            if em_uso:
+                            if jogos_em_uso:
                                 st.warning("Este campeonato está em uso e não pode ser removido!")
                             else:
-                                st.session_state.dados['campeonatos'] = st.session_state.dados['campeonatos'].drop(idx)
-                                salvar_dados()
+                                registrar({'entidade': 'campeonato', 'acao': 'remover', 'indice': idx})
                                 st.success("Campeonato removido com sucesso!")
                                 st.rerun()
             else:
                 st.info("Nenhum campeonato cadastrado para edição")
 
+
+def show_campeonatos():
+    st.title("🏆 Campeonatos")
+
+    gerir_campeonatos()
+
+    mostrar_duplicados('campeonato')
+
     # Seção de estatísticas (mantida igual)
     st.subheader("📋 Estatísticas dos Campeonatos")
     if not st.session_state.dados['campeonatos'].empty:
-        campeonatos_stats = []
-
-        for _, camp in st.session_state.dados['campeonatos'].iterrows():
-            stats = calcular_stats_campeonato(camp['Nome'])
-            campeonatos_stats.append({
-                'Campeonato': camp['Nome'],
-                'Temporada': camp['Temporada'],
-                **stats
-            })
-
-        df_stats = pd.DataFrame(campeonatos_stats)
-
-        # Formatar valores
-        df_stats['total_stake'] = df_stats['total_stake'].apply(format_currency)
-        df_stats['total_profit'] = df_stats['total_profit'].apply(
-            lambda x: format_currency(x).replace('€', '€+') if x >= 0 else format_currency(x)
-        )
-        df_stats['roi'] = df_stats['roi'].apply(format_percent)
+        campeonatos = st.session_state.dados['campeonatos']
+        df_stats = obter_stats_agrupados()['campeonatos'].reindex(campeonatos['Nome'].values, fill_value=0)
+        df_stats = df_stats.reset_index(drop=True)
+        df_stats.insert(0, 'Campeonato', campeonatos['Nome'].values)
+        df_stats.insert(1, 'Temporada', campeonatos['Temporada'].values)
+        df_stats = com_intervalos(df_stats, 'Competição', 'Campeonato')
 
         st.dataframe(
             df_stats,
             column_config={
+                "total_stake": coluna_moeda("total_stake"),
+                "total_profit": coluna_moeda("total_profit", com_sinal=True),
+                "roi": coluna_percentagem("roi"),
+                **colunas_intervalos(),
                 "greens": st.column_config.ProgressColumn(
                     "Greens",
                     format="%d",
@@ -597,17 +669,14 @@ def show_campeonatos():
                 )
             },
             hide_index=True,
-            use_container_width=True
+            width='stretch'
         )
 
         st.subheader("📊 Performance por Campeonato")
         if len(df_stats) > 1:
-            df_plot = df_stats.copy()
-            df_plot['total_profit'] = df_plot['total_profit'].str.replace('€+', '').str.replace('€', '').astype(float)
-            df_plot['roi'] = df_plot['roi'].str.replace('%', '').astype(float)
-
-            fig = px.bar(
-                df_plot.sort_values('total_profit', ascending=False),
+            mostrar_grafico(
+                px.bar,
+                df_stats.sort_values('total_profit', ascending=False),
                 x='Campeonato',
                 y='total_profit',
                 color='roi',
@@ -615,11 +684,159 @@ def show_campeonatos():
                 labels={'total_profit': 'Lucro/Prejuízo (€)'},
                 color_continuous_scale='RdYlGn'
             )
-            st.plotly_chart(fig, use_container_width=True)
+            mostrar_intervalos(df_stats, 'Campeonato', 'roi', "ROI com Intervalo de Confiança")
     else:
         st.info("Nenhum campeonato cadastrado ainda.")
 
 
+@st.fragment
+def gerir_estrategias():
+    """Formulários de adicionar e editar estratégias"""
+    col_add, col_edit = st.columns(2)
+
+    # Formulário para adicionar nova estratégia (inicia fechado)
+    with col_add:
+        with st.expander("➕ Adicionar Nova Estratégia", expanded=False):
+            with st.form("nova_estrategia_form", clear_on_submit=True):
+                new_name = st.text_input("Nome da Estratégia*", key="new_strat_name")
+                new_desc = st.text_area("Descrição", key="new_strat_desc")
+
+                if st.form_submit_button("Adicionar Estratégia"):
+                    if not new_name:
+                        st.error("O nome da estratégia é obrigatório!")
+                    elif registo_entidade(st.session_state.dados, 'estrategia').procurar(new_name):
+                        st.warning(f"Esta estratégia já existe ({nome_canonico('estrategia', new_name)})!")
+                    else:
+                        registrar({'entidade': 'estrategia', 'acao': 'adicionar', 'registro': {
+                            'Nome': new_name,
+                            'Descrição': new_desc,
+                            'Equipa': '',
+                            'Tags': ''
+                        }})
+                        st.success("Estratégia adicionada com sucesso!")
+                        st.rerun()
+
+    # Formulário para editar/remover estratégias (inicia fechado)
+    with col_edit:
+        with st.expander("✏️ Editar/Remover Estratégias", expanded=False):
+            if not st.session_state.dados['estrategias'].empty:
+                estrategia_selecionada = st.selectbox(
+                    "Selecione uma estratégia",
+                    st.session_state.dados['estrategias']['Nome'].tolist(),
+                    key="select_edit_strat"
+                )
+
+                idx = st.session_state.dados['estrategias'][
+                    st.session_state.dados['estrategias']['Nome'] == estrategia_selecionada
+                ].index[0]
+                jogos_em_uso = mostrar_uso('estrategia', estrategia_selecionada)
+
+                with st.form("editar_estrategia_form"):
+                    edit_name = st.text_input(
+                        "Nome",
+                        value=st.session_state.dados['estrategias'].loc[idx, 'Nome'],
+                        key="edit_strat_name"
+                    )
+                    edit_desc = st.text_area(
+                        "Descrição",
+                        value=st.session_state.dados['estrategias'].loc[idx, 'Descrição'],
+                        key="edit_strat_desc"
+                    )
+
+                    col_save, col_del = st.columns(2)
+                    with col_save:
+                        if st.form_submit_button("💾 Salvar"):
+                            if not edit_name:
+                                st.error("O nome não pode ser vazio!")
+                            elif registo_entidade(st.session_state.dados, 'estrategia').outro(
+                                    edit_name, estrategia_selecionada):
+                                st.warning("Já existe uma estratégia com este nome!")
+                            else:
+                                registrar({
+                                    'entidade': 'estrategia', 'acao': 'atualizar', 'indice': idx,
+                                    'registro': {'Nome': edit_name, 'Descrição': edit_desc}
+                                })
+                                st.success("Estratégia atualizada!")
+                                st.rerun()
+
+                    with col_del:
+                        if st.form_submit_button("🗑️ Remover"):
+                            if jogos_em_uso:
+                                st.warning("Esta estratégia está em uso e não pode ser removida!")
+                            else:
+                                registrar({'entidade': 'estrategia', 'acao': 'remover', 'indice': idx})
+                                st.success("Estratégia removida!")
+                                st.rerun()
+            else:
+                st.info("Nenhuma estratégia cadastrada")
+
+
+@st.fragment
+def gerir_tags():
+    """Formulários de adicionar e editar tags"""
+    col_tag_add, col_tag_edit = st.columns(2)
+
+    # Formulário para adicionar nova tag (inicia fechado)
+    with col_tag_add:
+        with st.expander("➕ Adicionar Nova Tag", expanded=False):
+            with st.form("nova_tag_form", clear_on_submit=True):
+                new_tag = st.text_input("Nome da Nova Tag*", key="new_tag_name")
+
+                if st.form_submit_button("Adicionar Tag"):
+                    if not new_tag:
+                        st.error("O nome da tag é obrigatório!")
+                    elif new_tag in st.session_state.dados['tags']:
+                        st.warning("Esta tag já existe!")
+                    else:
+                        registrar({'entidade': 'tag', 'acao': 'adicionar', 'nome': new_tag.strip()})
+                        st.success(f"Tag '{new_tag}' adicionada com sucesso!")
+                        st.rerun()
+
+    # Formulário para editar/remover tags (inicia fechado)
+    with col_tag_edit:
+        with st.expander("✏️ Editar/Remover Tags", expanded=False):
+            if st.session_state.dados['tags']:
+                tag_selecionada = st.selectbox(
+                    "Selecione uma tag",
+                    st.session_state.dados['tags'],
+                    key="select_edit_tag"
+                )
+                jogos_em_uso = mostrar_uso('tag', tag_selecionada)
+
+                with st.form("editar_tag_form"):
+                    edit_tag = st.text_input(
+                        "Novo nome",
+                        value=tag_selecionada,
+                        key="edit_tag_name"
+                    )
+
+                    col_tag_save, col_tag_del = st.columns(2)
+                    with col_tag_save:
+                        if st.form_submit_button("💾 Salvar"):
+                            if not edit_tag:
+                                st.error("O nome não pode ser vazio!")
+                            elif edit_tag in st.session_state.dados['tags'] and edit_tag != tag_selecionada:
+                                st.warning("Esta tag já existe!")
+                            else:
+                                registrar({
+                                    'entidade': 'tag', 'acao': 'atualizar',
+                                    'nome': tag_selecionada, 'novo_nome': edit_tag.strip()
+                                })
+                                st.success("Tag atualizada com sucesso!")
+                                st.rerun()
+
+                    with col_tag_del:
+                        if st.form_submit_button("🗑️ Remover"):
+                            if jogos_em_uso:
+                                st.warning("Esta tag está em uso e não pode ser removida!")
+                            else:
+                                registrar({'entidade': 'tag', 'acao': 'remover', 'nome': tag_selecionada})
+                                st.success(f"Tag '{tag_selecionada}' removida!")
+                                st.rerun()
+            else:
+                st.info("Nenhuma tag cadastrada")
+
+
 def show_estrategias():
     st.title("🧠 Estratégias e Análise de Performance")
 
@@ -634,93 +851,24 @@ def show_estrategias():
     with tab1:
         st.subheader("Gestão de Estratégias")
 
-        col_add, col_edit = st.columns(2)
-
-        # Formulário para adicionar nova estratégia (inicia fechado)
-        with col_add:
-            with st.expander("➕ Adicionar Nova Estratégia", expanded=False):
-                with st.form("nova_estrategia_form", clear_on_submit=True):
-                    new_name = st.text_input("Nome da Estratégia*", key="new_strat_name")
-                    new_desc = st.text_area("Descrição", key="new_strat_desc")
-
-                    if st.form_submit_button("Adicionar Estratégia"):
-                        if not new_name:
-                            st.error("O nome da estratégia é obrigatório!")
-                        elif new_name in st.session_state.dados['estrategias']['Nome'].values:
-                            st.warning("Esta estratégia já existe!")
-                        else:
-                            nova_estrategia = pd.DataFrame([{
-                                'Nome': new_name,
-                                'Descrição': new_desc,
-                                'Equipa': '',
-                                'Tags': ''
-                            }])
-                            st.session_state.dados['estrategias'] = pd.concat(
-                                [st.session_state.dados['estrategias'], nova_estrategia],
-                                ignore_index=True
-                            )
-                            salvar_dados()
-                            st.success("Estratégia adicionada com sucesso!")
-                            st.rerun()
-
-        # Formulário para editar/remover estratégias (inicia fechado)
-        with col_edit:
-            with st.expander("✏️ Editar/Remover Estratégias", expanded=False):
-                if not st.session_state.dados['estrategias'].empty:
-                    estrategia_selecionada = st.selectbox(
-                        "Selecione uma estratégia",
-                        st.session_state.dados['estrategias']['Nome'].tolist(),
-                        key="select_edit_strat"
-                    )
-
-                    idx = st.session_state.dados['estrategias'][
-                        st.session_state.dados['estrategias']['Nome'] == estrategia_selecionada
-                    ].index[0]
-
-                    with st.form("editar_estrategia_form"):
-                        edit_name = st.text_input(
-                            "Nome",
-                            value=st.session_state.dados['estrategias'].loc[idx, 'Nome'],
-                            key="edit_strat_name"
-                        )
-                        edit_desc = st.text_area(
-                            "Descrição",
-                            value=st.session_state.dados['estrategias'].loc[idx, 'Descrição'],
-                            key="edit_strat_desc"
-                        )
-
-                        col_save, col_del = st.columns(2)
-                        with col_save:
-                            if st.form_submit_button("💾 Salvar"):
-                                if not edit_name:
-                                    st.error("O nome não pode ser vazio!")
-                                else:
-                                    st.session_state.dados['estrategias'].loc[idx, 'Nome'] = edit_name
-                                    st.session_state.dados['estrategias'].loc[idx, 'Descrição'] = edit_desc
-                                    salvar_dados()
-                                    st.success("Estratégia atualizada!")
-                                    st.rerun()
-
-                        with col_del:
-                            if st.form_submit_button("🗑️ Remover"):
-                                st.session_state.dados['estrategias'] = st.session_state.dados['estrategias'].drop(idx).reset_index(drop=True)
-                                salvar_dados()
-                                st.success("Estratégia removida!")
-                                st.rerun()
-                else:
-                    st.info("Nenhuma estratégia cadastrada")
+        gerir_estrategias()
 
         # Lista de estratégias
         st.subheader("📋 Lista de Estratégias")
         if not st.session_state.dados['estrategias'].empty:
+            df_lista = st.session_state.dados['estrategias'][['Nome', 'Descrição']].copy()
+            df_lista['Jogos'] = [
+                st.session_state.dados['resumo'].jogos_com('estrategia', nome) for nome in df_lista['Nome']
+            ]
             st.dataframe(
-                st.session_state.dados['estrategias'][['Nome', 'Descrição']],
+                df_lista,
                 column_config={
                     "Nome": "Estratégia",
-                    "Descrição": "Descrição"
+                    "Descrição": "Descrição",
+                    "Jogos": st.column_config.NumberColumn("Usada em (jogos)", format="%d")
                 },
                 hide_index=True,
-                use_container_width=True
+                width='stretch'
             )
         else:
             st.info("Nenhuma estratégia cadastrada ainda.")
@@ -729,64 +877,7 @@ def show_estrategias():
     with tab2:
         st.subheader("🏷️ Gestão de Tags")
 
-        col_tag_add, col_tag_edit = st.columns(2)
-
-        # Formulário para adicionar nova tag (inicia fechado)
-        with col_tag_add:
-            with st.expander("➕ Adicionar Nova Tag", expanded=False):
-                with st.form("nova_tag_form", clear_on_submit=True):
-                    new_tag = st.text_input("Nome da Nova Tag*", key="new_tag_name")
-
-                    if st.form_submit_button("Adicionar Tag"):
-                        if not new_tag:
-                            st.error("O nome da tag é obrigatório!")
-                        elif new_tag in st.session_state.dados['tags']:
-                            st.warning("Esta tag já existe!")
-                        else:
-                            st.session_state.dados['tags'].append(new_tag.strip())
-                            salvar_dados()
-                            st.success(f"Tag '{new_tag}' adicionada com sucesso!")
-                            st.rerun()
-
-        # Formulário para editar/remover tags (inicia fechado)
-        with col_tag_edit:
-            with st.expander("✏️ Editar/Remover Tags", expanded=False):
-                if st.session_state.dados['tags']:
-                    tag_selecionada = st.selectbox(
-                        "Selecione uma tag",
-                        st.session_state.dados['tags'],
-                        key="select_edit_tag"
-                    )
-
-                    with st.form("editar_tag_form"):
-                        edit_tag = st.text_input(
-                            "Novo nome",
-                            value=tag_selecionada,
-                            key="edit_tag_name"
-                        )
-
-                        col_tag_save, col_tag_del = st.columns(2)
-                        with col_tag_save:
-                            if st.form_submit_button("💾 Salvar"):
-                                if not edit_tag:
-                                    st.error("O nome não pode ser vazio!")
-                                elif edit_tag in st.session_state.dados['tags'] and edit_tag != tag_selecionada:
-                                    st.warning("Esta tag já existe!")
-                                else:
-                                    idx = st.session_state.dados['tags'].index(tag_selecionada)
-                                    st.session_state.dados['tags'][idx] = edit_tag.strip()
-                                    salvar_dados()
-                                    st.success("Tag atualizada com sucesso!")
-                                    st.rerun()
-
-                        with col_tag_del:
-                            if st.form_submit_button("🗑️ Remover"):
-                                st.session_state.dados['tags'].remove(tag_selecionada)
-                                salvar_dados()
-                                st.success(f"Tag '{tag_selecionada}' removida!")
-                                st.rerun()
-                else:
-                    st.info("Nenhuma tag cadastrada")
+        gerir_tags()
 
         # Visualização das tags
         st.subheader("📌 Tags Existentes")
@@ -814,36 +905,14 @@ def show_estrategias():
         st.subheader("📈 Desempenho por Estratégia")
 
         if not st.session_state.dados['estrategias'].empty:
-            estrategias_stats = []
-            for estrategia in st.session_state.dados['estrategias']['Nome'].unique():
-                total_profit = 0
-                total_stake = 0
-                greens = 0
-                reds = 0
-
-                for mes in st.session_state.dados['mensal'].values():
-                    if not mes.empty and 'Estrategia' in mes.columns:
-                        jogos_estrategia = mes[mes['Estrategia'] == estrategia]
-                        if not jogos_estrategia.empty:
-                            total_profit += float(jogos_estrategia['Profit/Loss'].sum())
-                            total_stake += float(jogos_estrategia['Stake'].sum())
-                            greens += int(len(jogos_estrategia[jogos_estrategia['Profit/Loss'] >= 0]))
-                            reds += int(len(jogos_estrategia[jogos_estrategia['Profit/Loss'] < 0]))
-
-                roi = (total_profit / total_stake * 100) if total_stake != 0 else 0
-                estrategias_stats.append({
-                    'Estratégia': estrategia,
-                    'Profit Total': total_profit,
-                    'Stake Total': total_stake,
-                    'ROI (%)': float(roi),
-                    'Greens': greens,
-                    'Reds': reds
-                })
-
-            if estrategias_stats:
-                df_estrategias = pd.DataFrame(estrategias_stats)
-
-                fig1 = px.bar(
+            df_estrategias = calcular_stats_por('Estrategia', st.session_state.dados['estrategias']['Nome'])
+            df_estrategias = df_estrategias.rename_axis('Estratégia').reset_index()
+            df_estrategias = com_intervalos(df_estrategias, 'Estrategia', 'Estratégia')
+
+            if not df_estrategias.empty:
+
+                mostrar_grafico(
+                    px.bar,
                     df_estrategias.sort_values('Profit Total', ascending=False),
                     x='Estratégia',
                     y='Profit Total',
@@ -851,21 +920,18 @@ def show_estrategias():
                     title="Lucro/Prejuízo por Estratégia",
                     color_continuous_scale='RdYlGn'
                 )
-                st.plotly_chart(fig1, use_container_width=True)
+                mostrar_intervalos(df_estrategias, 'Estratégia', 'ROI (%)', "ROI com Intervalo de Confiança")
 
                 st.subheader("📊 Estatísticas Detalhadas")
 
-                df_display = df_estrategias.copy()
-                df_display['Profit Total'] = df_display['Profit Total'].apply(
-                    lambda x: f"€{x:+.2f}".replace('€+', '€+') if x >= 0 else f"€{x:.2f}"
-                )
-                df_display['Stake Total'] = df_display['Stake Total'].apply(lambda x: f"€{x:.2f}")
-                df_display['ROI (%)'] = df_display['ROI (%)'].apply(lambda x: f"{x:.2f}%")
-
                 max_total = int((df_estrategias['Greens'] + df_estrategias['Reds']).max())
                 st.dataframe(
-                    df_display,
+                    df_estrategias,
                     column_config={
+                        "Profit Total": coluna_moeda("Profit Total", com_sinal=True),
+                        "Stake Total": coluna_moeda("Stake Total"),
+                        "ROI (%)": coluna_percentagem("ROI (%)"),
+                        **colunas_intervalos(),
                         "Greens": st.column_config.ProgressColumn(
                             "Greens",
                             format="%d",
@@ -889,36 +955,13 @@ def show_estrategias():
         st.subheader("🏷️ Desempenho por Tag")
 
         if st.session_state.dados['tags']:
-            tags_stats = []
-            for tag in st.session_state.dados['tags']:
-                total_profit = 0
-                total_stake = 0
-                greens = 0
-                reds = 0
-
-                for mes in st.session_state.dados['mensal'].values():
-                    if not mes.empty and 'Tag' in mes.columns:
-                        jogos_tag = mes[mes['Tag'] == tag]
-                        if not jogos_tag.empty:
-                            total_profit += float(jogos_tag['Profit/Loss'].sum())
-                            total_stake += float(jogos_tag['Stake'].sum())
-                            greens += int(len(jogos_tag[jogos_tag['Profit/Loss'] >= 0]))
-                            reds += int(len(jogos_tag[jogos_tag['Profit/Loss'] < 0]))
-
-                roi = (total_profit / total_stake * 100) if total_stake != 0 else 0
-                tags_stats.append({
-                    'Tag': tag,
-                    'Profit Total': total_profit,
-                    'Stake Total': total_stake,
-                    'ROI (%)': float(roi),
-                    'Greens': greens,
-                    'Reds': reds
-                })
-
-            if tags_stats:
-                df_tags = pd.DataFrame(tags_stats)
-
-                fig1 = px.bar(
+            df_tags = calcular_stats_por('Tag', st.session_state.dados['tags'])
+            df_tags = com_intervalos(df_tags.rename_axis('Tag').reset_index(), 'Tag', 'Tag')
+
+            if not df_tags.empty:
+
+                mostrar_grafico(
+                    px.bar,
                     df_tags.sort_values('Profit Total', ascending=False),
                     x='Tag',
                     y='Profit Total',
@@ -926,21 +969,18 @@ def show_estrategias():
                     title="Lucro/Prejuízo por Tag",
                     color_continuous_scale='RdYlGn'
                 )
-                st.plotly_chart(fig1, use_container_width=True)
+                mostrar_intervalos(df_tags, 'Tag', 'ROI (%)', "ROI com Intervalo de Confiança")
 
                 st.subheader("📊 Estatísticas Detalhadas")
 
-                df_display = df_tags.copy()
-                df_display['Profit Total'] = df_display['Profit Total'].apply(
-                    lambda x: f"€{x:+.2f}".replace('€+', '€+') if x >= 0 else f"€{x:.2f}"
-                )
-                df_display['Stake Total'] = df_display['Stake Total'].apply(lambda x: f"€{x:.2f}")
-                df_display['ROI (%)'] = df_display['ROI (%)'].apply(lambda x: f"{x:.2f}%")
-
                 max_total = int((df_tags['Greens'] + df_tags['Reds']).max())
                 st.dataframe(
-                    df_display,
+                    df_tags,
                     column_config={
+                        "Profit Total": coluna_moeda("Profit Total", com_sinal=True),
+                        "Stake Total": coluna_moeda("Stake Total"),
+                        "ROI (%)": coluna_percentagem("ROI (%)"),
+                        **colunas_intervalos(),
                         "Greens": st.column_config.ProgressColumn(
                             "Greens",
                             format="%d",
@@ -960,16 +1000,99 @@ def show_estrategias():
             st.warning("Nenhum dado disponível para análise. Registre jogos com tags primeiro.")
 
 
-def show_mes(mes):
-    st.title(f"🗓️ {mes}")
+def show_risco():
+    st.title("📉 Análise de Risco")
+    banca_inicial = st.number_input(
+        "Banca inicial (€)", min_value=0.0, value=float(st.session_state.get('banca_inicial', 0.0)),
+        step=50.0, format="%.2f", help="Com banca inicial o drawdown também é mostrado em % do pico"
+    )
+    st.session_state.banca_inicial = banca_inicial
+
+    curva, metricas = obter_analise_risco(None, banca_inicial)
+    if metricas.empty:
+        st.info("Nenhum jogo registrado no período selecionado.")
+        return
+
+    total = metricas.iloc[0]
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Banca atual", format_currency(banca_inicial + total['Profit/Loss']),
+                  delta=format_profit(total['Profit/Loss']))
+    with col2:
+        # A percentagem só existe com banca inicial; sem drawdown não há delta
+        delta_drawdown = None
+        if banca_inicial > 0 and total['Max Drawdown'] > 0:
+            delta_drawdown = format_percent(-total['Max Drawdown (%)'])
+        st.metric("Max Drawdown", format_currency(total['Max Drawdown']), delta=delta_drawdown)
+    with col3:
+        st.metric("Duração Max Drawdown", f"{int(total['Duração Max DD (dias)'])} dias")
+    with col4:
+        st.metric(
+            "Maior série",
+            f"{int(total['Maior Série Green'])} G / {int(total['Maior Série Red'])} R"
+        )
+    col5, col6 = st.columns(2)
+    for coluna, janela in zip((col5, col6), JANELAS_ROI):
+        with coluna:
+            st.metric(f"ROI últimos {janela} dias", format_percent(total[f'ROI {janela}d (%)']))
+
+    # Curvas de um grupo (ou do total) escolhido na tabela por grupo
+    st.subheader("📊 Por grupo")
+    rotulo = st.selectbox("Agrupar por", list(GRUPOS_RISCO))
+    curva_grupos, tabela = obter_analise_risco(GRUPOS_RISCO[rotulo], banca_inicial)
+    tabela = tabela.sort_values('Profit/Loss', ascending=False)
+    st.dataframe(
+        tabela.rename_axis(rotulo).reset_index(),
+        column_config={
+            'Stake Total': coluna_moeda('Stake Total'),
+            'Profit/Loss': coluna_moeda('Profit/Loss', com_sinal=True),
+            'ROI (%)': coluna_percentagem('ROI (%)'),
+            'Max Drawdown': coluna_moeda('Max Drawdown'),
+            'Max Drawdown (%)': coluna_percentagem('Max Drawdown (%)'),
+            **{f'ROI {janela}d (%)': coluna_percentagem(f'ROI {janela}d (%)') for janela in JANELAS_ROI},
+        },
+        hide_index=True,
+        width='stretch'
+    )
+
+    escolhido = st.selectbox("Curva de", ["Total"] + list(tabela.index))
+    if escolhido != "Total":
+        curva = curva_grupos[curva_grupos['Grupo'] == escolhido]
+
+    tab1, tab2, tab3 = st.tabs(["💰 Banca", "📉 Drawdown", "🔁 ROI móvel"])
+    with tab1:
+        mostrar_grafico(
+            px.line,
+            curva, x='Data', y=['Banca', 'Pico'],
+            title=f"Evolução da Banca · {escolhido}",
+            labels={'value': 'Banca (€)', 'variable': ''}
+        )
+    with tab2:
+        mostrar_grafico(
+            px.area,
+            curva, x='Data', y='Drawdown',
+            title=f"Drawdown · {escolhido}",
+            labels={'Drawdown': 'Drawdown (€)'}
+        )
+    with tab3:
+        mostrar_grafico(
+            px.line,
+            curva, x='Data', y=[f'ROI {janela}d (%)' for janela in JANELAS_ROI],
+            title=f"ROI Móvel · {escolhido}",
+            labels={'value': 'ROI (%)', 'variable': ''}
+        )
+
 
+@st.fragment
+def registar_jogos_dia(mes, data_sugerida):
+    """Grelha de registo dos jogos do dia"""
     # Seção para adicionar jogos do dia (inicia fechada)
     with st.expander("➕ Adicionar Jogos do Dia", expanded=False):
         with st.form(f"form_jogos_dia_{mes}"):
             st.subheader("📅 Registrar Jogos do Dia")
 
             # Selecionar data
-            data = st.date_input("Data*", value=datetime.now())
+            data = st.date_input("Data*", value=data_sugerida)
 
             # Selecionar competição (com opção de adicionar nova)
             col1, col2 = st.columns([4, 1])
@@ -997,6 +1120,9 @@ def show_mes(mes):
                     index=0,
                     disabled=st.session_state.dados['estrategias'].empty
                 )
+                # Sem estratégias cadastradas o lote é recusado em vez de registar o texto de aviso
+                if st.session_state.dados['estrategias'].empty:
+                    estrategia = ''
                 stake_padrao = st.number_input(
                     "Stake Padrão (€)",
                     min_value=0.01,
@@ -1018,117 +1144,140 @@ def show_mes(mes):
                     step=1
                 )
 
-            # Adicionar múltiplos jogos
+            # Uma só grelha para todos os jogos: aceita colar várias linhas de uma folha de cálculo
             st.subheader("Jogos do Dia")
-            num_jogos = st.number_input("Quantidade de Jogos", min_value=1, max_value=50, value=1)
-
-            jogos = []
-            for i in range(num_jogos):
-                st.markdown(f"### Jogo {i + 1}")
-                col_jogo1, col_jogo2 = st.columns(2)
-                with col_jogo1:
-                    casa = st.text_input(f"Equipa Casa {i + 1}", key=f"casa_{i}")
-                with col_jogo2:
-                    visitante = st.text_input(f"Equipa Visitante {i + 1}", key=f"visitante_{i}")
-
-                col_res1, col_res2 = st.columns(2)
-                with col_res1:
-                    stake = st.number_input(
-                        f"Stake {i + 1} (€)",
-                        min_value=0.01,
-                        value=stake_padrao,
-                        step=0.5,
-                        format="%.2f",
-                        key=f"stake_{i}"
-                    )
-                with col_res2:
-                    profit_loss = st.number_input(
-                        f"Profit/Loss {i + 1} (€)",
-                        value=0.0,
-                        step=0.5,
-                        format="%.2f",
-                        key=f"profit_{i}"
-                    )
-
-                jogos.append({
-                    'Data': data,
-                    'Competição': competicao,
-                    'Casa': casa,
-                    'Visitante': visitante,
-                    'Estrategia': estrategia,
-                    'Tag': tag,
-                    'Stake': stake,
-                    'Profit/Loss': profit_loss,
-                    '% Stake': (profit_loss / stake * 100) if stake != 0 else 0
-                })
+            st.caption("Stake vazio usa o Stake Padrão; linhas sem equipas são ignoradas.")
+            # A versão na chave recria a grelha vazia depois de salvar ou limpar
+            chave_grelha = f"grelha_jogos_{mes}_{st.session_state.get('versao_grelha', 0)}"
+            grelha = st.data_editor(
+                pd.DataFrame({
+                    'Casa': pd.Series([None] * LINHAS_GRELHA, dtype=object),
+                    'Visitante': pd.Series([None] * LINHAS_GRELHA, dtype=object),
+                    'Stake': pd.Series([np.nan] * LINHAS_GRELHA, dtype='float64'),
+                    'Profit/Loss': pd.Series([np.nan] * LINHAS_GRELHA, dtype='float64')
+                }),
+                column_config={
+                    'Casa': st.column_config.TextColumn('Equipa Casa'),
+                    'Visitante': st.column_config.TextColumn('Equipa Visitante'),
+                    'Stake': st.column_config.NumberColumn('Stake (€)', min_value=0.01, step=0.5, format="%.2f"),
+                    'Profit/Loss': st.column_config.NumberColumn('Profit/Loss (€)', step=0.5, format="%.2f")
+                },
+                num_rows="dynamic",
+                hide_index=True,
+                width='stretch',
+                key=chave_grelha
+            )
 
             # Botões de ação
             col_btn1, col_btn2 = st.columns(2)
             with col_btn1:
                 if st.form_submit_button("💾 Salvar Todos os Jogos"):
                     if competicao and data:
-                        for jogo in jogos:
-                            if jogo['Casa'] and jogo['Visitante']:
-                                adicionar_equipa_se_nao_existir(jogo['Casa'])
-                                adicionar_equipa_se_nao_existir(jogo['Visitante'])
-                                novo_jogo = pd.DataFrame([jogo])
-
-                                if st.session_state.dados['mensal'][mes].empty:
-                                    st.session_state.dados['mensal'][mes] = novo_jogo
-                                else:
-                                    st.session_state.dados['mensal'][mes] = pd.concat(
-                                        [st.session_state.dados['mensal'][mes], novo_jogo],
-                                        ignore_index=True
-                                    )
-
-                        atualizar_campeonatos()
-                        salvar_dados()
-                        st.success(f"{len(jogos)} jogos salvos com sucesso!")
-                        st.rerun()
+                        # Valores comuns do dia e por omissão aplicados à grelha inteira de uma vez
+                        jogos = grelha.assign(
+                            Data=data, Estrategia=estrategia, Tag=tag, **{'Competição': competicao}
+                        )
+                        jogos['Stake'] = jogos['Stake'].fillna(stake_padrao)
+                        jogos['Profit/Loss'] = jogos['Profit/Loss'].fillna(0.0)
+                        inseridos, erros = adicionar_jogos_em_lote(jogos)
+                        if erros:
+                            for erro in erros:
+                                st.error(erro)
+                        else:
+                            st.session_state.versao_grelha = st.session_state.get('versao_grelha', 0) + 1
+                            st.success(f"{inseridos} jogos salvos com sucesso!")
+                            st.rerun()
                     else:
                         st.error("Data e Competição são obrigatórios!")
 
             with col_btn2:
                 if st.form_submit_button("🔄 Limpar Campos"):
+                    st.session_state.versao_grelha = st.session_state.get('versao_grelha', 0) + 1
                     st.rerun()
 
+
+@st.fragment
+def editar_jogos_mes(mes, jogos_mes):
+    """Procura, edição e remoção dos jogos do mês"""
     # Seção para edição/remoção individual de jogos (inicia fechada)
     with st.expander("✏️ Editar/Remover Jogos Existentes", expanded=False):
-        if not st.session_state.dados['mensal'][mes].empty:
-            jogos_mes = st.session_state.dados['mensal'][mes]
-            options = ["Selecione um jogo"] + [
-                f"{row['Data'].strftime('%d/%m')} - {row['Competição']}: {row['Casa']} vs {row['Visitante']} ({format_currency(row['Profit/Loss'])})"
-                for _, row in jogos_mes.iterrows()
-            ]
+        if not jogos_mes.empty:
+            col_procura, col_datas = st.columns([3, 2])
+            with col_procura:
+                procura = st.text_input(
+                    "Procurar (equipa, competição ou estratégia)",
+                    key=f"procura_jogo_{mes}"
+                )
+            with col_datas:
+                primeira, ultima = jogos_mes['Data'].min().date(), jogos_mes['Data'].max().date()
+                datas = st.date_input(
+                    "Intervalo de datas",
+                    value=(primeira, ultima),
+                    min_value=primeira,
+                    max_value=ultima,
+                    key=f"datas_jogo_{mes}"
+                )
 
-            jogo_para_editar = st.selectbox(
+            # Enquanto só a primeira data do intervalo está escolhida não se filtra por data
+            encontrados = filtrar_jogos(jogos_mes, procura, datas if len(datas) == 2 else None)
+            paginas = max(1, -(-len(encontrados) // JOGOS_POR_PAGINA))
+            pagina = 1
+            if paginas > 1:
+                chave_pagina = f"pagina_jogo_{mes}"
+                if st.session_state.get(chave_pagina, 1) > paginas:
+                    st.session_state[chave_pagina] = paginas
+                pagina = st.number_input(
+                    f"Página (de {paginas})",
+                    min_value=1,
+                    max_value=paginas,
+                    key=chave_pagina
+                )
+            st.caption(f"{len(encontrados)} jogo(s) encontrado(s)")
+
+            # Só os jogos da página são formatados; a opção escolhida é o ID do jogo
+            visiveis = encontrados.iloc[(pagina - 1) * JOGOS_POR_PAGINA:pagina * JOGOS_POR_PAGINA]
+            rotulos = {
+                id_jogo: f"{dia} - {competicao}: {casa} vs {visitante} ({format_currency(profit)})"
+                for id_jogo, dia, competicao, casa, visitante, profit in zip(
+                    visiveis.index, visiveis['Data'].dt.strftime('%d/%m'), visiveis['Competição'],
+                    visiveis['Casa'], visiveis['Visitante'], visiveis['Profit/Loss'])
+            }
+
+            id_jogo = st.selectbox(
                 "Selecionar jogo para editar",
-                options=options,
+                options=[None] + list(rotulos),
+                format_func=lambda opcao: "Selecione um jogo" if opcao is None else rotulos[opcao],
                 index=0
             )
 
-            if jogo_para_editar != "Selecione um jogo":
-                edit_index = options.index(jogo_para_editar) - 1
-                jogo_data = jogos_mes.iloc[edit_index]
+            if id_jogo is not None:
+                jogo_data = jogos_mes.loc[id_jogo]
 
-                with st.form(f"form_editar_jogo_{mes}_{edit_index}"):
+                with st.form(f"form_editar_jogo_{mes}_{id_jogo}"):
                     col1, col2 = st.columns(2)
                     with col1:
-                        data = st.date_input("Data", value=jogo_data['Data'])
+                        data = st.date_input("Data", value=jogo_data['Data'].date())
                         competicao = st.text_input("Competição*", value=jogo_data['Competição']).strip()
+                        competicao = nome_canonico('campeonato', competicao)
                         casa = st.text_input("Equipa Casa*", value=jogo_data['Casa']).strip()
+                        casa = nome_canonico('equipa', casa)
                         visitante = st.text_input("Equipa Visitante*", value=jogo_data['Visitante']).strip()
+                        visitante = nome_canonico('equipa', visitante)
 
                     with col2:
+                        # Um nome que já não está registado começa na primeira opção
+                        estrategias = st.session_state.dados['estrategias']['Nome'].tolist()
                         estrategia = st.selectbox(
                             "Estratégia",
-                            options=st.session_state.dados['estrategias']['Nome'].tolist(),
-                            index=st.session_state.dados['estrategias']['Nome'].tolist().index(jogo_data['Estrategia'])
+                            options=estrategias,
+                            index=(estrategias.index(jogo_data['Estrategia'])
+                                   if jogo_data['Estrategia'] in estrategias else 0)
                         )
+                        tags = st.session_state.dados['tags']
                         tag = st.selectbox(
                             "Tag",
-                            options=st.session_state.dados['tags'],
-                            index=st.session_state.dados['tags'].index(jogo_data['Tag'])
+                            options=tags,
+                            index=tags.index(jogo_data['Tag']) if jogo_data['Tag'] in tags else 0
                         )
                         stake = st.number_input(
                             "Stake (€)",
@@ -1147,47 +1296,75 @@ def show_mes(mes):
                     col_botoes = st.columns(3)
                     with col_botoes[0]:
                         if st.form_submit_button("💾 Atualizar Jogo"):
-                            st.session_state.dados['mensal'][mes].at[edit_index, 'Data'] = data
-                            st.session_state.dados['mensal'][mes].at[edit_index, 'Competição'] = competicao
-                            st.session_state.dados['mensal'][mes].at[edit_index, 'Casa'] = casa
-                            st.session_state.dados['mensal'][mes].at[edit_index, 'Visitante'] = visitante
-                            st.session_state.dados['mensal'][mes].at[edit_index, 'Estrategia'] = estrategia
-                            st.session_state.dados['mensal'][mes].at[edit_index, 'Tag'] = tag
-                            st.session_state.dados['mensal'][mes].at[edit_index, 'Stake'] = stake
-                            st.session_state.dados['mensal'][mes].at[edit_index, 'Profit/Loss'] = profit_loss
-                            st.session_state.dados['mensal'][mes].at[edit_index, '% Stake'] = (
-                                        profit_loss / stake * 100) if stake != 0 else 0
-
-                            salvar_dados()
+                            # Competição e equipas escritas à mão ficam registadas, como ao adicionar
+                            competicao = adicionar_campeonato_se_nao_existir(competicao)
+                            casa = adicionar_equipa_se_nao_existir(casa)
+                            visitante = adicionar_equipa_se_nao_existir(visitante)
+                            registrar({
+                                'entidade': 'jogo', 'acao': 'atualizar',
+                                'id': id_jogo,
+                                'jogo': {
+                                    'Data': data,
+                                    'Competição': competicao,
+                                    'Casa': casa,
+                                    'Visitante': visitante,
+                                    'Estrategia': estrategia,
+                                    'Tag': tag,
+                                    'Stake': stake,
+                                    'Profit/Loss': profit_loss,
+                                    '% Stake': (profit_loss / stake * 100) if stake != 0 else 0
+                                }
+                            })
                             st.success("Jogo atualizado com sucesso!")
                             st.rerun()
 
                     with col_botoes[1]:
                         if st.form_submit_button("🗑️ Remover Jogo"):
-                            st.session_state.dados['mensal'][mes] = st.session_state.dados['mensal'][mes].drop(
-                                jogos_mes.index[edit_index])
-                            salvar_dados()
+                            registrar({
+                                'entidade': 'jogo', 'acao': 'remover',
+                                'id': id_jogo
+                            })
                             st.success("Jogo removido com sucesso!")
                             st.rerun()
         else:
             st.info("Nenhum jogo registrado para edição")
 
+
+def show_mes(mes):
+    inicio, fim = periodo_selecionado()
+    if inicio is not None:
+        st.title(f"🗓️ {mes} · {st.session_state.get('periodo_rotulo', '')}")
+    else:
+        st.title(f"🗓️ {mes}")
+    jogos_mes = st.session_state.dados['jogos'].mes(mes, inicio, fim)
+
+    # O mês de cada jogo vem da data; por omissão sugere-se uma data deste mês dentro do período
+    hoje = datetime.now().date()
+    numero = MESES.index(mes) + 1
+    if inicio is None:
+        data_sugerida = hoje if hoje.month == numero else date(hoje.year, numero, 1)
+    else:
+        data_sugerida = date(inicio.year + (numero < inicio.month), numero, 1)
+        if (data_sugerida.year, data_sugerida.month) == (hoje.year, hoje.month):
+            data_sugerida = hoje
+
+    # Os formulários são fragmentos: mexer neles só repete o fragmento, sem voltar a desenhar
+    # as tabelas e os gráficos
+    registar_jogos_dia(mes, data_sugerida)
+
+    editar_jogos_mes(mes, jogos_mes)
+
     # Visualização dos jogos e estatísticas
     st.subheader(f"📅 Jogos de {mes}")
-    if not st.session_state.dados['mensal'][mes].empty:
-        df_mes = st.session_state.dados['mensal'][mes].copy()
-
-        # Formatar valores para exibição
-        df_display = df_mes.copy()
-        df_display['Stake'] = df_display['Stake'].apply(format_currency)
-        df_display['Profit/Loss'] = df_display['Profit/Loss'].apply(
-            lambda x: format_currency(x).replace('€', '€+') if x >= 0 else format_currency(x)
-        )
-        df_display['% Stake'] = df_display['% Stake'].apply(format_percent)
+    if not jogos_mes.empty:
+        df_mes = jogos_mes.copy()
 
         st.dataframe(
-            df_display,
+            df_mes,
             column_config={
+                'Data': st.column_config.DateColumn('Data', format='DD/MM/YYYY'),
+                'Stake': coluna_moeda('Stake'),
+                'Profit/Loss': coluna_moeda('Profit/Loss', com_sinal=True),
                 '% Stake': st.column_config.ProgressColumn(
                     '% Stake',
                     format='%.2f%%',
@@ -1196,29 +1373,19 @@ def show_mes(mes):
                 )
             },
             hide_index=True,
-            use_container_width=True
+            width='stretch'
         )
 
         # Estatísticas de performance
         st.subheader(f"📊 Estatísticas de Performance - {mes}")
 
-        # Converter a coluna Data para datetime se ainda não for
-        if not pd.api.types.is_datetime64_any_dtype(df_mes['Data']):
-            df_mes['Data'] = pd.to_datetime(df_mes['Data'])
-
         # Calcular estatísticas consolidadas
-        dias_trabalhados = df_mes['Data'].nunique()
-        daily_results = df_mes.groupby('Data')['Profit/Loss'].sum().reset_index()
-        dias_green = len(daily_results[daily_results['Profit/Loss'] >= 0])
-        dias_red = dias_trabalhados - dias_green
-
-        mercados_totais = len(df_mes)
-        mercados_green = len(df_mes[df_mes['Profit/Loss'] >= 0])
-        mercados_red = mercados_totais - mercados_green
-
-        total_stake = df_mes['Stake'].sum()
-        total_profit = df_mes['Profit/Loss'].sum()
-        roi = (total_profit / total_stake * 100) if total_stake != 0 else 0
+        metricas = metricas_jogos(df_mes)
+        dias_trabalhados, dias_green, dias_red = metricas['dias'], metricas['dias_green'], metricas['dias_red']
+        mercados_totais, mercados_green, mercados_red = (
+            metricas['mercados'], metricas['mercados_green'], metricas['mercados_red']
+        )
+        total_stake, total_profit, roi = metricas['stake'], metricas['profit'], metricas['roi']
 
         # Layout das métricas
         col1, col2, col3 = st.columns(3)
@@ -1228,9 +1395,7 @@ def show_mes(mes):
             st.metric("📅 Dias Trabalhados", dias_trabalhados)
 
         with col2:
-            st.metric("💸 Profit/Loss Total",
-                      format_currency(total_profit).replace('€', '€+') if total_profit >= 0 else format_currency(
-                          total_profit))
+            st.metric("💸 Profit/Loss Total", format_profit(total_profit))
             st.metric("✅ Dias Green", dias_green,
                       delta=f"{dias_green / dias_trabalhados * 100:.1f}%" if dias_trabalhados > 0 else "0%")
 
@@ -1262,13 +1427,10 @@ def show_mes(mes):
 
         with tab1:
             # Gráfico de evolução diária
-            daily_stats = df_mes.groupby('Data').agg({
-                'Profit/Loss': 'sum',
-                'Stake': 'sum'
-            }).reset_index()
-            daily_stats['ROI'] = (daily_stats['Profit/Loss'] / daily_stats['Stake']) * 100
+            daily_stats = resultados_por(df_mes, 'Data')
 
-            fig1 = px.line(
+            mostrar_grafico(
+                px.line,
                 daily_stats,
                 x='Data',
                 y='Profit/Loss',
@@ -1276,27 +1438,23 @@ def show_mes(mes):
                 labels={'Profit/Loss': 'Lucro/Prejuízo (€)', 'Data': 'Data'},
                 markers=True
             )
-            st.plotly_chart(fig1, use_container_width=True)
 
             # Gráfico de barras para stake diário
-            fig2 = px.bar(
+            mostrar_grafico(
+                px.bar,
                 daily_stats,
                 x='Data',
                 y='Stake',
                 title="Stake por Dia",
                 labels={'Stake': 'Stake (€)', 'Data': 'Data'}
             )
-            st.plotly_chart(fig2, use_container_width=True)
 
         with tab2:
             # Performance por estratégia
-            estrategia_stats = df_mes.groupby('Estrategia').agg({
-                'Profit/Loss': 'sum',
-                'Stake': 'sum'
-            }).reset_index()
-            estrategia_stats['ROI'] = (estrategia_stats['Profit/Loss'] / estrategia_stats['Stake']) * 100
+            estrategia_stats = resultados_por(df_mes, 'Estrategia')
 
-            fig3 = px.bar(
+            mostrar_grafico(
+                px.bar,
                 estrategia_stats,
                 x='Estrategia',
                 y='Profit/Loss',
@@ -1305,16 +1463,195 @@ def show_mes(mes):
                 labels={'Profit/Loss': 'Lucro/Prejuízo (€)', 'Estrategia': 'Estratégia'},
                 color_continuous_scale='RdYlGn'
             )
-            st.plotly_chart(fig3, use_container_width=True)
 
     else:
         st.info(f"Nenhum jogo registrado em {mes}")
 
 
+def show_importar():
+    st.title("📥 Importar Extrato")
+    st.caption(
+        "Importa as apostas de um extrato CSV ou XLSX da casa de apostas ou exchange. "
+        "O arquivo é lido em blocos e todos os jogos são gravados de uma só vez; "
+        "jogos já registados são ignorados."
+    )
+
+    arquivo = st.file_uploader("Extrato (CSV ou XLSX)", type=['csv', 'txt', 'xlsx', 'xlsm'])
+    caminho = st.text_input("...ou caminho de um arquivo local", key="caminho_extrato").strip()
+    if arquivo is not None:
+        origem, nome = arquivo, arquivo.name
+    elif caminho:
+        if not os.path.isfile(caminho):
+            st.error("Arquivo não encontrado!")
+            return
+        origem, nome = caminho, caminho
+    else:
+        st.info("Escolha um arquivo para importar.")
+        return
+
+    guardado = carregar_mapeamento()
+    col_sep, col_dec, col_dia = st.columns(3)
+    separadores = {",": ",", ";": ";", "Tab": "\t"}
+    decimais = {"Ponto (1.50)": ".", "Vírgula (1,50)": ","}
+    with col_sep:
+        rotulo_sep = st.selectbox(
+            "Separador de colunas", list(separadores), disabled=e_excel(nome),
+            index=list(separadores.values()).index(guardado.get('separador', ','))
+        )
+    with col_dec:
+        rotulo_dec = st.selectbox(
+            "Separador decimal", list(decimais), disabled=e_excel(nome),
+            index=list(decimais.values()).index(guardado.get('decimal', '.'))
+        )
+    with col_dia:
+        dia_primeiro = st.checkbox(
+            "Datas com o dia primeiro (31/12)",
+            value=guardado.get('dia_primeiro', True)
+        )
+    separador, decimal = separadores[rotulo_sep], decimais[rotulo_dec]
+
+    try:
+        colunas_arquivo = colunas_extrato(origem, nome, separador)
+    except Exception as e:
+        st.error(f"Não foi possível ler o arquivo: {str(e)}")
+        return
+
+    # Cada campo começa na coluna guardada da última importação, ou numa com nome reconhecido;
+    # as chaves mudam com as colunas para um novo arquivo (ou separador) voltar às sugestões
+    st.subheader("🔀 Colunas")
+    colunas = {}
+    opcoes = [None] + colunas_arquivo
+    assinatura = hash(tuple(colunas_arquivo))
+    grelha = st.columns(3)
+    for i, campo in enumerate(CAMPOS_IMPORTACAO):
+        anterior = guardado.get('colunas', {}).get(campo)
+        sugerida = anterior if anterior in colunas_arquivo else sugerir_coluna(campo, colunas_arquivo)
+        with grelha[i % 3]:
+            colunas[campo] = st.selectbox(
+                campo, opcoes, index=opcoes.index(sugerida),
+                format_func=lambda opcao: "(nenhuma)" if opcao is None else opcao,
+                key=f"importar_coluna_{campo}_{assinatura}"
+            )
+
+    st.subheader("📌 Valores fixos")
+    st.caption("Usados quando o campo não tem coluna ou a célula está vazia.")
+    fixos_guardados = guardado.get('fixos', {})
+    col_comp, col_estr, col_tag = st.columns(3)
+    with col_comp:
+        competicao = st.text_input("Competição", value=fixos_guardados.get('Competição', ''))
+    with col_estr:
+        estrategias = [''] + st.session_state.dados['estrategias']['Nome'].tolist()
+        estrategia = st.selectbox(
+            "Estratégia", estrategias,
+            index=(estrategias.index(fixos_guardados['Estrategia'])
+                   if fixos_guardados.get('Estrategia') in estrategias else 0)
+        )
+    with col_tag:
+        tags = st.session_state.dados['tags']
+        tag = st.selectbox(
+            "Tag", tags,
+            index=tags.index(fixos_guardados['Tag']) if fixos_guardados.get('Tag') in tags else 0
+        )
+
+    if st.button("📥 Importar", type="primary"):
+        em_falta = [campo for campo in ('Data', 'Stake', 'Profit/Loss') if not colunas[campo]]
+        if not colunas['Evento'] and not (colunas['Casa'] and colunas['Visitante']):
+            em_falta.append("Casa e Visitante (ou Evento)")
+        if not colunas['Competição'] and not competicao.strip():
+            em_falta.append("Competição (coluna ou valor fixo)")
+        if not colunas['Estrategia'] and not estrategia:
+            em_falta.append("Estratégia (coluna ou valor fixo)")
+        if em_falta:
+            st.error(f"Campos obrigatórios sem coluna: {', '.join(em_falta)}")
+            return
+
+        fixos = {'Competição': competicao.strip(), 'Estrategia': estrategia, 'Tag': tag}
+        guardar_mapeamento({
+            'colunas': colunas, 'fixos': fixos,
+            'separador': separador, 'decimal': decimal, 'dia_primeiro': dia_primeiro
+        })
+        with st.spinner("A importar..."):
+            try:
+                extrato = ler_extrato(origem, nome, separador, decimal)
+                operacoes, importados, repetidos, invalidos, erros = operacoes_extrato(
+                    st.session_state.dados, extrato, colunas, fixos, dia_primeiro
+                )
+                registrar(*operacoes)
+            except Exception as e:
+                st.error(f"Erro ao importar: {str(e)}")
+                return
+
+        st.success(f"{importados} jogos importados!")
+        if repetidos:
+            st.info(f"{repetidos} jogos ignorados por já estarem registados ou repetidos no extrato.")
+        if invalidos:
+            st.warning(f"{invalidos} linhas inválidas ou vazias não foram importadas.")
+            for erro in erros[:5]:
+                st.caption(erro)
+
+
+def show_exportar():
+    st.title("📤 Exportar")
+    inicio, fim = periodo_selecionado()
+    st.caption(
+        f"Exporta os jogos ou as estatísticas do período {st.session_state.get('periodo_rotulo', '')}. "
+        "O arquivo só é gerado ao clicar em descarregar, partição a partição."
+    )
+
+    conteudos = {
+        "Jogos": None,
+        "Estatísticas por equipa": 'equipa',
+        "Estatísticas por campeonato": 'campeonato',
+        "Estatísticas por estratégia": 'estrategia',
+        "Estatísticas por tag": 'tag',
+    }
+    col_conteudo, col_formato = st.columns(2)
+    with col_conteudo:
+        conteudo = st.selectbox("O que exportar", list(conteudos))
+    with col_formato:
+        formato = st.selectbox("Formato", formatos_disponiveis())
+    extensao, mime = FORMATOS_EXPORTACAO[formato]
+
+    dimensao = conteudos[conteudo]
+    if dimensao is None:
+        texto = st.text_input("Filtrar jogos (equipa, competição ou estratégia)", key="filtro_exportacao")
+        # O arquivo é gerado na thread do download: lê uma cópia do ledger tirada agora, que não muda
+        # quando esta sessão lê partições ou altera jogos
+        ledger = st.session_state.dados['jogos'].copia()
+        gerar = lambda: exportar_blocos(
+            blocos_jogos(ledger, inicio, fim, texto), formato, ['ID'] + COLUNAS_JOGO
+        )
+        nome = "jogos"
+    else:
+        tabela = tabela_exportacao(st.session_state.dados, dimensao, inicio, fim)
+        st.caption(f"{len(tabela)} linha(s)")
+        gerar = lambda: exportar_blocos([tabela], formato, list(tabela.columns))
+        nome = f"estatisticas_{dimensao}"
+
+    rotulo = st.session_state.get('periodo_rotulo', 'todos').replace(' ', '_').replace('/', '-')
+    if formato == 'XLSX' and dimensao is None:
+        # Os jogos do período são contados no resumo, sem ler as partições
+        jogos_periodo = st.session_state.dados['resumo'].tabela('mes', inicio, fim)['mercados'].sum()
+        if jogos_periodo > MAX_LINHAS_XLSX:
+            st.warning(
+                f"O XLSX só leva {MAX_LINHAS_XLSX} linhas; se o período tiver mais jogos, exporte em CSV ou Parquet."
+            )
+    st.download_button(
+        "⬇️ Descarregar",
+        data=gerar,
+        file_name=f"{nome}_{rotulo}.{extensao}",
+        mime=mime,
+        on_click='ignore'
+    )
+
+
 def main():
     st.sidebar.title("📊 Menu Navegação")
 
-    pages = ["🏠 Painel", "⚽ Equipas", "🏆 Campeonatos", "🧠 Estratégias"]
+    pages = [
+        "🏠 Painel", "⚽ Equipas", "🏆 Campeonatos", "🧠 Estratégias",
+        "📉 Análise de Risco", "📥 Importar", "📤 Exportar"
+    ]
     months = [
         "🗓️ Janeiro", "🗓️ Fevereiro", "🗓️ Março", "🗓️ Abril",
         "🗓️ Maio", "🗓️ Junho", "🗓️ Julho", "🗓️ Agosto",
@@ -1323,17 +1660,58 @@ def main():
 
     option = st.sidebar.selectbox("Selecione uma página:", pages + months)
 
-    if option == "🏠 Painel":
-        show_painel()
-    elif option == "⚽ Equipas":
-        show_equipas()
-    elif option == "🏆 Campeonatos":
-        show_campeonatos()
-    elif option == "🧠 Estratégias":
-        show_estrategias()
-    elif option in months:
-        show_mes(option.split(" ")[1])
+    # Período analisado: os agregados e as páginas mensais só leem as partições deste intervalo
+    # Por omissão fica o ano mais recente com jogos, para não ler o histórico todo
+    ledger = st.session_state.dados['jogos']
+    periodos = opcoes_periodo(ledger)
+    anos = {ano for ano, _ in ledger.meses_com_jogos()}
+    padrao = list(periodos).index(str(max(anos))) if anos else 0
+    rotulo = st.sidebar.selectbox("📆 Período:", list(periodos), index=padrao)
+    st.session_state.periodo_rotulo = rotulo
+    st.session_state.periodo = periodos[rotulo]
+
+    if MODO_PERSISTENCIA == "journal" and not usar_sqlite():
+        with st.sidebar.expander("💾 Persistência", expanded=False):
+            linhas = st.session_state.dados.get('journal_linhas', 0)
+            st.caption(f"{linhas} alterações no journal desde o último snapshot")
+            if st.button("🗜️ Compactar agora"):
+                compactar_dados(st.session_state.dados)
+                st.success("Dados compactados!")
+
+    try:
+        with medir_pagina(option):
+            if option == "🏠 Painel":
+                show_painel()
+            elif option == "⚽ Equipas":
+                show_equipas()
+            elif option == "🏆 Campeonatos":
+                show_campeonatos()
+            elif option == "🧠 Estratégias":
+                show_estrategias()
+            elif option == "📉 Análise de Risco":
+                show_risco()
+            elif option == "📥 Importar":
+                show_importar()
+            elif option == "📤 Exportar":
+                show_exportar()
+            elif option in months:
+                show_mes(option.split(" ")[1])
+    except DadosAlterados:
+        # Outra sessão compactou os dados e as partições por ler destes já não existem
+        carregar_sessao()
+        st.session_state.dados_recarregados = "Os dados foram compactados noutra sessão e foram recarregados."
+        st.rerun()
+
+    # Mostrado depois da página para já contar os agregados pedidos nesta execução
+    contadores = st.session_state.get('cache_agregados', {'pedidos': 0, 'calculos': 0})
+    with st.sidebar.expander("⚡ Cache de agregados", expanded=False):
+        st.caption(
+            f"Versão dos dados: {st.session_state.get('versao_dados', 0)} · "
+            f"{contadores['pedidos'] - contadores['calculos']} acertos · {contadores['calculos']} cálculos"
+        )
+
+    mostrar_perfil()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
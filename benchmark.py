@@ -0,0 +1,262 @@
+"""Benchmark da PlanilhaTrading: gera um histórico sintético e mede o carregamento, a gravação e os agregados das páginas.
+
+Uso:
+    python benchmark.py --jogos 1000 100000 1000000 --armazenamento json colunar sqlite --saida bench.jsonl
+    python benchmark.py --saida bench.jsonl --comparar bench.jsonl
+
+Cada medida é uma linha JSON (no stdout ou acrescentada a --saida), para comparar execuções sucessivas;
+com --comparar, cada medida é comparada com a última equivalente desse arquivo e as regressões são assinaladas.
+Os dados são gerados numa pasta temporária: o arquivo de dados da aplicação nunca é lido nem alterado.
+"""
+import argparse
+import importlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+DIRETORIO = os.path.dirname(os.path.abspath(__file__))
+
+TAMANHOS = [1_000, 10_000, 100_000, 1_000_000]
+ARMAZENAMENTOS = ['json', 'colunar', 'sqlite']
+
+# Uma medida é uma regressão quando o melhor tempo passa este múltiplo do anterior (e o aumento passa o ruído)
+LIMITE_REGRESSAO = 1.25
+RUIDO_SEGUNDOS = 0.005
+
+# Campos que identificam uma medida equivalente entre execuções
+CHAVE_MEDIDA = ('armazenamento', 'jogos', 'equipas', 'campeonatos', 'estrategias', 'tags', 'medida')
+
+
+def importar_nucleo(armazenamento):
+    """Importa o núcleo da aplicação (sem o Streamlit) com o armazenamento pedido"""
+    os.environ['PLANILHA_ARMAZENAMENTO'] = armazenamento
+    sys.path.insert(0, DIRETORIO)
+    return importlib.import_module('planilha')
+
+
+def gerar_operacoes(n_jogos, equipas, campeonatos, estrategias, tags, anos, semente):
+    """Operações que criam as entidades e um lote de n_jogos jogos aleatórios (reprodutíveis pela semente)"""
+    rng = np.random.default_rng(semente)
+    nomes_equipas = [f"Equipa {i + 1}" for i in range(equipas)]
+    nomes_campeonatos = [f"Campeonato {i + 1}" for i in range(campeonatos)]
+    nomes_estrategias = [f"Estratégia {i + 1}" for i in range(estrategias)]
+    nomes_tags = [f"Tag {i + 1}" for i in range(tags)]
+
+    ano_final = datetime.now().year
+    inicio = pd.Timestamp(ano_final - anos + 1, 1, 1)
+    dias = (pd.Timestamp(ano_final, 12, 31) - inicio).days + 1
+
+    casa = rng.integers(0, equipas, n_jogos)
+    # O visitante é sempre outra equipa
+    visitante = (casa + rng.integers(1, max(equipas, 2), n_jogos)) % equipas
+    stake = rng.uniform(5, 100, n_jogos).round(2)
+    odd = rng.uniform(1.3, 3.0, n_jogos)
+    green = rng.random(n_jogos) < 0.5
+
+    jogos = {
+        'ID': np.arange(n_jogos),
+        'Data': (inicio + pd.to_timedelta(rng.integers(0, dias, n_jogos), unit='D')).values,
+        'Competição': pd.Categorical.from_codes(rng.integers(0, campeonatos, n_jogos), nomes_campeonatos),
+        'Casa': pd.Categorical.from_codes(casa, nomes_equipas),
+        'Visitante': pd.Categorical.from_codes(visitante, nomes_equipas),
+        # Uma parte dos jogos fica sem estratégia (''), como na aplicação
+        'Estrategia': pd.Categorical.from_codes(rng.integers(0, estrategias + 1, n_jogos), ['', *nomes_estrategias]),
+        'Tag': pd.Categorical.from_codes(rng.integers(0, tags, n_jogos), nomes_tags),
+        'Stake': stake,
+        'Profit/Loss': np.where(green, stake * (odd - 1), -stake).round(2),
+        '% Stake': rng.uniform(0.5, 5.0, n_jogos).round(2)
+    }
+    return [
+        {'entidade': 'equipa', 'acao': 'adicionar', 'registros': [{'Nome': nome} for nome in nomes_equipas]},
+        {'entidade': 'campeonato', 'acao': 'adicionar', 'registros': [
+            {'Nome': nome, 'Temporada': ano_final, 'Jogos': 0} for nome in nomes_campeonatos
+        ]},
+        {'entidade': 'estrategia', 'acao': 'adicionar', 'registros': [
+            {'Nome': nome, 'Descrição': '', 'Equipa': '', 'Tags': ''} for nome in nomes_estrategias
+        ]},
+        *({'entidade': 'tag', 'acao': 'adicionar', 'nome': nome} for nome in nomes_tags),
+        {'entidade': 'jogo', 'acao': 'adicionar', 'jogos': jogos}
+    ]
+
+
+def fechar(planilha, dados):
+    """Fecha a ligação à base SQLite dos dados (os outros armazenamentos não têm nada aberto)"""
+    if dados is not None and isinstance(dados['jogos'], planilha.armazenamento.LedgerSQLite):
+        dados['jogos'].conexao.close()
+
+
+def preparar_dados(planilha, operacoes):
+    """Carrega os dados da pasta atual e grava neles os dados sintéticos, como a aplicação os gravaria"""
+    dados = planilha.carregar_dados() or planilha.criar_estrutura_vazia()
+    for op in operacoes:
+        planilha.aplicar_operacao(dados, op)
+    # Na base SQLite os jogos já foram escritos pelas operações; nos outros grava-se um snapshot completo
+    if planilha.armazenamento.usar_sqlite():
+        planilha.salvar_dados(dados, *operacoes)
+    else:
+        planilha.salvar_dados(dados)
+    return dados
+
+
+def medidas(planilha, dados):
+    """Cada medida: nome e função sem argumentos, pela ordem em que correm (as gravações por último)"""
+    contador = iter(range(1, 10 ** 9))
+
+    def carregar():
+        fechar(planilha, planilha.carregar_dados())
+
+    def stats_estrategias():
+        # Lista e desempenho da página de estratégias
+        nomes = dados['estrategias']['Nome']
+        [dados['resumo'].jogos_com('estrategia', nome) for nome in nomes]
+        planilha.calcular_stats_por(dados, 'Estrategia').reindex(pd.Index(nomes).unique(), fill_value=0)
+
+    def gravar_operacao():
+        # Uma edição de um jogo, como no formulário do mês
+        planilha.registrar(
+            dados, {'entidade': 'jogo', 'acao': 'atualizar', 'id': 0, 'jogo': {'Profit/Loss': float(next(contador))}}
+        )
+
+    return {
+        'carregar_dados': carregar,
+        'stats_equipas': lambda: [planilha.calcular_stats_equipa(dados, nome) for nome in dados['equipas']['Nome']],
+        'stats_campeonatos': lambda: [
+            planilha.calcular_stats_campeonato(dados, nome) for nome in dados['campeonatos']['Nome']
+        ],
+        'stats_estrategias': stats_estrategias,
+        'stats_tags': lambda: planilha.calcular_stats_por(dados, 'Tag').reindex(dados['tags'], fill_value=0),
+        'desempenho_mensal': lambda: planilha.calcular_desempenho_mensal(dados),
+        'analise_risco': lambda: planilha.analisar_risco(dados['jogos'].periodo()),
+        'salvar_dados_snapshot': lambda: planilha.salvar_dados(dados),
+        'salvar_dados_operacao': gravar_operacao
+    }
+
+
+def cronometrar(funcao, repeticoes):
+    """Tempos (em segundos) de cada repetição"""
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return tempos
+
+
+def versao_codigo():
+    """Commit atual do repositório (ou None fora de um repositório git)"""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=DIRETORIO, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def carregar_anteriores(caminho):
+    """Última medida de cada chave num arquivo de resultados anteriores"""
+    anteriores = {}
+    if caminho and os.path.exists(caminho):
+        with open(caminho, 'r', encoding='utf-8') as f:
+            for linha in f:
+                if linha.strip():
+                    registo = json.loads(linha)
+                    anteriores[tuple(registo.get(campo) for campo in CHAVE_MEDIDA)] = registo
+    return anteriores
+
+
+def executar(args, armazenamento):
+    """Corre todos os tamanhos num só armazenamento; devolve o número de regressões"""
+    # As regressões comparam-se com o arquivo tal como estava antes desta execução
+    anteriores = carregar_anteriores(args.comparar)
+    saida = open(args.saida, 'a', encoding='utf-8') if args.saida else sys.stdout
+    base = {
+        'data': datetime.now().isoformat(timespec='seconds'),
+        'commit': versao_codigo(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__
+    }
+    regressoes = 0
+    pasta_inicial = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='planilha_bench_') as pasta:
+        os.chdir(pasta)
+        try:
+            planilha = importar_nucleo(armazenamento)
+            # O armazenamento efetivo (o colunar usa o JSON quando falta o pyarrow)
+            efetivo = ('sqlite' if planilha.armazenamento.usar_sqlite()
+                       else 'colunar' if planilha.armazenamento.usar_colunar() else 'json')
+            for n_jogos in args.jogos:
+                os.chdir(tempfile.mkdtemp(dir=pasta))
+                operacoes = gerar_operacoes(n_jogos, args.equipas, args.campeonatos, args.estrategias,
+                                            args.tags, args.anos, args.semente)
+                inicio = time.perf_counter()
+                dados = preparar_dados(planilha, operacoes)
+                print(f"{efetivo:8} {n_jogos:>9} jogos gerados em {time.perf_counter() - inicio:.2f} s", file=sys.stderr)
+
+                for medida, funcao in medidas(planilha, dados).items():
+                    tempos = cronometrar(funcao, args.repeticoes)
+                    registo = {
+                        **base, 'armazenamento': efetivo, 'jogos': n_jogos, 'equipas': args.equipas,
+                        'campeonatos': args.campeonatos, 'estrategias': args.estrategias, 'tags': args.tags,
+                        'medida': medida, 'repeticoes': args.repeticoes, 'min_s': min(tempos),
+                        'mediana_s': statistics.median(tempos), 'max_s': max(tempos)
+                    }
+                    print(json.dumps(registo, ensure_ascii=False), file=saida, flush=True)
+
+                    linha = f"{efetivo:8} {n_jogos:>9} {medida:24} {registo['min_s'] * 1000:10.1f} ms"
+                    anterior = anteriores.get(tuple(registo[campo] for campo in CHAVE_MEDIDA))
+                    if anterior and anterior['min_s'] > 0:
+                        razao = registo['min_s'] / anterior['min_s']
+                        linha += f"  x{razao:.2f} ({anterior.get('commit') or '?'})"
+                        if razao > LIMITE_REGRESSAO and registo['min_s'] - anterior['min_s'] > RUIDO_SEGUNDOS:
+                            linha += "  REGRESSÃO"
+                            regressoes += 1
+                    print(linha, file=sys.stderr)
+                fechar(planilha, dados)
+        finally:
+            os.chdir(pasta_inicial)
+            if saida is not sys.stdout:
+                saida.close()
+    return regressoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--jogos', type=int, nargs='+', default=TAMANHOS, help="Tamanhos do histórico (número de jogos)")
+    parser.add_argument('--armazenamento', nargs='+', choices=ARMAZENAMENTOS, default=ARMAZENAMENTOS)
+    parser.add_argument('--equipas', type=int, default=200)
+    parser.add_argument('--campeonatos', type=int, default=20)
+    parser.add_argument('--estrategias', type=int, default=15)
+    parser.add_argument('--tags', type=int, default=8)
+    parser.add_argument('--anos', type=int, default=5, help="Anos cobertos pelos jogos, até ao ano atual")
+    parser.add_argument('--repeticoes', type=int, default=5)
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--saida', help="Arquivo JSON Lines ao qual acrescentar os resultados (por omissão, o stdout)")
+    parser.add_argument('--comparar', help="Resultados anteriores (JSON Lines) com que comparar cada medida")
+    args = parser.parse_args()
+
+    if len(args.armazenamento) > 1:
+        # O armazenamento é lido quando o núcleo é importado: cada um corre no seu processo
+        regressoes = 0
+        for armazenamento in args.armazenamento:
+            processo = subprocess.run([sys.executable, os.path.abspath(__file__), *sys.argv[1:],
+                                       '--armazenamento', armazenamento])
+            if processo.returncode not in (0, 1):
+                return processo.returncode
+            regressoes += processo.returncode
+        return 1 if regressoes else 0
+
+    return 1 if executar(args, args.armazenamento[0]) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,30 @@
+"""Núcleo da planilha de trading, sem dependências da interface (Streamlit/Plotly).
+
+- modelo: ledger de jogos, dicionários de nomes, resumo de totais e operações que os alteram
+- armazenamento: carregar e gravar os dados (JSON ou colunar com journal, ou SQLite)
+- estatisticas: estatísticas do resumo, desempenho mensal, análise de risco e bootstrap do ROI
+- extratos: lotes de jogos, importação de extratos e exportação
+- perfil: medição opcional do tempo de cada fase
+
+Exemplo::
+
+    from planilha import carregar_dados, calcular_stats_por
+
+    dados = carregar_dados()
+    calcular_stats_por(dados, 'Estrategia')
+"""
+from planilha.armazenamento import (
+    ARMAZENAMENTO, MODO_PERSISTENCIA, carregar_dados, compactar_dados, registrar, salvar_dados, trava_leitura
+)
+from planilha.estatisticas import (
+    analisar_risco, calcular_bootstrap, calcular_desempenho_mensal, calcular_stats_agrupados,
+    calcular_stats_campeonato, calcular_stats_equipa, calcular_stats_por, metricas_jogos, opcoes_periodo,
+    resultados_por
+)
+from planilha.extratos import (
+    exportar_blocos, filtrar_jogos, operacoes_extrato, operacoes_lote, preparar_lote_jogos, tabela_exportacao
+)
+from planilha.modelo import (
+    COLUNAS_JOGO, DIMENSOES, MESES, Ledger, Resumo, aplicar_operacao, criar_estrutura_vazia,
+    format_currency, format_percent, format_profit
+)
@@ -0,0 +1,970 @@
+"""Persistência dos dados: snapshot JSON ou colunar (Arrow) com journal de operações, ou base SQLite"""
+import glob
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import pandas as pd
+
+from planilha.modelo import (
+    COLUNAS_CATEGORIA, COLUNAS_JOGO, DIMENSOES, MESES, TABELAS_ENTIDADE, VERSAO_FORMATO, DadosAlterados, Ledger,
+    Resumo, aplicar_operacao, convert_numpy_types, converter_mensal, criar_dicionarios, criar_estrutura_vazia,
+    descodificar_jogos, json_converter, nomear_indice, normalizar_datas, normalizar_indice,
+    particao_no_periodo, tipar_ledger
+)
+from planilha.perfil import PERFIL_ATIVO, contar_gravacao, medido
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as pa_feather
+except ImportError:
+    pa = None
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: só há a trava entre as sessões do próprio processo
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Nome do arquivo para salvar os dados
+DATA_FILE = "dados_apostas.json"
+
+# Journal com as alterações feitas desde o último snapshot (uma operação por linha)
+JOURNAL_FILE = "dados_apostas.journal"
+
+# "journal" acrescenta cada alteração ao journal; "completo" reescreve o arquivo inteiro
+MODO_PERSISTENCIA = os.environ.get("PLANILHA_PERSISTENCIA", "journal")
+
+# "json" guarda tudo num único arquivo; "colunar" guarda cada mês num arquivo Arrow (requer pyarrow);
+# "sqlite" guarda tudo numa base SQLite com índices, gravando cada alteração numa transação
+ARMAZENAMENTO = os.environ.get("PLANILHA_ARMAZENAMENTO", "json")
+
+# Pasta do armazenamento colunar: meta.json com as entidades, um arquivo por mês e o journal
+LEDGER_DIR = "dados_apostas_ledger"
+
+# Base do armazenamento SQLite
+SQLITE_FILE = "dados_apostas.db"
+
+# Número de operações no journal a partir do qual é compactado em segundo plano
+COMPACTAR_APOS = 500
+
+# Trava entre processos dos arquivos de dados: a aplicação substitui-os, os relatórios só os leem
+TRAVA_FILE = "dados_apostas.lock"
+
+
+def _serializar_entidades(dados):
+    """Converte as tabelas de equipas, campeonatos, estratégias e tags para JSON"""
+    return {
+        'versao': VERSAO_FORMATO,
+        'equipas': dados['equipas'].to_dict(),
+        'campeonatos': dados['campeonatos'].to_dict(),
+        'estrategias': dados['estrategias'].to_dict(),
+        'tags': list(dados['tags']),
+        'proximo_id': dados.get('proximo_id', 0),
+        'seq': dados.get('seq', 0),
+        'dicionarios': {dimensao: list(dicionario.nomes) for dimensao, dicionario in dados['dicionarios'].items()},
+        'resumo': dados['resumo'].para_json()
+    }
+
+
+def _carregar_entidades(dados):
+    """Converte as tabelas de entidades lidas do JSON em DataFrames"""
+    dados['equipas'] = normalizar_indice(pd.DataFrame(dados['equipas']))
+    dados['campeonatos'] = normalizar_indice(pd.DataFrame(dados['campeonatos']))
+    dados['estrategias'] = normalizar_indice(pd.DataFrame(dados['estrategias']))
+    dados.setdefault('proximo_id', 0)
+    dados.setdefault('seq', 0)
+    dados['dicionarios'] = criar_dicionarios(dados.get('dicionarios'))
+    # Arquivos anteriores ao resumo (ou com o resumo por nomes) ficam com None;
+    # é calculado a partir do ledger ao carregar
+    if 'resumo' in dados and dados.get('versao', 1) >= 3:
+        dados['resumo'] = Resumo.de_json(dados['resumo'], dados['dicionarios'])
+    else:
+        dados['resumo'] = None
+    return dados
+
+
+def _serializar_dados(dados):
+    """Converte a estrutura de dados num dicionário pronto para JSON"""
+    dados_para_salvar = _serializar_entidades(dados)
+
+    # O ledger é gravado por colunas, com as datas em texto e os IDs das dimensões
+    jogos = dados['jogos'].df_ids.reset_index()
+    jogos['Data'] = jogos['Data'].dt.strftime('%Y-%m-%d')
+    dados_para_salvar['jogos'] = {coluna: jogos[coluna].tolist() for coluna in jogos.columns}
+
+    return dados_para_salvar
+
+
+def _gravar_json(dados_para_salvar):
+    """Grava o snapshot num arquivo temporário e substitui o original de forma atómica; devolve os bytes escritos"""
+    temporario = f"{DATA_FILE}.tmp"
+    with open(temporario, 'w', encoding='utf-8') as f:
+        json.dump(dados_para_salvar, f, default=json_converter, ensure_ascii=False, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporario, DATA_FILE)
+    return os.path.getsize(DATA_FILE)
+
+
+def _escrever_particao(df, caminho):
+    """Grava uma partição em formato Arrow (sem compressão, para poder ser mapeada em memória); devolve os bytes"""
+    tabela = pa.Table.from_pandas(df, preserve_index=True)
+    temporario = f"{caminho}.tmp"
+    pa_feather.write_feather(tabela, temporario, compression='uncompressed')
+    os.replace(temporario, caminho)
+    return os.path.getsize(caminho)
+
+
+def _preparar_colunar(dados):
+    """Prepara o snapshot colunar: entidades e cópia das partições alteradas desde a última gravação"""
+    meta = _serializar_entidades(dados)
+    ledger = dados['jogos']
+    particoes = {f"{ano:04d}-{mes:02d}": arquivo for (ano, mes), arquivo in ledger.pendentes.items()}
+    particoes.update({f"{ano:04d}-{mes:02d}": arquivo for (ano, mes), arquivo in ledger.arquivos.items()})
+
+    # As partições em memória que não mudaram continuam no seu arquivo, se ainda existir
+    em_falta = [
+        chave for chave, arquivo in ledger.arquivos.items() if not os.path.exists(os.path.join(LEDGER_DIR, arquivo))
+    ]
+    # Cada snapshot grava arquivos novos; os antigos só são apagados depois do meta.json
+    frames, gravadas = {}, {}
+    for (ano, mes), df in ledger.particoes_alteradas(em_falta).items():
+        chave = f"{ano:04d}-{mes:02d}"
+        if df.empty:
+            particoes.pop(chave, None)
+            gravadas[(ano, mes)] = None
+            continue
+        particoes[chave] = gravadas[(ano, mes)] = f"{chave}.{meta['seq']}.arrow"
+        frames[particoes[chave]] = df.copy()
+    ledger.gravadas(gravadas)
+    meta['particoes'] = particoes
+    return {'meta': meta, 'frames': frames}
+
+
+def _gravar_colunar(snapshot):
+    """Grava as partições alteradas e o meta.json; devolve os bytes escritos.
+
+    Os arquivos que o meta.json anterior usava ficam mais uma geração, para as sessões carregadas
+    antes ainda os poderem ler; os mais antigos são apagados.
+    """
+    os.makedirs(LEDGER_DIR, exist_ok=True)
+    escritos = 0
+    for arquivo, df in snapshot['frames'].items():
+        caminho = os.path.join(LEDGER_DIR, arquivo)
+        # O nome inclui o seq: se já existe, tem exatamente este conteúdo
+        if not os.path.exists(caminho):
+            escritos += _escrever_particao(df, caminho)
+
+    caminho_meta = os.path.join(LEDGER_DIR, 'meta.json')
+    anteriores = set()
+    if os.path.exists(caminho_meta):
+        try:
+            with open(caminho_meta, 'r', encoding='utf-8') as f:
+                anteriores = set(json.load(f).get('particoes', {}).values())
+        except (OSError, json.JSONDecodeError):
+            pass
+    with open(f"{caminho_meta}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(snapshot['meta'], f, default=json_converter, ensure_ascii=False, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(f"{caminho_meta}.tmp", caminho_meta)
+    escritos += os.path.getsize(caminho_meta)
+
+    em_uso = set(snapshot['meta']['particoes'].values()) | anteriores
+    for caminho in glob.glob(os.path.join(glob.escape(LEDGER_DIR), '*.arrow')):
+        if os.path.basename(caminho) not in em_uso:
+            try:
+                os.remove(caminho)
+            except OSError:
+                # Ainda mapeado em memória (Windows); é apagado na próxima compactação
+                pass
+    return escritos
+
+
+def usar_colunar():
+    """Indica se o armazenamento colunar está selecionado e disponível"""
+    return ARMAZENAMENTO == "colunar" and pa is not None
+
+
+def _preparar_snapshot(dados):
+    """Copia o estado atual para um snapshot que pode ser gravado noutra thread"""
+    return _preparar_colunar(dados) if usar_colunar() else _serializar_dados(dados)
+
+
+def _gravar_snapshot(snapshot):
+    """Grava um snapshot preparado por _preparar_snapshot; devolve os bytes escritos"""
+    if usar_colunar():
+        return _gravar_colunar(snapshot)
+    return _gravar_json(snapshot)
+
+
+def _tamanho_sqlite():
+    """Tamanho da base SQLite e do seu WAL (o perfil conta o crescimento como bytes escritos)"""
+    return sum(os.path.getsize(caminho) for caminho in (SQLITE_FILE, f"{SQLITE_FILE}-wal") if os.path.exists(caminho))
+
+
+def _caminho_journal():
+    """Journal do armazenamento em uso"""
+    return os.path.join(LEDGER_DIR, 'journal') if usar_colunar() else JOURNAL_FILE
+
+
+def _segmentos_journal(journal):
+    """Lista os arquivos de journal por ordem: segmentos em compactação e o journal ativo"""
+    segmentos = sorted(
+        glob.glob(f"{glob.escape(journal)}.*[0-9]"),
+        key=lambda caminho: int(caminho.rsplit('.', 1)[1])
+    )
+    if os.path.exists(journal):
+        segmentos.append(journal)
+    return segmentos
+
+
+def reproduzir_journal(dados, journal):
+    """Reaplica as operações do journal posteriores ao snapshot; devolve quantas aplicou"""
+    aplicadas = 0
+    for caminho in _segmentos_journal(journal):
+        with open(caminho, 'r', encoding='utf-8') as f:
+            for linha in f:
+                try:
+                    op = json.loads(linha)
+                except json.JSONDecodeError:
+                    # Linha incompleta de uma escrita interrompida
+                    continue
+                if op['seq'] <= dados['seq']:
+                    if aplicadas:
+                        logger.warning("Operação com seq %s repetido no journal ignorada", op['seq'])
+                    continue
+                # A primeira linha de um journal novo só marca o seq do snapshot que o precede
+                if 'entidade' in op:
+                    aplicar_operacao(dados, op)
+                    aplicadas += 1
+                dados['seq'] = op['seq']
+    return aplicadas
+
+
+def _ultimo_seq(journal):
+    """Seq da última operação gravada no journal, ou None se ainda não houver journal"""
+    for caminho in reversed(_segmentos_journal(journal)):
+        with open(caminho, 'rb') as f:
+            # Cada linha acaba no seq; normalmente basta ler o fim do arquivo
+            f.seek(max(f.seek(0, os.SEEK_END) - 64, 0))
+            fim = re.search(rb'"seq": (\d+)\}\n$', f.read())
+            if fim:
+                return int(fim.group(1))
+            f.seek(0)
+            seqs = [int(seq) for seq in re.findall(rb'"seq": (\d+)\}\n', f.read())]
+        if seqs:
+            return seqs[-1]
+    return None
+
+
+def _verificar_seq(gravado, esperado):
+    """Recusa gravar por cima de operações de outra sessão: o último seq gravado tem de ser o destes dados"""
+    if gravado is not None and gravado != esperado:
+        raise DadosAlterados(f"Os dados foram alterados noutra sessão (seq {gravado}, esperado {esperado})")
+
+
+# Trava partilhada pelas sessões do processo para escrever no journal e compactar
+_trava = threading.Lock()
+
+
+def _trava_persistencia():
+    """Trava partilhada entre sessões para escrever no journal e compactar"""
+    return _trava
+
+
+@contextmanager
+def _trava_arquivos(partilhada=False):
+    """Trava entre processos: exclusiva para escrever o snapshot e o journal, partilhada para os ler.
+
+    Quem lê o journal sem a trava ignora a última linha se ainda estiver incompleta.
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(TRAVA_FILE, 'a') as arquivo:
+        fcntl.flock(arquivo, fcntl.LOCK_SH if partilhada else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(arquivo, fcntl.LOCK_UN)
+
+
+def trava_leitura():
+    """Trava partilhada para ler os dados noutro processo enquanto a aplicação corre.
+
+    Os dados carregados com `carregar_dados(so_leitura=True)` e as partições lidas dentro dela
+    ficam coerentes entre si; no SQLite é a própria base que isola as leituras.
+    """
+    return _trava_arquivos(partilhada=True)
+
+
+def _avisar_no_registo(nivel, mensagem):
+    """Destino por omissão dos avisos do carregamento: o logging (a interface mostra-os na página)"""
+    logger.log(nivel, mensagem)
+
+
+def _carregar_json(avisar=_avisar_no_registo):
+    """Lê o snapshot JSON, com todos os jogos em memória"""
+    if os.path.exists(DATA_FILE):
+        try:
+            with open(DATA_FILE, 'r', encoding='utf-8') as f:
+                # Verifica se o arquivo não está vazio
+                if os.stat(DATA_FILE).st_size == 0:
+                    return None
+
+                dados = json.load(f)
+
+                # Verifica se os dados têm a estrutura esperada (jogos no ledger ou no formato mensal antigo)
+                if not all(key in dados for key in ['equipas', 'campeonatos', 'estrategias', 'tags']) or \
+                        not ('jogos' in dados or 'mensal' in dados):
+                    avisar(logging.WARNING, "Estrutura de dados inválida no arquivo. Criando nova estrutura.")
+                    return None
+
+                # Converter os DataFrames
+                _carregar_entidades(dados)
+
+                if 'jogos' in dados:
+                    jogos = pd.DataFrame(dados['jogos'])
+                    dados['jogos'] = Ledger(jogos.set_index('ID') if 'ID' in jogos else None,
+                                            dicionarios=dados['dicionarios'])
+                else:
+                    # Converter os DataFrames mensais (formato antigo, convertido após o journal)
+                    for mes in dados['mensal']:
+                        dados['mensal'][mes] = normalizar_indice(normalizar_datas(pd.DataFrame(dados['mensal'][mes])))
+                return dados
+        except json.JSONDecodeError:
+            avisar(logging.WARNING, "Arquivo de dados corrompido. Criando nova estrutura.")
+        except Exception as e:
+            avisar(logging.ERROR, f"Erro inesperado ao carregar dados: {str(e)}")
+    return None
+
+
+def _carregar_colunar(avisar=_avisar_no_registo):
+    """Lê as entidades do meta.json; as partições ficam por ler até serem usadas"""
+    caminho_meta = os.path.join(LEDGER_DIR, 'meta.json')
+    if not os.path.exists(caminho_meta):
+        return None
+    try:
+        with open(caminho_meta, 'r', encoding='utf-8') as f:
+            dados = _carregar_entidades(json.load(f))
+        particoes = dados.pop('particoes')
+        if dados.get('versao', 1) < 2:
+            # Formato antigo: um arquivo por nome de mês
+            dados['mensal'] = {
+                mes: normalizar_indice(pa_feather.read_table(os.path.join(LEDGER_DIR, arquivo)).to_pandas())
+                if arquivo else pd.DataFrame(columns=COLUNAS_JOGO)
+                for mes, arquivo in particoes.items()
+            }
+        else:
+            pendentes = {(int(chave[:4]), int(chave[5:7])): arquivo for chave, arquivo in particoes.items()}
+            dados['jogos'] = Ledger(pendentes=pendentes, pasta=LEDGER_DIR, dicionarios=dados['dicionarios'])
+        return dados
+    except Exception as e:
+        avisar(logging.ERROR, f"Erro inesperado ao carregar dados: {str(e)}")
+        return None
+
+
+def _garantir_resumo(dados):
+    """Calcula o resumo a partir do ledger quando o arquivo ainda não o tinha; indica se foi preciso"""
+    if dados is None or 'mensal' in dados or dados.get('resumo') is not None:
+        return False
+    dados['resumo'] = Resumo.de_jogos(dados['jogos'])
+    return True
+
+
+def _ler_json_completo(avisar=_avisar_no_registo):
+    """Lê o arquivo JSON com o journal reaplicado, já no formato do ledger (para as migrações)"""
+    dados = _carregar_json(avisar)
+    if dados is None:
+        dados = criar_estrutura_vazia()
+    _garantir_resumo(dados)
+    reproduzir_journal(dados, JOURNAL_FILE)
+    if 'mensal' in dados:
+        converter_mensal(dados)
+    return dados
+
+
+def migrar_json_para_colunar(avisar=_avisar_no_registo):
+    """Converte o arquivo JSON (e o seu journal) para o armazenamento colunar, uma única vez"""
+    dados = _ler_json_completo(avisar)
+
+    # Corrige já as contagens de jogos, para o arranque não ter de ler todas as partições
+    contagem = dados['jogos'].df['Competição'].value_counts()
+    dados['campeonatos']['Jogos'] = dados['campeonatos']['Nome'].map(contagem).fillna(0).astype(int)
+
+    _gravar_colunar(_preparar_colunar(dados))
+
+
+# Coluna SQL de cada coluna do ledger (as dimensões guardam o ID do nome na tabela nomes)
+COLUNAS_SQL = {
+    'Data': 'data', 'Competição': 'competicao_id', 'Casa': 'casa_id', 'Visitante': 'visitante_id',
+    'Stake': 'stake', 'Profit/Loss': 'profit', '% Stake': 'percent_stake',
+    'Estrategia': 'estrategia_id', 'Tag': 'tag_id'
+}
+
+# Colunas SQL das tabelas de entidades; a coluna Jogos dos campeonatos é contada a partir dos jogos
+TABELAS_SQL = {
+    'equipas': {'Nome': 'nome'},
+    'campeonatos': {'Nome': 'nome', 'Temporada': 'temporada'},
+    'estrategias': {'Nome': 'nome', 'Descrição': 'descricao', 'Equipa': 'equipa', 'Tags': 'tags'},
+    'tags': {'Nome': 'nome'}
+}
+
+ESQUEMA_SQL = """
+CREATE TABLE IF NOT EXISTS jogos (
+    id INTEGER PRIMARY KEY,
+    data TEXT NOT NULL,
+    competicao_id INTEGER NOT NULL,
+    casa_id INTEGER NOT NULL,
+    visitante_id INTEGER NOT NULL,
+    stake REAL NOT NULL,
+    profit REAL NOT NULL,
+    percent_stake REAL NOT NULL,
+    estrategia_id INTEGER NOT NULL,
+    tag_id INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jogos_data ON jogos (data);
+CREATE INDEX IF NOT EXISTS idx_jogos_mes ON jogos (substr(data, 6, 2), data);
+CREATE INDEX IF NOT EXISTS idx_jogos_competicao ON jogos (competicao_id, data);
+CREATE INDEX IF NOT EXISTS idx_jogos_casa ON jogos (casa_id, data);
+CREATE INDEX IF NOT EXISTS idx_jogos_visitante ON jogos (visitante_id, data);
+CREATE INDEX IF NOT EXISTS idx_jogos_estrategia ON jogos (estrategia_id, data);
+CREATE INDEX IF NOT EXISTS idx_jogos_tag ON jogos (tag_id, data);
+CREATE TABLE IF NOT EXISTS nomes (
+    dimensao TEXT NOT NULL, id INTEGER NOT NULL, nome TEXT NOT NULL, PRIMARY KEY (dimensao, id)
+);
+CREATE TABLE IF NOT EXISTS equipas (posicao INTEGER PRIMARY KEY, nome TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS campeonatos (posicao INTEGER PRIMARY KEY, nome TEXT NOT NULL, temporada INTEGER);
+CREATE TABLE IF NOT EXISTS estrategias (
+    posicao INTEGER PRIMARY KEY, nome TEXT NOT NULL, descricao TEXT, equipa TEXT, tags TEXT
+);
+CREATE TABLE IF NOT EXISTS tags (posicao INTEGER PRIMARY KEY, nome TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS meta (chave TEXT PRIMARY KEY, valor INTEGER NOT NULL);
+"""
+
+
+def usar_sqlite():
+    """Indica se o armazenamento SQLite está selecionado"""
+    return ARMAZENAMENTO == "sqlite"
+
+
+def _filtro_sql(inicio=None, fim=None, condicoes=(), parametros=()):
+    """Cláusula WHERE para jogos com data em [inicio, fim) e as condições dadas, com os seus parâmetros"""
+    condicoes, parametros = list(condicoes), list(parametros)
+    if inicio is not None:
+        condicoes.append("data >= ?")
+        parametros.append(inicio.strftime('%Y-%m-%d'))
+    if fim is not None:
+        condicoes.append("data < ?")
+        parametros.append(fim.strftime('%Y-%m-%d'))
+    return (" WHERE " + " AND ".join(condicoes) if condicoes else ""), parametros
+
+
+class LedgerSQLite:
+    """Ledger guardado na tabela jogos do SQLite, com a mesma interface do Ledger em memória.
+
+    As leituras são consultas que usam os índices; cada escrita mexe só nas linhas do jogo e fica na
+    transação aberta da ligação até salvar_dados a confirmar. As dimensões são IDs dos dicionários.
+    """
+
+    def __init__(self, conexao, dicionarios):
+        self.conexao = conexao
+        self.dicionarios = dicionarios
+        self._todos = None
+        self._meses = None
+
+    def _alterado(self):
+        self._todos = None
+        self._meses = None
+
+    def _consultar_ids(self, filtro='', parametros=(), fim_consulta=' ORDER BY id'):
+        colunas = ', '.join(['id'] + list(COLUNAS_SQL.values()))
+        df = pd.read_sql_query(f"SELECT {colunas} FROM jogos{filtro}{fim_consulta}", self.conexao, params=parametros)
+        df.columns = ['ID'] + list(COLUNAS_SQL)
+        return tipar_ledger(df.set_index('ID'), self.dicionarios)
+
+    def _consultar(self, *args, **kwargs):
+        return descodificar_jogos(self._consultar_ids(*args, **kwargs), self.dicionarios)
+
+    @property
+    def df(self):
+        """Todos os jogos, com os nomes atuais dos dicionários"""
+        return descodificar_jogos(self.df_ids, self.dicionarios)
+
+    @property
+    def df_ids(self):
+        """Todos os jogos com os IDs das dimensões (lidos uma vez até à próxima escrita)"""
+        if self._todos is None:
+            self._todos = self._consultar_ids()
+        return self._todos
+
+    def __len__(self):
+        return self.conexao.execute("SELECT COUNT(*) FROM jogos").fetchone()[0]
+
+    def meses_com_jogos(self):
+        """Meses (ano, mês) com jogos, lidos do índice das datas"""
+        if self._meses is None:
+            linhas = self.conexao.execute("SELECT DISTINCT substr(data, 1, 7) FROM jogos").fetchall()
+            self._meses = {(int(mes[:4]), int(mes[5:7])) for mes, in linhas}
+        return self._meses
+
+    @medido('carregar')
+    def periodo(self, inicio=None, fim=None):
+        """Jogos com data em [inicio, fim)"""
+        if inicio is None and fim is None:
+            return self.df
+        return self._consultar(*_filtro_sql(inicio, fim))
+
+    @medido('carregar')
+    def mes(self, mes, inicio=None, fim=None):
+        """Jogos de um mês dentro do período dado"""
+        numero = f"{MESES.index(mes) + 1:02d}"
+        return self._consultar(*_filtro_sql(inicio, fim, ["substr(data, 6, 2) = ?"], [numero]))
+
+    def ultimos(self, quantidade, inicio=None, fim=None):
+        """Os jogos mais recentes do período"""
+        filtro, parametros = _filtro_sql(inicio, fim)
+        return self._consultar(filtro, parametros, f" ORDER BY data DESC, id DESC LIMIT {int(quantidade)}")
+
+    def blocos(self, inicio=None, fim=None):
+        """Jogos do período, um mês de cada vez e por ordem de data (uma consulta por mês, pelo índice das datas)"""
+        for ano, mes in sorted(chave for chave in self.meses_com_jogos() if particao_no_periodo(chave, inicio, fim)):
+            desde = pd.Timestamp(ano, mes, 1)
+            ate = desde + pd.offsets.MonthBegin(1)
+            filtro, parametros = _filtro_sql(max(desde, inicio) if inicio is not None else desde,
+                                             min(ate, fim) if fim is not None else ate)
+            jogos = self._consultar(filtro, parametros, ' ORDER BY data, id')
+            if len(jogos):
+                yield jogos
+
+    def copia(self):
+        """Ledger numa ligação só de leitura à mesma base, para ler noutra thread sem usar a transação desta"""
+        caminho = self.conexao.execute("PRAGMA database_list").fetchone()[2]
+        return LedgerSQLite(_abrir_sqlite(caminho, so_leitura=True), self.dicionarios)
+
+    def linhas(self, ids):
+        """Jogos com os IDs dados, como DataFrame"""
+        ids = [int(id_jogo) for id_jogo in ids]
+        filtro = f" WHERE id IN ({', '.join('?' * len(ids))})"
+        return self._consultar(filtro, ids).loc[ids]
+
+    def jogo(self, id_jogo):
+        """Linha de um jogo pelo seu ID"""
+        return self.linhas([id_jogo]).loc[int(id_jogo)]
+
+    def adicionar(self, novos):
+        jogos = tipar_ledger(novos, self.dicionarios).reset_index()
+        jogos['Data'] = jogos['Data'].dt.strftime('%Y-%m-%d')
+        colunas = ['ID'] + list(COLUNAS_SQL)
+        try:
+            self.conexao.executemany(
+                f"INSERT INTO jogos (id, {', '.join(COLUNAS_SQL.values())}) VALUES ({', '.join('?' * len(colunas))})",
+                list(zip(*(jogos[coluna].tolist() for coluna in colunas)))
+            )
+        except sqlite3.IntegrityError as e:
+            # Os IDs vêm de proximo_id: outra sessão já gravou jogos com eles
+            self.conexao.rollback()
+            raise DadosAlterados("Os dados foram alterados noutra sessão (IDs de jogos já usados)") from e
+        self._alterado()
+
+    def atualizar(self, id_jogo, valores):
+        valores = {coluna: convert_numpy_types(valor) for coluna, valor in valores.items()}
+        if 'Data' in valores:
+            valores['Data'] = pd.Timestamp(valores['Data']).strftime('%Y-%m-%d')
+        for coluna in valores.keys() & COLUNAS_CATEGORIA.keys():
+            valores[coluna] = self.dicionarios[COLUNAS_CATEGORIA[coluna]].id(str(valores[coluna]))
+        atribuicoes = ', '.join(f"{COLUNAS_SQL[coluna]} = ?" for coluna in valores)
+        cursor = self.conexao.execute(
+            f"UPDATE jogos SET {atribuicoes} WHERE id = ?", [*valores.values(), int(id_jogo)]
+        )
+        if cursor.rowcount == 0:
+            raise KeyError(id_jogo)
+        self._alterado()
+
+    def remover(self, id_jogo):
+        if self.conexao.execute("DELETE FROM jogos WHERE id = ?", (int(id_jogo),)).rowcount == 0:
+            raise KeyError(id_jogo)
+        self._alterado()
+
+    def recodificar(self, colunas, id_antigo, id_novo):
+        """Passa os jogos de um ID para outro nas colunas dadas (encontrados pelos índices)"""
+        for coluna in colunas:
+            coluna_sql = COLUNAS_SQL[coluna]
+            self.conexao.execute(
+                f"UPDATE jogos SET {coluna_sql} = ? WHERE {coluna_sql} = ?", (int(id_novo), int(id_antigo))
+            )
+        self._alterado()
+
+
+class ResumoSQLite:
+    """Totais agregados pelo próprio SQLite (GROUP BY sobre os índices), com a mesma interface do Resumo"""
+
+    def __init__(self, conexao, dicionarios):
+        self.conexao = conexao
+        self.dicionarios = dicionarios
+
+    def aplicar(self, jogos, sinal=1):
+        """Nada a fazer: os totais são calculados a partir da tabela jogos"""
+
+    def fundir(self, dimensao, id_antigo, id_novo, ledger):
+        """Nada a fazer: os totais são calculados a partir da tabela jogos"""
+
+    def jogos_com(self, dimensao, nome):
+        """Número de jogos que usam o nome na dimensão dada (contados pelos índices das colunas)"""
+        id_nome = self.dicionarios[dimensao].procurar(nome)
+        if id_nome is None:
+            return 0
+        colunas = [COLUNAS_SQL[coluna] for coluna, dim in COLUNAS_CATEGORIA.items() if dim == dimensao]
+        condicao = " OR ".join(f"{coluna} = ?" for coluna in colunas)
+        return self.conexao.execute(
+            f"SELECT COUNT(*) FROM jogos WHERE {condicao}", [id_nome] * len(colunas)
+        ).fetchone()[0]
+
+    def tabela(self, dimensao, inicio=None, fim=None, por_mes=False):
+        """Mercados, greens, stake e profit de cada nome (ou de cada ano e mês) no período [inicio, fim)"""
+        colunas = [COLUNAS_SQL[coluna] for coluna, dim in COLUNAS_CATEGORIA.items() if dim == dimensao]
+        partes, parametros = [], []
+        for posicao, coluna in enumerate(colunas or ["0"]):
+            # Um jogo conta uma só vez por chave (ex.: Casa igual a Visitante)
+            condicoes = [f"{coluna} <> {anterior}" for anterior in colunas[:posicao]]
+            filtro, valores = _filtro_sql(inicio, fim, condicoes)
+            partes.append(f"SELECT {coluna} AS chave, data, stake, profit FROM jogos{filtro}")
+            parametros += valores
+
+        grupo = ("CAST(substr(data, 1, 4) AS INTEGER) AS ano, CAST(substr(data, 6, 2) AS INTEGER) AS mes"
+                 if por_mes else "chave")
+        indice = ['ano', 'mes'] if por_mes else ['chave']
+        consulta = (
+            f"SELECT {grupo}, COUNT(*) AS mercados, SUM(profit >= 0) AS greens, "
+            f"SUM(stake) AS stake, SUM(profit) AS profit "
+            f"FROM ({' UNION ALL '.join(partes)}) GROUP BY {', '.join(indice)}"
+        )
+        df = pd.read_sql_query(consulta, self.conexao, params=parametros)
+        df = df.astype({'mercados': 'int64', 'greens': 'int64', 'stake': 'float64', 'profit': 'float64'})
+        if por_mes:
+            return df.set_index(indice)
+        return nomear_indice(df.set_index(indice), self.dicionarios.get(dimensao))
+
+    def total(self, dimensao, nome, inicio=None, fim=None):
+        """Mercados, greens, stake e profit de um só nome no período (uma consulta pelos índices das colunas)"""
+        id_nome = self.dicionarios[dimensao].procurar(nome)
+        colunas = [COLUNAS_SQL[coluna] for coluna, dim in COLUNAS_CATEGORIA.items() if dim == dimensao]
+        filtro, parametros = _filtro_sql(
+            inicio, fim, [f"({' OR '.join(f'{coluna} = ?' for coluna in colunas)})"], [id_nome] * len(colunas)
+        )
+        mercados, greens, stake, profit = self.conexao.execute(
+            f"SELECT COUNT(*), SUM(profit >= 0), SUM(stake), SUM(profit) FROM jogos{filtro}", parametros
+        ).fetchone()
+        return {'mercados': mercados, 'greens': greens or 0, 'stake': stake or 0.0, 'profit': profit or 0.0}
+
+
+def _abrir_sqlite(caminho=None, so_leitura=False):
+    """Abre a base SQLite (usada por várias execuções do script, em threads diferentes) e cria o esquema"""
+    caminho = caminho or SQLITE_FILE
+    if so_leitura:
+        # Sem criar nem migrar o esquema; com o WAL lê-se enquanto a aplicação escreve
+        return sqlite3.connect(f"{Path(caminho).absolute().as_uri()}?mode=ro", uri=True, check_same_thread=False)
+    conexao = sqlite3.connect(caminho, check_same_thread=False)
+    conexao.execute("PRAGMA journal_mode=WAL")
+    conexao.execute("PRAGMA synchronous=NORMAL")
+    colunas = [linha[1] for linha in conexao.execute("PRAGMA table_info(jogos)")]
+    if 'competicao' in colunas:
+        _migrar_nomes_sqlite(conexao)
+    conexao.executescript(ESQUEMA_SQL)
+    return conexao
+
+
+def _migrar_nomes_sqlite(conexao):
+    """Converte uma base com os nomes nas colunas dos jogos para IDs e a tabela nomes, numa só transação"""
+    antigas = {coluna: coluna_sql.removesuffix('_id') for coluna, coluna_sql in COLUNAS_SQL.items()}
+    jogos = pd.read_sql_query(f"SELECT id, {', '.join(antigas.values())} FROM jogos", conexao)
+    jogos.columns = ['ID'] + list(antigas)
+    dicionarios = criar_dicionarios()
+    jogos = tipar_ledger(jogos.set_index('ID'), dicionarios).reset_index()
+    conexao.execute("BEGIN")
+    try:
+        conexao.execute("DROP TABLE jogos")
+        for comando in ESQUEMA_SQL.split(';'):
+            if comando.strip():
+                conexao.execute(comando)
+        ledger = LedgerSQLite(conexao, dicionarios)
+        ledger.adicionar(jogos.set_index('ID'))
+        _gravar_nomes_sql(conexao, dicionarios, todos=True)
+        conexao.execute("INSERT OR REPLACE INTO meta (chave, valor) VALUES ('versao', ?)", (VERSAO_FORMATO,))
+        conexao.commit()
+    except Exception:
+        conexao.rollback()
+        raise
+
+
+def _gravar_nomes_sql(conexao, dicionarios, todos=False):
+    """Grava os nomes criados ou renomeados (ou todos) dentro da transação aberta"""
+    for dimensao, dicionario in dicionarios.items():
+        ids = range(len(dicionario)) if todos else sorted(dicionario.alterados)
+        conexao.executemany(
+            "INSERT OR REPLACE INTO nomes (dimensao, id, nome) VALUES (?, ?, ?)",
+            [(dimensao, id_nome, dicionario.nomes[id_nome]) for id_nome in ids]
+        )
+
+
+def _gravar_tabela_sql(conexao, dados, tabela):
+    """Reescreve uma tabela de entidades (são pequenas) dentro da transação aberta"""
+    colunas = TABELAS_SQL[tabela]
+    if tabela == 'tags':
+        linhas = [(posicao, nome) for posicao, nome in enumerate(dados['tags'])]
+    else:
+        df = dados[tabela].reindex(columns=list(colunas))
+        linhas = [
+            (posicao, *map(convert_numpy_types, valores))
+            for posicao, valores in enumerate(df.itertuples(index=False))
+        ]
+    conexao.execute(f"DELETE FROM {tabela}")
+    conexao.executemany(
+        f"INSERT INTO {tabela} (posicao, {', '.join(colunas.values())}) VALUES ({', '.join('?' * (len(colunas) + 1))})",
+        linhas
+    )
+
+
+def _gravar_sqlite(dados, operacoes):
+    """Confirma numa transação os jogos já escritos pelas operações, as entidades alteradas e o seq"""
+    conexao = dados['jogos'].conexao
+    try:
+        if operacoes:
+            gravado = conexao.execute("SELECT valor FROM meta WHERE chave = 'seq'").fetchone()
+            _verificar_seq(gravado and int(gravado[0]), dados['seq'] - len(operacoes))
+            tabelas = {
+                'tags' if op['entidade'] == 'tag' else TABELAS_ENTIDADE[op['entidade']]
+                for op in operacoes if op['entidade'] != 'jogo'
+            }
+        else:
+            tabelas = set(TABELAS_SQL)
+        for tabela in tabelas:
+            _gravar_tabela_sql(conexao, dados, tabela)
+        _gravar_nomes_sql(conexao, dados['dicionarios'], todos=not operacoes)
+        conexao.executemany("INSERT OR REPLACE INTO meta (chave, valor) VALUES (?, ?)", [
+            ('versao', VERSAO_FORMATO), ('proximo_id', int(dados['proximo_id'])), ('seq', int(dados['seq']))
+        ])
+        conexao.commit()
+    except Exception:
+        conexao.rollback()
+        raise
+    for dicionario in dados['dicionarios'].values():
+        dicionario.alterados.clear()
+
+
+def _carregar_sqlite(so_leitura=False):
+    """Lê as entidades da base SQLite; os jogos ficam na base e são consultados quando precisos"""
+    conexao = _abrir_sqlite(so_leitura=so_leitura)
+    meta = dict(conexao.execute("SELECT chave, valor FROM meta").fetchall())
+    if not meta:
+        # Base nova: começa com a estrutura vazia (e as tags padrão)
+        dados = criar_estrutura_vazia()
+        dicionarios = dados['dicionarios']
+        dados['jogos'], dados['resumo'] = LedgerSQLite(conexao, dicionarios), ResumoSQLite(conexao, dicionarios)
+        if not so_leitura:
+            _gravar_sqlite(dados, ())
+        return dados
+
+    dados = {
+        tabela: pd.read_sql_query(
+            f"SELECT {', '.join(colunas.values())} FROM {tabela} ORDER BY posicao", conexao
+        ).set_axis(list(colunas), axis=1)
+        for tabela, colunas in TABELAS_SQL.items()
+    }
+    dados['tags'] = dados['tags']['Nome'].tolist()
+    nomes = {dimensao: [] for dimensao in DIMENSOES}
+    for dimensao, nome in conexao.execute("SELECT dimensao, nome FROM nomes ORDER BY dimensao, id"):
+        nomes[dimensao].append(nome)
+    dicionarios = dados['dicionarios'] = criar_dicionarios(nomes)
+    contagem = dict(conexao.execute("SELECT competicao_id, COUNT(*) FROM jogos GROUP BY competicao_id").fetchall())
+    ids = dados['campeonatos']['Nome'].map(dicionarios['campeonato'].procurar)
+    dados['campeonatos']['Jogos'] = ids.map(contagem).fillna(0).astype(int)
+    dados['jogos'], dados['resumo'] = LedgerSQLite(conexao, dicionarios), ResumoSQLite(conexao, dicionarios)
+    dados['proximo_id'], dados['seq'] = meta.get('proximo_id', 0), meta.get('seq', 0)
+    return dados
+
+
+def migrar_para_sqlite(avisar=_avisar_no_registo):
+    """Converte o arquivo JSON (e o seu journal) para a base SQLite, uma única vez"""
+    dados = _ler_json_completo(avisar)
+    temporario = f"{SQLITE_FILE}.tmp"
+    if os.path.exists(temporario):
+        os.remove(temporario)
+    conexao = _abrir_sqlite(temporario)
+    try:
+        ledger = LedgerSQLite(conexao, dados['dicionarios'])
+        ledger.adicionar(dados['jogos'].df_ids)
+        _gravar_sqlite({**dados, 'jogos': ledger}, ())
+    finally:
+        conexao.close()
+    os.replace(temporario, SQLITE_FILE)
+
+
+@medido('carregar')
+def carregar_dados(avisar=_avisar_no_registo, so_leitura=False):
+    """Carrega os dados do armazenamento em uso e reaplica o journal.
+
+    Os avisos e erros vão para `avisar(nivel, mensagem)`, com o nível do logging. Os dados trazem
+    'journal_linhas' (operações no journal) e, quando têm de ser regravados no formato atual,
+    'converter_formato' a True. Com `so_leitura` nada é escrito: sem migrações (lê-se o JSON que
+    seria migrado) e com a base SQLite aberta só para leitura.
+    """
+    if usar_sqlite():
+        try:
+            if not os.path.exists(SQLITE_FILE):
+                if so_leitura:
+                    return _ler_json_completo(avisar)
+                if os.path.exists(DATA_FILE) or _segmentos_journal(JOURNAL_FILE):
+                    with _trava_arquivos():
+                        migrar_para_sqlite(avisar)
+            return _carregar_sqlite(so_leitura)
+        except Exception as e:
+            avisar(logging.ERROR, f"Erro ao abrir a base SQLite: {str(e)}")
+            return None
+
+    if ARMAZENAMENTO == "colunar" and pa is None:
+        avisar(logging.WARNING, "pyarrow não está instalado; a usar o arquivo JSON.")
+
+    if usar_colunar():
+        if not os.path.exists(os.path.join(LEDGER_DIR, 'meta.json')) and (
+                os.path.exists(DATA_FILE) or _segmentos_journal(JOURNAL_FILE)):
+            if so_leitura:
+                return _ler_json_completo(avisar)
+            try:
+                with _trava_arquivos():
+                    migrar_json_para_colunar(avisar)
+            except Exception as e:
+                avisar(logging.ERROR, f"Erro ao migrar os dados para o formato colunar: {str(e)}")
+                return None
+        dados = _carregar_colunar(avisar)
+    else:
+        dados = _carregar_json(avisar)
+    # O resumo passa a ser gravado com os dados; grava logo um snapshot que o inclua
+    converter = _garantir_resumo(dados)
+
+    journal = _caminho_journal()
+    if _segmentos_journal(journal):
+        if dados is None:
+            dados = criar_estrutura_vazia()
+        try:
+            dados['journal_linhas'] = reproduzir_journal(dados, journal)
+        except Exception as e:
+            avisar(logging.ERROR, f"Erro ao reaplicar o journal: {str(e)}")
+
+    if dados is not None and 'mensal' in dados:
+        # Formato antigo: converte para o ledger e grava logo um snapshot no formato novo
+        converter_mensal(dados)
+        converter = True
+    if converter:
+        dados['converter_formato'] = True
+    return dados
+
+
+def _concluir_compactacao(snapshot, segmento):
+    """Grava o snapshot e apaga o segmento de journal que ele já inclui"""
+    try:
+        with _trava_arquivos():
+            _gravar_snapshot(snapshot)
+            if segmento:
+                os.remove(segmento)
+    except Exception:
+        # O segmento fica no disco e volta a ser reaplicado no próximo arranque
+        logger.exception("Erro ao compactar o journal")
+
+
+def compactar_dados(dados, em_segundo_plano=False):
+    """Compacta o journal num snapshot completo, agora ou numa thread em segundo plano"""
+    with _trava_persistencia(), _trava_arquivos():
+        journal = _caminho_journal()
+        try:
+            _verificar_seq(_ultimo_seq(journal), dados['seq'])
+        except DadosAlterados:
+            # Um snapshot destes dados perderia as operações da outra sessão
+            logger.warning("Compactação adiada: os dados foram alterados noutra sessão")
+            return
+        snapshot = _preparar_snapshot(dados)
+        segmento = None
+        if os.path.exists(journal):
+            # Novas operações passam a ir para um journal novo enquanto o snapshot é gravado
+            segmento = f"{journal}.{dados['seq']}"
+            os.replace(journal, segmento)
+        # O journal novo começa pelo seq do snapshot, para as outras sessões verem que ficaram para trás
+        os.makedirs(os.path.dirname(journal) or '.', exist_ok=True)
+        with open(journal, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'seq': dados['seq']}) + '\n')
+        dados['journal_linhas'] = 0
+
+    if em_segundo_plano:
+        threading.Thread(
+            target=_concluir_compactacao,
+            args=(snapshot, segmento),
+            daemon=True
+        ).start()
+    else:
+        _concluir_compactacao(snapshot, segmento)
+
+
+@medido('gravar')
+def salvar_dados(dados, *operacoes):
+    """Salva os dados: acrescenta as operações ao journal ou reescreve o snapshot completo"""
+    if usar_sqlite():
+        # Cada chamada é uma transação: os jogos já escritos pelas operações e as entidades alteradas
+        dados['seq'] += len(operacoes)
+        tamanho = _tamanho_sqlite() if PERFIL_ATIVO else 0
+        with _trava_persistencia():
+            _gravar_sqlite(dados, operacoes)
+        contar_gravacao(max(_tamanho_sqlite() - tamanho, 0) if PERFIL_ATIVO else 0)
+        return
+
+    if MODO_PERSISTENCIA != "journal" or not operacoes:
+        for op in operacoes:
+            dados['seq'] += 1
+        with _trava_persistencia(), _trava_arquivos():
+            contar_gravacao(_gravar_snapshot(_preparar_snapshot(dados)))
+        return
+
+    with _trava_persistencia(), _trava_arquivos():
+        # Os seq (e os IDs dos jogos, tirados de proximo_id) só valem se nenhuma outra sessão
+        # tiver escrito desde que estes dados foram carregados; o fim do journal diz qual foi o último
+        journal = _caminho_journal()
+        _verificar_seq(_ultimo_seq(journal), dados['seq'])
+        linhas = []
+        for op in operacoes:
+            dados['seq'] += 1
+            linhas.append(json.dumps({**op, 'seq': dados['seq']}, default=json_converter, ensure_ascii=False))
+        texto = '\n'.join(linhas) + '\n'
+        if usar_colunar():
+            os.makedirs(LEDGER_DIR, exist_ok=True)
+        with open(journal, 'a', encoding='utf-8') as f:
+            f.write(texto)
+            f.flush()
+            os.fsync(f.fileno())
+    contar_gravacao(len(texto.encode('utf-8')))
+
+    dados['journal_linhas'] = dados.get('journal_linhas', 0) + len(linhas)
+    if dados['journal_linhas'] >= COMPACTAR_APOS:
+        compactar_dados(dados, em_segundo_plano=True)
+
+
+def descartar_alteracoes(dados):
+    """Desfaz as escritas ainda por confirmar (jogos do SQLite) antes de os dados serem recarregados"""
+    if isinstance(dados.get('jogos'), LedgerSQLite):
+        dados['jogos'].conexao.rollback()
+
+
+def registrar(dados, *operacoes):
+    """Aplica as operações aos dados em memória e persiste-as"""
+    if not operacoes:
+        return
+    for op in operacoes:
+        aplicar_operacao(dados, op)
+    salvar_dados(dados, *operacoes)
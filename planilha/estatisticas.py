@@ -0,0 +1,345 @@
+"""Estatísticas lidas do resumo, análise de risco e intervalos de confiança do ROI (bootstrap)"""
+import logging
+import multiprocessing
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from planilha.modelo import COLUNAS_CATEGORIA, MESES, convert_numpy_types
+from planilha.perfil import medido
+
+logger = logging.getLogger(__name__)
+
+# Nome de cada coluna de estatísticas, pela ordem de apresentação
+COLUNAS_STATS_EQUIPA = {
+    'mercados': 'Mercados', 'greens': 'Greens', 'reds': 'Reds',
+    'stake': 'Stake Total', 'profit': 'Profit/Loss', 'roi': 'ROI (%)'
+}
+COLUNAS_STATS_CAMPEONATO = {
+    'mercados': 'total_jogos', 'stake': 'total_stake', 'profit': 'total_profit',
+    'greens': 'greens', 'reds': 'reds', 'roi': 'roi'
+}
+
+
+COLUNAS_STATS_DESEMPENHO = {
+    'profit': 'Profit Total', 'stake': 'Stake Total', 'roi': 'ROI (%)', 'greens': 'Greens', 'reds': 'Reds'
+}
+
+
+# Mês em que começa cada época desportiva (agosto a julho)
+MES_INICIO_EPOCA = 8
+
+
+def opcoes_periodo(ledger):
+    """Períodos selecionáveis: todos os anos, cada ano e cada época com jogos (mais o ano atual)"""
+    hoje = datetime.now()
+    chaves = ledger.meses_com_jogos() | {(hoje.year, hoje.month)}
+    opcoes = {"Todos os anos": (None, None)}
+    for ano in sorted({ano for ano, _ in chaves}, reverse=True):
+        opcoes[str(ano)] = (pd.Timestamp(ano, 1, 1), pd.Timestamp(ano + 1, 1, 1))
+    epocas = {ano if mes >= MES_INICIO_EPOCA else ano - 1 for ano, mes in chaves}
+    for ano in sorted(epocas, reverse=True):
+        opcoes[f"Época {ano}/{(ano + 1) % 100:02d}"] = (
+            pd.Timestamp(ano, MES_INICIO_EPOCA, 1), pd.Timestamp(ano + 1, MES_INICIO_EPOCA, 1)
+        )
+    return opcoes
+
+
+def completar_stats(totais, colunas):
+    """Acrescenta Reds e ROI aos totais de cada chave e devolve as colunas pedidas, já com o nome de apresentação"""
+    agrupado = totais.copy()
+    agrupado['reds'] = agrupado['mercados'] - agrupado['greens']
+    agrupado['roi'] = (agrupado['profit'] / agrupado['stake'].where(agrupado['stake'] > 0) * 100).fillna(0.0)
+    agrupado = agrupado[list(colunas)].rename(columns=colunas)
+    agrupado.index.name = None
+    return agrupado
+
+
+@medido('agregar')
+def calcular_stats_agrupados(dados, inicio=None, fim=None):
+    """Estatísticas de todas as equipas e campeonatos no período, lidas do resumo (sem percorrer os jogos)"""
+    resumo = dados['resumo']
+    return {
+        'equipas': completar_stats(resumo.tabela('equipa', inicio, fim), COLUNAS_STATS_EQUIPA),
+        'campeonatos': completar_stats(resumo.tabela('campeonato', inicio, fim), COLUNAS_STATS_CAMPEONATO)
+    }
+
+
+def _stats_de(total, colunas):
+    """Acrescenta Reds e ROI aos totais de uma só entidade (zeros se não tiver jogos), com o nome de apresentação"""
+    stats = {**total, 'reds': total['mercados'] - total['greens']}
+    stats['roi'] = stats['profit'] / stats['stake'] * 100 if stats['stake'] > 0 else 0.0
+    return {nome: convert_numpy_types(stats[campo]) for campo, nome in colunas.items()}
+
+
+@medido('agregar')
+def calcular_stats_campeonato(dados, nome_campeonato, inicio=None, fim=None):
+    """Calculate statistics for a specific championship"""
+    return _stats_de(dados['resumo'].total('campeonato', nome_campeonato, inicio, fim), COLUNAS_STATS_CAMPEONATO)
+
+
+@medido('agregar')
+def calcular_stats_equipa(dados, nome_equipa, inicio=None, fim=None):
+    """Calculate statistics for a specific team"""
+    return _stats_de(dados['resumo'].total('equipa', nome_equipa, inicio, fim), COLUNAS_STATS_EQUIPA)
+
+
+@medido('agregar')
+def calcular_stats_por(dados, coluna, inicio=None, fim=None):
+    """Profit/Stake/ROI/Greens/Reds de cada nome de uma coluna (Estrategia, Tag...) com jogos no período"""
+    return completar_stats(dados['resumo'].tabela(COLUNAS_CATEGORIA[coluna], inicio, fim), COLUNAS_STATS_DESEMPENHO)
+
+
+def calcular_desempenho_mensal(dados, inicio=None, fim=None):
+    """Stake, Profit e ROI de cada mês (ano e mês) com jogos no período, com uma linha TOTAL no fim"""
+    mensal = dados['resumo'].tabela('mes', inicio, fim, por_mes=True)
+    meses = [f"{MESES[mes - 1]} {ano}" for ano, mes in mensal.index]
+
+    performance = pd.DataFrame({
+        'Mês': meses + ['TOTAL'],
+        'Stake Total': np.append(mensal['stake'].values, mensal['stake'].sum()),
+        'Profit Total': np.append(mensal['profit'].values, mensal['profit'].sum())
+    })
+    stake = performance['Stake Total'].where(performance['Stake Total'] != 0)
+    performance['ROI (%)'] = (performance['Profit Total'] / stake * 100).fillna(0.0)
+    return performance
+
+
+def metricas_jogos(jogos):
+    """Stake, Profit, ROI, dias e mercados green/red de um conjunto de jogos (green é um resultado >= 0)"""
+    por_dia = jogos.groupby('Data')['Profit/Loss'].sum()
+    dias_green = int((por_dia >= 0).sum())
+    mercados_green = int((jogos['Profit/Loss'] >= 0).sum())
+    stake = float(jogos['Stake'].sum())
+    profit = float(jogos['Profit/Loss'].sum())
+    return {
+        'stake': stake, 'profit': profit, 'roi': profit / stake * 100 if stake != 0 else 0,
+        'dias': len(por_dia), 'dias_green': dias_green, 'dias_red': len(por_dia) - dias_green,
+        'mercados': len(jogos), 'mercados_green': mercados_green, 'mercados_red': len(jogos) - mercados_green
+    }
+
+
+def resultados_por(jogos, coluna):
+    """Profit/Loss, Stake e ROI dos jogos agrupados por uma coluna (Data, Estrategia...)"""
+    resultados = jogos.groupby(coluna, observed=True).agg({'Profit/Loss': 'sum', 'Stake': 'sum'}).reset_index()
+    resultados['ROI'] = (resultados['Profit/Loss'] / resultados['Stake']) * 100
+    return resultados
+
+
+# Janelas (em dias) do ROI móvel
+JANELAS_ROI = (7, 30)
+
+# Colunas pelas quais a análise de risco pode agrupar os jogos ('Equipa' junta Casa e Visitante)
+GRUPOS_RISCO = {'Estratégia': 'Estrategia', 'Tag': 'Tag', 'Competição': 'Competição', 'Equipa': 'Equipa'}
+
+
+def _por_grupo(jogos, coluna):
+    """Código do grupo de cada jogo, nomes dos grupos e as colunas dos jogos como arrays (dia, stake, profit, ID).
+
+    Com 'Equipa' cada jogo conta para as duas equipas (uma só vez se forem a mesma).
+    """
+    colunas = [
+        jogos['Data'].to_numpy().astype('datetime64[D]').astype(np.int64),
+        jogos['Stake'].to_numpy(dtype=float),
+        jogos['Profit/Loss'].to_numpy(dtype=float),
+        jogos.index.to_numpy(dtype=np.int64),
+    ]
+    if coluna is None:
+        return np.zeros(len(jogos), dtype=np.int64), pd.Index(['Total']), *colunas
+    if coluna != 'Equipa':
+        valores = jogos[coluna].astype('category')
+        return valores.cat.codes.to_numpy(dtype=np.int64), valores.cat.categories, *colunas
+
+    casa, visitante = jogos['Casa'].astype('category'), jogos['Visitante'].astype('category')
+    nomes = casa.cat.categories.union(visitante.cat.categories)
+    casa = casa.cat.set_categories(nomes).cat.codes.to_numpy(dtype=np.int64)
+    visitante = visitante.cat.set_categories(nomes).cat.codes.to_numpy(dtype=np.int64)
+    fora = visitante != casa
+    return (np.concatenate([casa, visitante[fora]]), nomes,
+            *(np.concatenate([coluna_jogos, coluna_jogos[fora]]) for coluna_jogos in colunas))
+
+
+def analisar_risco(jogos, coluna=None, banca_inicial=0.0):
+    """Curva da banca, drawdown, séries de greens/reds e ROI móvel, no total ou por cada nome de uma coluna.
+
+    Tudo é calculado sobre os jogos ordenados por (grupo, data, ID) com operações vetoriais: cumsum e
+    cummax por grupo para a banca e o seu pico, maximum.accumulate para o último pico, reduceat por
+    grupo e searchsorted para as janelas do ROI móvel. Devolve a curva (último valor de cada dia
+    de cada grupo) e a tabela de métricas por grupo.
+    """
+    codigos, nomes, dias, stake, profit, ids = _por_grupo(jogos, coluna)
+    n = len(codigos)
+    if n == 0:
+        return pd.DataFrame(columns=['Grupo', 'Data', 'Banca', 'Pico', 'Drawdown']), pd.DataFrame()
+
+    # Uma só chave inteira (grupo, dia), com folga entre grupos para as janelas do ROI móvel; a ordenação
+    # estável mantém a ordem dos IDs dentro de cada dia (o ledger já vem quase sempre por ID)
+    primeiro_dia = dias.min()
+    extensao = dias.max() - primeiro_dia + max(JANELAS_ROI) + 1
+    chave = codigos * extensao + (dias - primeiro_dia)
+    ordem = np.arange(n) if (ids[1:] >= ids[:-1]).all() else np.argsort(ids, kind='stable')
+    ordem = ordem[np.argsort(chave[ordem], kind='stable')]
+    chave, dias, stake, profit = chave[ordem], dias[ordem], stake[ordem], profit[ordem]
+    codigos = chave // extensao
+
+    inicio = np.ones(n, dtype=bool)
+    inicio[1:] = codigos[1:] != codigos[:-1]
+    inicios = np.flatnonzero(inicio)
+    fins = np.append(inicios[1:], n) - 1
+    grupo = np.cumsum(inicio) - 1
+
+    # Soma e máximo acumulados que recomeçam em cada grupo (o pico nunca fica abaixo da banca inicial)
+    lucro = pd.Series(profit).groupby(grupo).cumsum().to_numpy()
+    banca = banca_inicial + lucro
+    pico = np.maximum(pd.Series(banca).groupby(grupo).cummax().to_numpy(), banca_inicial)
+    drawdown = pico - banca
+
+    # Duração do drawdown: dias desde o último pico (ou desde o primeiro jogo do grupo)
+    ultimo_pico = np.maximum.accumulate(np.where((drawdown <= 0) | inicio, np.arange(n), 0))
+    duracao = dias - dias[ultimo_pico]
+
+    # Séries: troços seguidos de jogos green (profit >= 0, como no resto da planilha) ou red dentro do grupo
+    sinal = np.where(profit >= 0, 1, -1).astype(np.int8)
+    novo_troco = inicio.copy()
+    novo_troco[1:] |= sinal[1:] != sinal[:-1]
+    inicio_troco = np.flatnonzero(novo_troco)
+    tamanho = np.diff(np.append(inicio_troco, n))
+    series = {}
+    for nome, valor in (('green', 1), ('red', -1)):
+        maior = np.zeros(len(inicios), dtype=np.int64)
+        np.maximum.at(maior, grupo[inicio_troco], np.where(sinal[inicio_troco] == valor, tamanho, 0))
+        series[nome] = maior
+
+    # ROI móvel: somas na janela (dia - janela, dia] a partir das acumuladas, com o início da janela
+    # encontrado por searchsorted na chave (grupo, dia) ordenada
+    soma_profit = np.concatenate(([0.0], np.cumsum(profit)))
+    soma_stake = np.concatenate(([0.0], np.cumsum(stake)))
+    roi_movel = {}
+    for janela in JANELAS_ROI:
+        primeiro = np.searchsorted(chave, chave - janela + 1, side='left')
+        stake_janela = soma_stake[1:] - soma_stake[primeiro]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            roi_movel[janela] = np.where(
+                stake_janela > 0, (soma_profit[1:] - soma_profit[primeiro]) / stake_janela * 100, 0.0
+            )
+
+    stake_total = np.add.reduceat(stake, inicios)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        drawdown_pct = np.where(pico > 0, drawdown / pico * 100, 0.0)
+        roi = np.where(stake_total > 0, lucro[fins] / stake_total * 100, 0.0)
+    metricas = pd.DataFrame({
+        'Jogos': np.diff(np.append(inicios, n)),
+        'Stake Total': stake_total,
+        'Profit/Loss': lucro[fins],
+        'ROI (%)': roi,
+        'Max Drawdown': np.maximum.reduceat(drawdown, inicios),
+        'Max Drawdown (%)': np.maximum.reduceat(drawdown_pct, inicios),
+        'Duração Max DD (dias)': np.maximum.reduceat(duracao, inicios),
+        'Maior Série Green': series['green'],
+        'Maior Série Red': series['red'],
+        **{f'ROI {janela}d (%)': roi_movel[janela][fins] for janela in JANELAS_ROI},
+    }, index=nomes[codigos[inicios]])
+
+    # A curva fica com o último jogo de cada dia de cada grupo
+    fim_dia = np.ones(n, dtype=bool)
+    fim_dia[:-1] = chave[1:] != chave[:-1]
+    curva = pd.DataFrame({
+        'Grupo': pd.Categorical.from_codes(codigos[fim_dia], categories=nomes),
+        'Data': dias[fim_dia].astype('datetime64[D]').astype('datetime64[ns]'),
+        'Banca': banca[fim_dia],
+        'Pico': pico[fim_dia],
+        'Drawdown': -drawdown[fim_dia],
+        **{f'ROI {janela}d (%)': roi_movel[janela][fim_dia] for janela in JANELAS_ROI},
+    })
+    return curva, metricas
+
+
+# Reamostragens do bootstrap do ROI e nível de confiança dos intervalos
+REAMOSTRAGENS_BOOTSTRAP = 1000
+NIVEL_CONFIANCA = 0.95
+
+# Sorteios (jogos x reamostragens) a partir dos quais o bootstrap corre num conjunto de processos
+SORTEIOS_PROCESSOS = 20_000_000
+
+# Elementos de cada matriz de índices reamostrados, para a memória não crescer com o tamanho do grupo
+ELEMENTOS_POR_MATRIZ = 4_000_000
+
+# Colunas com intervalos de confiança do ROI
+COLUNAS_BOOTSTRAP = ('Estrategia', 'Tag', 'Competição')
+
+
+def _bootstrap_grupo(stake, profit, reamostragens, semente):
+    """Intervalo de confiança (percentis) do ROI de um grupo de jogos e probabilidade de ROI positivo.
+
+    Cada lote de reamostragens é uma matriz de índices (reamostragens x jogos) sorteada de uma vez.
+    """
+    jogos = len(stake)
+    gerador = np.random.default_rng(semente)
+    por_matriz = max(1, ELEMENTOS_POR_MATRIZ // jogos)
+    rois = []
+    for feitas in range(0, reamostragens, por_matriz):
+        indices = gerador.integers(0, jogos, size=(min(por_matriz, reamostragens - feitas), jogos))
+        soma_stake = stake[indices].sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rois.append(np.where(soma_stake > 0, profit[indices].sum(axis=1) / soma_stake * 100, 0.0))
+    rois = np.concatenate(rois)
+    cauda = (1 - NIVEL_CONFIANCA) / 2
+    inferior, superior = np.quantile(rois, [cauda, 1 - cauda])
+    return float(inferior), float(superior), float((rois > 0).mean() * 100)
+
+
+def _executar_bootstrap(tarefas):
+    """Corre as tarefas (stake, profit, reamostragens, semente) num conjunto de processos quando o trabalho
+    o justifica; se o conjunto falhar corre-as uma a uma"""
+    sorteios = sum(len(stake) * reamostragens for stake, _, reamostragens, _ in tarefas)
+    processos = min(len(tarefas), os.cpu_count() or 1)
+    if processos > 1 and sorteios >= SORTEIOS_PROCESSOS:
+        try:
+            # Sem fork: o processo da aplicação tem várias threads (e travas) que um fork copiaria a meio.
+            # O forkserver arranca já com este módulo importado; no Windows só há spawn
+            if 'forkserver' in multiprocessing.get_all_start_methods():
+                contexto = multiprocessing.get_context('forkserver')
+                contexto.set_forkserver_preload([__name__])
+            else:
+                contexto = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=processos, mp_context=contexto) as executor:
+                return list(executor.map(_bootstrap_grupo, *zip(*tarefas)))
+        except Exception:
+            logger.exception("Erro no bootstrap em paralelo; a calcular sequencialmente")
+    return [_bootstrap_grupo(*tarefa) for tarefa in tarefas]
+
+
+def calcular_bootstrap(jogos, reamostragens=REAMOSTRAGENS_BOOTSTRAP):
+    """Intervalo de confiança do ROI e probabilidade de ROI positivo de cada estratégia, tag e competição.
+
+    A semente de cada grupo vem do seu nome, por isso os mesmos jogos dão sempre o mesmo intervalo.
+    """
+    stake = jogos['Stake'].to_numpy(dtype=float)
+    profit = jogos['Profit/Loss'].to_numpy(dtype=float)
+    tarefas, grupos = [], []
+    for coluna in COLUNAS_BOOTSTRAP:
+        valores = jogos[coluna].astype('category')
+        codigos = valores.cat.codes.to_numpy()
+        ordem = np.argsort(codigos, kind='stable')
+        limites = np.searchsorted(codigos[ordem], np.arange(len(valores.cat.categories) + 1))
+        for numero, nome in enumerate(valores.cat.categories):
+            linhas = ordem[limites[numero]:limites[numero + 1]]
+            if len(linhas):
+                semente = zlib.crc32(f"{coluna}:{nome}".encode('utf-8'))
+                tarefas.append((stake[linhas], profit[linhas], reamostragens, semente))
+                grupos.append((coluna, nome))
+
+    rotulos = [
+        f"IC {NIVEL_CONFIANCA:.0%} Inf (%)", f"IC {NIVEL_CONFIANCA:.0%} Sup (%)", "P(ROI > 0) (%)"
+    ]
+    linhas = {coluna: {} for coluna in COLUNAS_BOOTSTRAP}
+    for (coluna, nome), resultado in zip(grupos, _executar_bootstrap(tarefas)):
+        linhas[coluna][nome] = resultado
+    return {
+        coluna: pd.DataFrame.from_dict(linhas[coluna], orient='index', columns=rotulos)
+        for coluna in COLUNAS_BOOTSTRAP
+    }
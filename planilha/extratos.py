@@ -0,0 +1,420 @@
+"""Lotes de jogos, importação de extratos (CSV/XLSX) e exportação de jogos e estatísticas"""
+import importlib.util
+import io
+import itertools
+import json
+import tempfile
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from planilha.estatisticas import COLUNAS_STATS_EQUIPA, completar_stats
+from planilha.modelo import (
+    COLUNAS_CATEGORIA, COLUNAS_JOGO, COLUNAS_VALOR, Registo, normalizar_nome, registo_entidade
+)
+
+# O pyarrow.parquet e o openpyxl (opcionais) só são importados ao exportar ou importar nesses formatos,
+# para não pesarem no arranque de quem só usa o núcleo
+
+
+def _canonizar_lote(registo, df, colunas):
+    """Troca os nomes do lote pelos nomes registados e devolve os nomes novos (sem duplicados entre si)"""
+    novos = Registo()
+    canonicos = {}
+    for nome in pd.unique(df[colunas].values.ravel()):
+        canonicos[nome] = registo.procurar(nome) or novos.adicionar(nome)
+    for coluna in colunas:
+        df[coluna] = df[coluna].map(canonicos)
+    return [nome for nome in pd.unique(df[colunas].values.ravel()) if nome and registo.procurar(nome) is None]
+
+
+def preparar_lote_jogos(jogos, primeira=1, descartar_invalidos=False):
+    """Valida um lote de jogos e calcula a % Stake; devolve o DataFrame e a lista de erros
+
+    Os jogos são numerados a partir de `primeira` nas mensagens. Com `descartar_invalidos`
+    os jogos com erros são retirados do DataFrame em vez de invalidarem o lote.
+    """
+    df = pd.DataFrame(jogos).reindex(columns=COLUNAS_JOGO)
+    df.index = pd.RangeIndex(primeira, primeira + len(df))
+
+    for coluna in COLUNAS_CATEGORIA:
+        df[coluna] = df[coluna].fillna('').astype(str).str.strip()
+    datas = pd.to_datetime(df['Data'], errors='coerce')
+    df['Stake'] = pd.to_numeric(df['Stake'], errors='coerce')
+    df['Profit/Loss'] = pd.to_numeric(df['Profit/Loss'], errors='coerce')
+
+    # Linhas sem nenhuma equipa são ignoradas
+    df = df[(df['Casa'] != '') | (df['Visitante'] != '')]
+    datas = datas[df.index]
+
+    verificacoes = [
+        (datas.isna(), "Data inválida"),
+        (df['Competição'] == '', "Competição em falta"),
+        (df['Estrategia'] == '', "Estratégia em falta"),
+        ((df['Casa'] == '') | (df['Visitante'] == ''), "Equipa Casa e Visitante são obrigatórias"),
+        (~(df['Stake'] > 0), "Stake deve ser maior que zero"),
+        (df['Profit/Loss'].isna(), "Profit/Loss inválido"),
+    ]
+    erros = [
+        f"{mensagem} ({_listar_jogos(df.index[mascara])})"
+        for mascara, mensagem in verificacoes if mascara.any()
+    ]
+
+    if descartar_invalidos and erros:
+        validos = ~np.logical_or.reduce([mascara.to_numpy() for mascara, _ in verificacoes])
+        df, datas = df[validos], datas[validos]
+
+    df['Data'] = datas.dt.date
+    df['% Stake'] = df['Profit/Loss'] / df['Stake'] * 100
+    return df.reset_index(drop=True), erros
+
+
+def _listar_jogos(numeros, maximo=10):
+    """Números dos jogos de uma mensagem de erro, só os primeiros quando são muitos"""
+    texto = ', '.join(map(str, numeros[:maximo]))
+    if len(numeros) > maximo:
+        texto += f" e mais {len(numeros) - maximo}"
+    return f"jogo {texto}"
+
+
+def operacoes_lote(dados, df):
+    """Operações que inserem um lote já validado, com as equipas, campeonatos, estratégias e tags novos
+    registados antes"""
+    operacoes = []
+
+    equipas_novas = _canonizar_lote(registo_entidade(dados, 'equipa'), df, ['Casa', 'Visitante'])
+    if equipas_novas:
+        operacoes.append({
+            'entidade': 'equipa', 'acao': 'adicionar',
+            'registros': [{'Nome': nome} for nome in equipas_novas]
+        })
+
+    campeonatos_novos = _canonizar_lote(registo_entidade(dados, 'campeonato'), df, ['Competição'])
+    if campeonatos_novos:
+        operacoes.append({
+            'entidade': 'campeonato', 'acao': 'adicionar',
+            'registros': [{'Nome': nome, 'Temporada': datetime.now().year, 'Jogos': 0} for nome in campeonatos_novos]
+        })
+
+    estrategias_novas = _canonizar_lote(registo_entidade(dados, 'estrategia'), df, ['Estrategia'])
+    if estrategias_novas:
+        operacoes.append({
+            'entidade': 'estrategia', 'acao': 'adicionar',
+            'registros': [{'Nome': nome, 'Descrição': '', 'Equipa': '', 'Tags': ''} for nome in estrategias_novas]
+        })
+
+    # As tags são uma lista simples, sem registo mantido; um jogo sem tag fica sem tag
+    for nome in _canonizar_lote(Registo(dados['tags']), df, ['Tag']):
+        operacoes.append({'entidade': 'tag', 'acao': 'adicionar', 'nome': nome})
+
+    # Os IDs são atribuídos aqui para que o journal reproduza exatamente os mesmos jogos;
+    # os jogos vão por colunas, que é mais compacto no journal para lotes grandes
+    df.insert(0, 'ID', range(dados['proximo_id'], dados['proximo_id'] + len(df)))
+    operacoes.append({'entidade': 'jogo', 'acao': 'adicionar', 'jogos': df.to_dict('list')})
+    return operacoes
+
+
+# Linhas do extrato lidas e validadas de cada vez durante a importação
+LINHAS_POR_BLOCO = 10000
+
+# Mapeamento de colunas e opções da última importação, reutilizado na seguinte
+MAPEAMENTO_FILE = "mapeamento_importacao.json"
+
+# Campos preenchidos pela importação e nomes de coluna reconhecidos para cada um (comparados normalizados);
+# 'Evento' é a alternativa a Casa/Visitante quando o extrato traz "Casa v Visitante" numa só coluna
+CAMPOS_IMPORTACAO = {
+    'Data': ['data', 'date', 'settled date', 'data de liquidacao'],
+    'Competição': ['competicao', 'competition', 'campeonato', 'liga', 'league'],
+    'Casa': ['casa', 'home', 'equipa casa'],
+    'Visitante': ['visitante', 'away', 'fora', 'equipa visitante'],
+    'Evento': ['evento', 'event', 'jogo', 'match', 'descricao', 'description'],
+    'Stake': ['stake', 'montante', 'valor apostado'],
+    'Profit/Loss': ['profit/loss', 'profit', 'p/l', 'lucro', 'resultado', 'ganho/perda'],
+    'Estrategia': ['estrategia', 'strategy'],
+    'Tag': ['tag'],
+}
+
+# Separadores entre as equipas numa coluna de evento ("Benfica v Porto", "Benfica vs. Porto", "Benfica - Porto")
+SEPARADOR_EVENTO = r'\s+(?:v|vs\.?|x|-)\s+'
+
+
+def carregar_mapeamento():
+    """Mapeamento guardado da última importação (vazio se ainda não houve nenhuma)"""
+    try:
+        with open(MAPEAMENTO_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def guardar_mapeamento(mapeamento):
+    with open(MAPEAMENTO_FILE, 'w', encoding='utf-8') as f:
+        json.dump(mapeamento, f, ensure_ascii=False, indent=2)
+
+
+def e_excel(nome):
+    return str(nome).lower().endswith(('.xlsx', '.xlsm'))
+
+
+def ler_extrato(origem, nome, separador=',', decimal='.', tamanho=LINHAS_POR_BLOCO):
+    """Lê o extrato em blocos de `tamanho` linhas, sem o carregar todo de uma vez.
+
+    O CSV é lido pelo pandas em chunks e o XLSX pelo openpyxl em modo só de leitura.
+    `origem` é um caminho ou um arquivo aberto (ex.: o carregado no Streamlit).
+    """
+    if hasattr(origem, 'seek'):
+        origem.seek(0)
+    if not e_excel(nome):
+        yield from pd.read_csv(
+            origem, sep=separador, decimal=decimal, chunksize=tamanho,
+            encoding='utf-8-sig', encoding_errors='replace', skipinitialspace=True
+        )
+        return
+
+    try:
+        import openpyxl
+    except ImportError:
+        raise ImportError("A importação de XLSX requer o openpyxl (pip install openpyxl)") from None
+    livro = openpyxl.load_workbook(origem, read_only=True, data_only=True)
+    try:
+        linhas = livro.active.iter_rows(values_only=True)
+        cabecalho = ['' if valor is None else str(valor).strip() for valor in next(linhas, ())]
+        inicio = 0
+        while True:
+            bloco = [linha[:len(cabecalho)] for linha in itertools.islice(linhas, tamanho)]
+            if not bloco:
+                break
+            yield pd.DataFrame(bloco, columns=cabecalho, index=pd.RangeIndex(inicio, inicio + len(bloco)))
+            inicio += len(bloco)
+    finally:
+        livro.close()
+
+
+def colunas_extrato(origem, nome, separador=','):
+    """Nomes das colunas do extrato, lendo só o cabeçalho"""
+    return list(next(ler_extrato(origem, nome, separador, tamanho=1), pd.DataFrame()).columns)
+
+
+def sugerir_coluna(campo, colunas):
+    """Coluna do extrato cujo nome (normalizado) é um dos reconhecidos para o campo, ou None"""
+    conhecidos = {normalizar_nome(nome) for nome in [campo] + CAMPOS_IMPORTACAO[campo]}
+    return next((coluna for coluna in colunas if normalizar_nome(coluna) in conhecidos), None)
+
+
+def mapear_extrato(bloco, colunas, fixos, dia_primeiro=True):
+    """Converte um bloco do extrato em jogos: cada campo vem da coluna mapeada ou do valor fixo"""
+    jogos = pd.DataFrame(index=bloco.index)
+    for campo, coluna in colunas.items():
+        if coluna:
+            jogos[campo] = bloco[coluna]
+
+    if 'Evento' in jogos:
+        equipas = jogos.pop('Evento').astype(str).str.split(SEPARADOR_EVENTO, n=1, expand=True, regex=True)
+        equipas = equipas.reindex(columns=[0, 1])
+        jogos['Casa'], jogos['Visitante'] = equipas[0], equipas[1]
+
+    # O valor fixo preenche o campo que não foi mapeado e as células vazias do que foi
+    for campo, valor in fixos.items():
+        jogos[campo] = jogos[campo].fillna(valor) if campo in jogos else valor
+
+    if 'Data' in jogos:
+        jogos['Data'] = _ler_datas(jogos['Data'], dia_primeiro)
+    return jogos
+
+
+def _ler_datas(valores, dia_primeiro):
+    """Datas do extrato: as ISO (2025-03-31) são lidas como tal e só as restantes seguem `dia_primeiro`"""
+    datas = pd.to_datetime(valores, errors='coerce', format='ISO8601')
+    resto = datas.isna() & valores.notna()
+    if resto.any():
+        datas[resto] = pd.to_datetime(valores[resto], errors='coerce', dayfirst=dia_primeiro)
+    return datas
+
+
+def hash_jogos(jogos):
+    """Hash de cada jogo pelos campos que o identificam: data, competição, equipas, stake e resultado.
+
+    Os nomes entram normalizados, como no registo, para 'Benfica' e 'benfica' serem o mesmo jogo.
+    """
+    chaves = pd.DataFrame({'Data': pd.to_datetime(jogos['Data']).dt.strftime('%Y-%m-%d')}, index=jogos.index)
+    for coluna in ('Competição', 'Casa', 'Visitante'):
+        nomes = jogos[coluna].astype(str)
+        chaves[coluna] = nomes.map({nome: normalizar_nome(nome) for nome in pd.unique(nomes)})
+    for coluna in ('Stake', 'Profit/Loss'):
+        # + 0.0 junta -0.0 e 0.0
+        chaves[coluna] = pd.to_numeric(jogos[coluna], errors='coerce').round(2) + 0.0
+    return pd.util.hash_pandas_object(chaves, index=False)
+
+
+def operacoes_extrato(dados, blocos, colunas, fixos, dia_primeiro=True):
+    """Operações que importam os jogos de um extrato lido em blocos, para registar numa só gravação.
+
+    Cada bloco é validado à parte e só os jogos aceites ficam em memória até ao fim. Os jogos
+    iguais a jogos já registados (ou repetidos no próprio extrato) são ignorados pelo hash.
+    Devolve (operações, importados, repetidos, linhas inválidas ou vazias, erros).
+    """
+    vistos = set(hash_jogos(dados['jogos'].df)) if len(dados['jogos']) else set()
+    aceites, repetidos, invalidos, erros = [], 0, 0, []
+    linha = 2  # Linha do arquivo da primeira linha de dados, a seguir ao cabeçalho
+
+    for bloco in blocos:
+        jogos = mapear_extrato(bloco, colunas, fixos, dia_primeiro)
+        df, erros_bloco = preparar_lote_jogos(jogos, primeira=linha, descartar_invalidos=True)
+        linha += len(bloco)
+        invalidos += len(jogos) - len(df)
+        erros += erros_bloco
+        if df.empty:
+            continue
+
+        hashes = hash_jogos(df)
+        novos = ~(hashes.isin(vistos) | hashes.duplicated())
+        vistos.update(hashes[novos])
+        repetidos += int((~novos).sum())
+        aceites.append(df[novos.to_numpy()])
+
+    if not aceites:
+        return [], 0, repetidos, invalidos, erros
+    df = pd.concat(aceites, ignore_index=True)
+    operacoes = operacoes_lote(dados, df) if not df.empty else []
+    return operacoes, len(df), repetidos, invalidos, erros
+
+
+# Formatos de exportação: extensão e tipo MIME
+FORMATOS_EXPORTACAO = {
+    'CSV': ('csv', 'text/csv'),
+    'Parquet': ('parquet', 'application/vnd.apache.parquet'),
+    'XLSX': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
+
+# Módulo opcional de que cada formato precisa
+MODULOS_FORMATO = {'Parquet': 'pyarrow', 'XLSX': 'openpyxl'}
+
+# Linhas de uma folha XLSX, sem contar o cabeçalho
+MAX_LINHAS_XLSX = 1048575
+
+
+def formatos_disponiveis():
+    return [
+        formato for formato in FORMATOS_EXPORTACAO
+        if formato not in MODULOS_FORMATO or importlib.util.find_spec(MODULOS_FORMATO[formato]) is not None
+    ]
+
+
+def _bloco_para_exportar(bloco):
+    """Bloco com os nomes em texto (em vez de categóricos por bloco) e as datas como data,
+    para todos terem o mesmo esquema"""
+    bloco = bloco.reset_index() if bloco.index.name else bloco
+    for coluna in bloco.columns:
+        if isinstance(bloco[coluna].dtype, pd.CategoricalDtype):
+            bloco[coluna] = bloco[coluna].astype(str)
+    if 'Data' in bloco and pd.api.types.is_datetime64_any_dtype(bloco['Data']):
+        bloco['Data'] = bloco['Data'].dt.date
+    return bloco
+
+
+def _esquema_parquet(pa, bloco):
+    """Esquema do Parquet com os tipos das colunas do ledger, igual para todos os blocos mesmo que o
+    primeiro traga uma coluna sem valores"""
+    inferido = pa.Schema.from_pandas(bloco, preserve_index=False)
+    campos = []
+    for campo in inferido:
+        if campo.name == 'ID':
+            tipo = pa.int64()
+        elif campo.name == 'Data':
+            tipo = pa.date32()
+        elif campo.name in COLUNAS_VALOR:
+            tipo = pa.from_numpy_dtype(np.dtype(COLUNAS_VALOR[campo.name]))
+        elif campo.name in COLUNAS_CATEGORIA or pa.types.is_null(campo.type):
+            tipo = pa.string()
+        else:
+            tipo = campo.type
+        campos.append(pa.field(campo.name, tipo))
+    return pa.schema(campos)
+
+
+def exportar_blocos(blocos, formato, colunas):
+    """Escreve os blocos num arquivo temporário do formato dado e devolve-o posicionado no início.
+
+    Cada bloco é escrito antes de ler o seguinte, por isso só há em memória um bloco de cada vez;
+    `colunas` dá o cabeçalho quando não há blocos.
+    """
+    blocos = iter(blocos)
+    primeiro = next(blocos, None)
+    blocos = itertools.chain([pd.DataFrame(columns=colunas) if primeiro is None else primeiro], blocos)
+    arquivo = tempfile.TemporaryFile()
+
+    if formato == 'CSV':
+        texto = io.TextIOWrapper(arquivo, encoding='utf-8-sig', newline='')
+        for numero, bloco in enumerate(blocos):
+            _bloco_para_exportar(bloco).to_csv(texto, index=False, header=numero == 0)
+        texto.flush()
+        texto.detach()
+
+    elif formato == 'Parquet':
+        import pyarrow as pa
+        import pyarrow.parquet as pa_parquet
+
+        escritor = None
+        for bloco in blocos:
+            bloco = _bloco_para_exportar(bloco)
+            if escritor is None:
+                escritor = pa_parquet.ParquetWriter(arquivo, _esquema_parquet(pa, bloco))
+            escritor.write_table(pa.Table.from_pandas(bloco, schema=escritor.schema, preserve_index=False))
+        escritor.close()
+
+    elif formato == 'XLSX':
+        import openpyxl
+
+        livro = openpyxl.Workbook(write_only=True)
+        folha = livro.create_sheet()
+        linhas = 0
+        for numero, bloco in enumerate(blocos):
+            bloco = _bloco_para_exportar(bloco)
+            linhas += len(bloco)
+            if linhas > MAX_LINHAS_XLSX:
+                # A folha escreve num arquivo temporário próprio, que tem de ser fechado
+                folha.close()
+                arquivo.close()
+                raise ValueError(f"O XLSX só leva {MAX_LINHAS_XLSX} linhas; exporte em CSV ou Parquet")
+            if numero == 0:
+                folha.append(list(bloco.columns))
+            for linha in bloco.itertuples(index=False, name=None):
+                folha.append(linha)
+        livro.save(arquivo)
+
+    arquivo.seek(0)
+    return arquivo
+
+
+def blocos_jogos(ledger, inicio=None, fim=None, texto=''):
+    """Jogos do período a exportar, uma partição de cada vez, filtrados pelo texto como no seletor de jogos"""
+    for jogos in ledger.blocos(inicio, fim):
+        jogos = filtrar_jogos(jogos, texto)
+        if len(jogos):
+            yield jogos
+
+
+def tabela_exportacao(dados, dimensao, inicio=None, fim=None):
+    """Estatísticas de cada equipa/campeonato/estratégia/tag no período, prontas a exportar"""
+    tabela = completar_stats(dados['resumo'].tabela(dimensao, inicio, fim), COLUNAS_STATS_EQUIPA)
+    return tabela.rename_axis('Nome').reset_index()
+
+
+def filtrar_jogos(jogos, texto='', datas=None):
+    """Jogos cuja equipa, competição ou estratégia contém o texto (sem distinguir acentos e maiúsculas) e
+    com data no intervalo (inclusive) dado"""
+    mascara = np.ones(len(jogos), dtype=bool)
+    procura = normalizar_nome(texto)
+    if procura:
+        encontrados = np.zeros(len(jogos), dtype=bool)
+        for coluna in ('Competição', 'Casa', 'Visitante', 'Estrategia'):
+            # Compara só os nomes distintos e marca os jogos pelos códigos (o código -1 fica sem correspondência)
+            valores = jogos[coluna].astype('category')
+            correspondem = [procura in normalizar_nome(nome) for nome in valores.cat.categories]
+            encontrados |= np.array(correspondem + [False], dtype=bool)[valores.cat.codes.to_numpy()]
+        mascara &= encontrados
+    if datas:
+        mascara &= (jogos['Data'] >= pd.Timestamp(datas[0])).to_numpy()
+        mascara &= (jogos['Data'] <= pd.Timestamp(datas[1])).to_numpy()
+    return jogos[mascara]
@@ -0,0 +1,846 @@
+"""Modelo de dados: ledger de jogos, dicionários de nomes, resumo de totais e operações que os alteram"""
+import copy
+import os
+import unicodedata
+from datetime import datetime, date
+
+import numpy as np
+import pandas as pd
+
+from planilha.perfil import medido
+
+try:
+    import pyarrow.feather as pa_feather
+except ImportError:
+    pa_feather = None
+
+MESES = [
+    'Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho',
+    'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro'
+]
+
+COLUNAS_JOGO = [
+    'Data', 'Competição', 'Casa', 'Visitante',
+    'Estrategia', 'Tag', 'Stake', 'Profit/Loss', '% Stake'
+]
+
+# Dimensão de cada coluna categórica dos jogos (Casa e Visitante partilham as equipas)
+COLUNAS_CATEGORIA = {
+    'Competição': 'campeonato',
+    'Casa': 'equipa',
+    'Visitante': 'equipa',
+    'Estrategia': 'estrategia',
+    'Tag': 'tag'
+}
+
+# Dimensões dos jogos; cada uma tem um dicionário de nomes e os jogos guardam só o ID
+DIMENSOES = ['campeonato', 'equipa', 'estrategia', 'tag']
+
+# Tipo de cada coluna numérica dos jogos
+COLUNAS_VALOR = {'Stake': 'float64', 'Profit/Loss': 'float64', '% Stake': 'float32'}
+
+# Versão do formato gravado: 1 = um DataFrame por nome de mês, 2 = ledger único,
+# 3 = ledger com IDs nas dimensões e dicionários de nomes
+VERSAO_FORMATO = 3
+
+# Tabela de cada entidade (as colunas dos jogos que a referenciam estão em COLUNAS_CATEGORIA)
+TABELAS_ENTIDADE = {
+    'equipa': 'equipas',
+    'campeonato': 'campeonatos',
+    'estrategia': 'estrategias'
+}
+
+
+def convert_numpy_types(value):
+    """Converte tipos numpy para tipos nativos do Python"""
+    if isinstance(value, (np.integer, np.floating, np.bool_)):
+        return value.item()
+    elif isinstance(value, np.ndarray):
+        return value.tolist()
+    return value
+
+
+@medido('formatar')
+def format_currency(value):
+    """Formata valores como moeda"""
+    try:
+        return f"€{float(value):.2f}"
+    except (ValueError, TypeError):
+        return value
+
+
+@medido('formatar')
+def format_profit(value):
+    """Formata lucros como moeda, com o sinal"""
+    try:
+        return f"€{float(value):+.2f}"
+    except (ValueError, TypeError):
+        return value
+
+
+@medido('formatar')
+def format_percent(value):
+    """Formata valores como porcentagem"""
+    try:
+        return f"{float(value):.2f}%"
+    except (ValueError, TypeError):
+        return value
+
+
+def json_converter(obj):
+    """Converte datas e tipos numpy para valores serializáveis em JSON"""
+    if isinstance(obj, date):
+        return obj.isoformat()
+    if isinstance(obj, (np.generic, np.ndarray)):
+        return convert_numpy_types(obj)
+    raise TypeError(f"Object of type {type(obj)} is not JSON serializable")
+
+
+def _tipar_base(df):
+    """Tipos comuns dos jogos: Data datetime64, valores float e índice ID inteiro"""
+    df = df.reindex(columns=COLUNAS_JOGO)
+    datas = pd.to_datetime(df['Data'], errors='coerce')
+    df['Data'] = datas.fillna(pd.Timestamp.now()).dt.normalize().astype('datetime64[ns]')
+    for coluna, tipo in COLUNAS_VALOR.items():
+        df[coluna] = pd.to_numeric(df[coluna], errors='coerce').fillna(0).astype(tipo)
+    df.index = df.index.astype('int64')
+    df.index.name = 'ID'
+    return df
+
+
+def tipar_jogos(df):
+    """Converte jogos com nomes para os tipos de apresentação: Data datetime64, dimensões categóricas
+    e valores float"""
+    df = _tipar_base(df)
+    for coluna in COLUNAS_CATEGORIA:
+        if not isinstance(df[coluna].dtype, pd.CategoricalDtype):
+            df[coluna] = df[coluna].fillna('').astype(str).astype('category')
+    return df
+
+
+def tipar_ledger(df, dicionarios):
+    """Converte jogos (com nomes ou já com IDs nas dimensões) para os tipos guardados no ledger, com IDs int32"""
+    df = _tipar_base(df)
+    for coluna, dimensao in COLUNAS_CATEGORIA.items():
+        if pd.api.types.is_integer_dtype(df[coluna].dtype):
+            df[coluna] = df[coluna].astype('int32')
+        else:
+            df[coluna] = dicionarios[dimensao].codificar(df[coluna])
+    return df
+
+
+@medido('formatar')
+def descodificar_jogos(jogos, dicionarios):
+    """Jogos com os nomes (categóricos) no lugar dos IDs das dimensões"""
+    jogos = jogos.copy(deep=False)
+    for coluna, dimensao in COLUNAS_CATEGORIA.items():
+        jogos[coluna] = dicionarios[dimensao].descodificar(jogos[coluna].to_numpy())
+    return jogos
+
+
+def chaves_particao(datas):
+    """Partições (ano, mês) a que pertencem as datas dadas"""
+    datas = pd.DatetimeIndex(datas)
+    return set(zip(datas.year, datas.month))
+
+
+def particao_no_periodo(chave, inicio=None, fim=None):
+    """Indica se a partição (ano, mês) tem dias dentro de [inicio, fim)"""
+    primeiro_dia = pd.Timestamp(chave[0], chave[1], 1)
+    if fim is not None and primeiro_dia >= fim:
+        return False
+    return inicio is None or primeiro_dia + pd.offsets.MonthBegin(1) > inicio
+
+
+def _ler_particao(caminho):
+    """Lê uma partição do arquivo Arrow, mapeado em memória (com IDs, ou nomes se for anterior aos dicionários)"""
+    try:
+        return pa_feather.read_table(caminho, memory_map=True).to_pandas()
+    except FileNotFoundError as e:
+        # Os arquivos só são apagados depois de um meta.json mais recente deixar de os usar
+        raise DadosAlterados(
+            f"Os dados foram compactados noutra sessão ({os.path.basename(caminho)} já não existe)"
+        ) from e
+
+
+class DadosAlterados(Exception):
+    """Os dados gravados foram alterados por outra sessão depois de estes terem sido carregados"""
+
+
+class Dicionario:
+    """Nomes de uma dimensão (equipas, campeonatos...) indexados por um ID inteiro estável.
+
+    Os jogos guardam só o ID, por isso mudar um nome altera apenas uma entrada daqui. Os nomes
+    nunca se repetem: o código categórico de cada nome é o seu ID.
+    """
+
+    def __init__(self, nomes=()):
+        self.nomes = list(nomes)
+        self._ids = {nome: id_nome for id_nome, nome in enumerate(self.nomes)}
+        self._tipo = None
+        # IDs criados ou renomeados desde a última gravação (usado pelo SQLite)
+        self.alterados = set()
+
+    def __len__(self):
+        return len(self.nomes)
+
+    def _alterar(self, id_nome):
+        self._tipo = None
+        self.alterados.add(id_nome)
+
+    def procurar(self, nome):
+        """ID de um nome, ou None se não existir"""
+        return self._ids.get(nome)
+
+    def id(self, nome):
+        """ID de um nome, registando-o se ainda não existir"""
+        id_nome = self._ids.get(nome)
+        if id_nome is None:
+            id_nome = self._ids[nome] = len(self.nomes)
+            self.nomes.append(nome)
+            self._alterar(id_nome)
+        return id_nome
+
+    def codificar(self, valores):
+        """IDs (int32) de uma coluna de nomes, registando os nomes novos"""
+        if not isinstance(valores.dtype, pd.CategoricalDtype):
+            valores = valores.fillna('').astype(str).astype('category')
+        codigos = valores.cat.codes.to_numpy()
+        ids = np.array([self.id(str(nome)) for nome in valores.cat.categories], dtype='int32')
+        if (codigos < 0).any():
+            # Nomes em falta ficam como ''
+            ids = np.append(ids, np.int32(self.id('')))
+        return ids[codigos]
+
+    @property
+    def tipo(self):
+        """Tipo categórico com os nomes pela ordem dos IDs"""
+        if self._tipo is None:
+            self._tipo = pd.CategoricalDtype(self.nomes)
+        return self._tipo
+
+    def descodificar(self, ids):
+        """Coluna categórica de nomes a partir dos IDs"""
+        return pd.Categorical.from_codes(ids, dtype=self.tipo)
+
+    def renomear(self, antigo, novo):
+        """Muda o nome de um ID; se o novo nome já existir devolve (ID antigo, ID novo) para juntar os jogos"""
+        id_antigo = self._ids.get(antigo)
+        if id_antigo is None or antigo == novo:
+            return None
+        id_novo = self._ids.get(novo)
+        if id_novo is not None:
+            return id_antigo, id_novo
+        del self._ids[antigo]
+        self._ids[novo] = id_antigo
+        self.nomes[id_antigo] = novo
+        self._alterar(id_antigo)
+        return None
+
+
+def normalizar_nome(nome):
+    """Chave de comparação de um nome: sem acentos, sem diferenças de maiúsculas e com os espaços colapsados"""
+    decomposto = unicodedata.normalize('NFKD', str(nome))
+    sem_acentos = ''.join(c for c in decomposto if not unicodedata.combining(c))
+    return ' '.join(sem_acentos.casefold().split())
+
+
+class Registo:
+    """Nomes de uma entidade (equipas, campeonatos) indexados pela chave normalizada.
+
+    Procurar e registar custam O(1); o nome canónico de uma chave é o primeiro registado com ela.
+    Nomes que só diferem na escrita (ex.: 'Benfica' e 'benfica') ficam na mesma chave.
+    """
+
+    def __init__(self, nomes=()):
+        self._por_chave = {}
+        for nome in nomes:
+            self.adicionar(nome)
+
+    def procurar(self, nome):
+        """Nome canónico registado para o nome dado, ou None"""
+        nomes = self._por_chave.get(normalizar_nome(nome))
+        return nomes[0] if nomes else None
+
+    def adicionar(self, nome):
+        """Regista o nome e devolve o nome canónico da sua chave"""
+        nomes = self._por_chave.setdefault(normalizar_nome(nome), [])
+        if nome not in nomes:
+            nomes.append(nome)
+        return nomes[0]
+
+    def remover(self, nome):
+        chave = normalizar_nome(nome)
+        nomes = self._por_chave.get(chave, [])
+        if nome in nomes:
+            nomes.remove(nome)
+        if not nomes:
+            self._por_chave.pop(chave, None)
+
+    def outro(self, nome, exceto=None):
+        """Outro nome registado com a mesma chave (ignorando `exceto`), ou None"""
+        for registado in self._por_chave.get(normalizar_nome(nome), ()):
+            if registado != exceto:
+                return registado
+        return None
+
+    def duplicados(self):
+        """Nome de cada duplicado para o nome canónico da sua chave"""
+        return {nome: nomes[0] for nomes in self._por_chave.values() for nome in nomes[1:]}
+
+
+def criar_dicionarios(nomes=None):
+    """Um dicionário de nomes por dimensão dos jogos, opcionalmente com os nomes gravados"""
+    nomes = nomes or {}
+    return {dimensao: Dicionario(nomes.get(dimensao, ())) for dimensao in DIMENSOES}
+
+
+class Ledger:
+    """Tabela única com todos os jogos, indexada pelo ID de cada jogo.
+
+    As dimensões (competição, equipas, estratégia, tag) são guardadas como IDs dos dicionários e
+    as leituras devolvem os nomes. No armazenamento colunar cada partição (ano, mês) só é lida
+    do disco quando é precisa; uma partição está sempre inteira em memória ou inteira por ler.
+    """
+
+    def __init__(self, jogos=None, pendentes=None, pasta=None, dicionarios=None):
+        self.dicionarios = dicionarios if dicionarios is not None else criar_dicionarios()
+        self._df = tipar_ledger(jogos if jogos is not None else pd.DataFrame(columns=COLUNAS_JOGO), self.dicionarios)
+        self.pendentes = dict(pendentes or {})
+        self.pasta = pasta
+        # Arquivo de cada partição em memória e partições alteradas desde que foram lidas ou gravadas
+        self.arquivos = {}
+        self.alteradas = set()
+
+    def _carregar(self, chaves):
+        chaves = [chave for chave in chaves if chave in self.pendentes]
+        if not chaves:
+            return
+        frames = [self._df]
+        for chave in chaves:
+            particao = _ler_particao(os.path.join(self.pasta, self.pendentes[chave]))
+            if not all(pd.api.types.is_integer_dtype(particao[coluna].dtype) for coluna in COLUNAS_CATEGORIA):
+                # Partição com nomes, anterior aos dicionários: é regravada com os IDs
+                self.alteradas.add(chave)
+            frames.append(tipar_ledger(particao, self.dicionarios))
+            self.arquivos[chave] = self.pendentes.pop(chave)
+        self._df = pd.concat([df for df in frames if len(df)] or frames[:1])
+
+    def _garantir(self, ids):
+        """Lê todas as partições se algum dos jogos dados ainda não estiver em memória"""
+        if len(self._df.index.intersection(ids)) < len(ids):
+            self._carregar(list(self.pendentes))
+
+    def _ver(self, jogos):
+        return descodificar_jogos(jogos, self.dicionarios)
+
+    @property
+    def df(self):
+        """Todos os jogos, com os nomes (lê as partições que faltarem)"""
+        return self._ver(self.df_ids)
+
+    @property
+    def df_ids(self):
+        """Todos os jogos tal como são guardados, com os IDs das dimensões"""
+        self._carregar(list(self.pendentes))
+        return self._df
+
+    def __len__(self):
+        return len(self.df_ids)
+
+    def meses_com_jogos(self):
+        """Partições (ano, mês) com jogos, lidas ou por ler, sem ler nada do disco"""
+        return set(self.pendentes) | chaves_particao(self._df['Data'])
+
+    @medido('carregar')
+    def periodo(self, inicio=None, fim=None):
+        """Jogos com data em [inicio, fim) (lê só as partições desse intervalo)"""
+        if inicio is None and fim is None:
+            return self.df
+        self._carregar([chave for chave in self.pendentes if particao_no_periodo(chave, inicio, fim)])
+        return self._ver(self._df[self._mascara_periodo(inicio, fim)])
+
+    def _mascara_periodo(self, inicio, fim, mes=None):
+        datas = self._df['Data']
+        mascara = np.ones(len(datas), dtype=bool) if mes is None else (datas.dt.month == mes).values
+        if inicio is not None:
+            mascara = mascara & (datas >= inicio).values
+        if fim is not None:
+            mascara = mascara & (datas < fim).values
+        return mascara
+
+    @medido('carregar')
+    def mes(self, mes, inicio=None, fim=None):
+        """Jogos de um mês dentro do período dado, filtrados pela data (lê só as partições desse mês)"""
+        numero = MESES.index(mes) + 1
+        self._carregar([
+            chave for chave in self.pendentes
+            if chave[1] == numero and particao_no_periodo(chave, inicio, fim)
+        ])
+        return self._ver(self._df[self._mascara_periodo(inicio, fim, numero)])
+
+    def ultimos(self, quantidade, inicio=None, fim=None):
+        """Os jogos mais recentes do período, lendo partições do fim para o início só até haver
+        jogos suficientes"""
+        chaves = sorted((chave for chave in self.meses_com_jogos() if particao_no_periodo(chave, inicio, fim)),
+                        reverse=True)
+        for chave in chaves:
+            self._carregar([chave])
+            # As partições já lidas a partir desta cobrem todos os jogos desde o início do seu mês
+            desde = pd.Timestamp(chave[0], chave[1], 1)
+            if inicio is not None:
+                desde = max(desde, inicio)
+            if self._mascara_periodo(desde, fim).sum() >= quantidade:
+                break
+        jogos = self._df[self._mascara_periodo(inicio, fim)]
+        return self._ver(jogos.sort_values('Data', ascending=False).head(quantidade))
+
+    def blocos(self, inicio=None, fim=None):
+        """Jogos do período, uma partição (ano, mês) de cada vez e por ordem de data.
+
+        As partições por ler são lidas só para o bloco, sem ficarem no ledger, e as que já estão em
+        memória são copiadas uma de cada vez; nunca há uma segunda cópia do ledger inteiro.
+        """
+        # Posições dos jogos em memória ordenadas por partição, para recortar cada uma sem percorrer o ledger
+        datas = self._df['Data']
+        codigos = (datas.dt.year * 12 + datas.dt.month).to_numpy()
+        ordem = np.argsort(codigos, kind='stable')
+        codigos = codigos[ordem]
+        chaves = sorted(chave for chave in self.meses_com_jogos() if particao_no_periodo(chave, inicio, fim))
+        for ano, mes in chaves:
+            if (ano, mes) in self.pendentes:
+                particao = _ler_particao(os.path.join(self.pasta, self.pendentes[(ano, mes)]))
+                jogos = tipar_ledger(particao, self.dicionarios)
+            else:
+                primeiro, ultimo = np.searchsorted(codigos, [ano * 12 + mes, ano * 12 + mes + 1])
+                jogos = self._df.iloc[ordem[primeiro:ultimo]]
+            jogos = _filtrar_periodo(jogos, inicio, fim).sort_index().sort_values('Data', kind='stable')
+            if len(jogos):
+                yield self._ver(jogos)
+
+    def copia(self):
+        """Cópia do estado atual para ler noutra thread: não muda quando este ledger lê partições ou é alterado
+        (o DataFrame é copiado só se um dos dois for escrito)"""
+        copia = copy.copy(self)
+        copia._df = self._df.copy(deep=False)
+        copia.pendentes, copia.arquivos = dict(self.pendentes), dict(self.arquivos)
+        copia.alteradas = set(self.alteradas)
+        return copia
+
+    def linhas(self, ids):
+        """Jogos com os IDs dados, como DataFrame"""
+        self._garantir(ids)
+        return self._ver(self._df.loc[list(ids)])
+
+    def jogo(self, id_jogo):
+        """Linha de um jogo pelo seu ID"""
+        return self.linhas([id_jogo]).loc[id_jogo]
+
+    def adicionar(self, novos):
+        novos = tipar_ledger(novos, self.dicionarios)
+        chaves = chaves_particao(novos['Data'])
+        self._carregar(chaves)
+        self._df = pd.concat([self._df, novos]) if len(self._df) else novos
+        self.alteradas |= chaves
+
+    def atualizar(self, id_jogo, valores):
+        self._garantir([id_jogo])
+        self.alteradas |= chaves_particao([self._df.at[id_jogo, 'Data']])
+        valores = dict(valores)
+        if 'Data' in valores:
+            valores['Data'] = pd.Timestamp(valores['Data']).normalize()
+            self._carregar(chaves_particao([valores['Data']]))
+            self.alteradas |= chaves_particao([valores['Data']])
+        for coluna, valor in valores.items():
+            if coluna in COLUNAS_CATEGORIA:
+                valor = self.dicionarios[COLUNAS_CATEGORIA[coluna]].id(str(valor))
+            self._df.at[id_jogo, coluna] = valor
+
+    def remover(self, id_jogo):
+        self._garantir([id_jogo])
+        self.alteradas |= chaves_particao([self._df.at[id_jogo, 'Data']])
+        self._df = self._df.drop(id_jogo)
+
+    def recodificar(self, colunas, id_antigo, id_novo):
+        """Passa os jogos de um ID para outro nas colunas dadas (ao juntar duas entidades)"""
+        df = self.df_ids
+        mudados = np.zeros(len(df), dtype=bool)
+        for coluna in colunas:
+            valores = df[coluna].to_numpy()
+            mudados |= valores == id_antigo
+            df[coluna] = np.where(valores == id_antigo, id_novo, valores).astype('int32')
+        self.alteradas |= chaves_particao(df['Data'][mudados])
+
+    def particoes_alteradas(self, chaves=()):
+        """Partições em memória por gravar: alteradas, sem arquivo ou dadas em `chaves`
+        (vazias se ficaram sem jogos)"""
+        df = self._df
+        codigos = (df['Data'].dt.year * 12 + df['Data'].dt.month - 1).to_numpy()
+        em_memoria = {(int(codigo) // 12, int(codigo) % 12 + 1) for codigo in np.unique(codigos)}
+        por_gravar = self.alteradas | set(chaves) | (em_memoria - set(self.arquivos))
+        # Recorta cada partição pelas posições ordenadas por mês, sem percorrer o ledger uma vez por partição
+        ordem = np.argsort(codigos, kind='stable')
+        codigos = codigos[ordem]
+        particoes = {}
+        for ano, mes in sorted(por_gravar):
+            primeiro, ultimo = np.searchsorted(codigos, [ano * 12 + mes - 1, ano * 12 + mes])
+            particoes[(ano, mes)] = df.iloc[ordem[primeiro:ultimo]]
+        return particoes
+
+    def gravadas(self, arquivos):
+        """Regista o arquivo em que cada partição alterada ficou gravada (None se ficou vazia)"""
+        for chave, arquivo in arquivos.items():
+            if arquivo is None:
+                self.arquivos.pop(chave, None)
+            else:
+                self.arquivos[chave] = arquivo
+        self.alteradas.clear()
+
+
+def _filtrar_periodo(jogos, inicio=None, fim=None):
+    """Jogos com data em [inicio, fim)"""
+    if inicio is not None:
+        jogos = jogos[jogos['Data'] >= inicio]
+    if fim is not None:
+        jogos = jogos[jogos['Data'] < fim]
+    return jogos
+
+
+def meses_do_periodo(inicio=None, fim=None):
+    """Meses (numerados ano * 12 + mês - 1) que têm dias em [inicio, fim), como intervalo [primeiro, último)"""
+    primeiro = inicio.year * 12 + inicio.month - 1 if inicio is not None else float('-inf')
+    ultimo = float('inf')
+    if fim is not None:
+        ultimo = fim.year * 12 + fim.month - 1 + (fim != fim.to_period('M').start_time)
+    return primeiro, ultimo
+
+
+class Resumo:
+    """Totais por dimensão (mês, campeonato, equipa, estratégia, tag), ID e (ano, mês).
+
+    Cada entrada guarda [mercados, greens, stake, profit] e é atualizada por deltas a cada jogo
+    adicionado, alterado ou removido; as páginas somam só os meses do período, sem ler o ledger.
+    Ao lado fica o número de jogos que usa cada ID, para as verificações de "em uso", e os meses
+    com totais de cada ID, para ler uma só entidade sem percorrer as outras.
+    """
+
+    DIMENSOES = ['mes'] + DIMENSOES
+    CAMPOS = ['dimensao', 'chave', 'ano', 'mes', 'mercados', 'greens', 'stake', 'profit']
+
+    def __init__(self, dicionarios, totais=None):
+        self.dicionarios = dicionarios
+        self.totais = totais or {dimensao: {} for dimensao in self.DIMENSOES}
+        self.usos = {dimensao: self._contar_usos(dimensao) for dimensao in self.DIMENSOES}
+        self.meses = {dimensao: self._indexar_meses(dimensao) for dimensao in self.DIMENSOES}
+
+    @classmethod
+    def de_jogos(cls, ledger):
+        """Calcula o resumo de raiz a partir dos jogos do ledger, numa passagem vetorizada por dimensão"""
+        return cls(ledger.dicionarios, {
+            dimensao: cls._calcular_dimensao(ledger.df_ids, dimensao) for dimensao in cls.DIMENSOES
+        })
+
+    def _contar_usos(self, dimensao):
+        # Os mercados de cada mês já contam cada jogo uma vez por ID; a soma dá os jogos de cada ID
+        usos = {}
+        for (chave, _, _), valores in self.totais[dimensao].items():
+            usos[chave] = usos.get(chave, 0) + valores[0]
+        return usos
+
+    def _indexar_meses(self, dimensao):
+        meses = {}
+        for chave, ano, mes in self.totais[dimensao]:
+            meses.setdefault(chave, set()).add((ano, mes))
+        return meses
+
+    @staticmethod
+    def _calcular_dimensao(jogos, dimensao):
+        profit = jogos['Profit/Loss'].astype('float64')
+        base = pd.DataFrame({
+            'ano': jogos['Data'].dt.year.values, 'mes': jogos['Data'].dt.month.values,
+            'mercados': 1, 'greens': (profit >= 0).astype(int).values,
+            'stake': jogos['Stake'].astype('float64').values, 'profit': profit.values
+        })
+        colunas = [coluna for coluna, dim in COLUNAS_CATEGORIA.items() if dim == dimensao]
+        partes, anterior = [], None
+        for coluna in colunas or [None]:
+            chave = jogos[coluna].to_numpy() if coluna else np.zeros(len(jogos), dtype='int32')
+            parte = base.assign(chave=chave)
+            # Um jogo conta uma só vez por chave (ex.: Casa igual a Visitante)
+            partes.append(parte if anterior is None else parte[chave != anterior])
+            anterior = chave
+        somas = pd.concat(partes).groupby(['chave', 'ano', 'mes'], sort=False).sum()
+        return {
+            (int(chave), int(ano), int(mes)): [int(mercados), int(greens), stake, profit_mes]
+            for (chave, ano, mes), mercados, greens, stake, profit_mes in zip(
+                somas.index, somas['mercados'], somas['greens'], somas['stake'], somas['profit'])
+        }
+
+    def aplicar(self, jogos, sinal=1):
+        """Soma (sinal 1) ou subtrai (sinal -1) os jogos dados; custo constante por jogo"""
+        chaves_jogo = zip(*(jogos[coluna] for coluna in COLUNAS_CATEGORIA))
+        for data, stake, profit, chaves in zip(jogos['Data'], jogos['Stake'], jogos['Profit/Loss'], chaves_jogo):
+            delta = (sinal, sinal * int(profit >= 0), sinal * float(stake), sinal * float(profit))
+            vistas = {('mes', 0)}
+            for dimensao, nome in zip(COLUNAS_CATEGORIA.values(), chaves):
+                vistas.add((dimensao, self.dicionarios[dimensao].id(str(nome))))
+            for dimensao, chave in vistas:
+                usos = self.usos[dimensao]
+                usos[chave] = usos.get(chave, 0) + sinal
+                if usos[chave] == 0:
+                    del usos[chave]
+                totais, meses = self.totais[dimensao], self.meses[dimensao]
+                entrada = (chave, data.year, data.month)
+                total = totais.setdefault(entrada, [0, 0, 0.0, 0.0])
+                meses.setdefault(chave, set()).add(entrada[1:])
+                for i, valor in enumerate(delta):
+                    total[i] += valor
+                if total[0] == 0:
+                    del totais[entrada]
+                    meses[chave].discard(entrada[1:])
+                    if not meses[chave]:
+                        del meses[chave]
+
+    def fundir(self, dimensao, id_antigo, id_novo, ledger):
+        """Junta os totais de um ID nos de outro (após recodificar os jogos no ledger)"""
+        totais = self.totais[dimensao]
+        if list(COLUNAS_CATEGORIA.values()).count(dimensao) > 1:
+            # Juntar duas equipas que jogaram entre si não é uma soma (o jogo passa a contar uma vez)
+            self.totais[dimensao] = self._calcular_dimensao(ledger.df_ids, dimensao)
+            self.usos[dimensao] = self._contar_usos(dimensao)
+            self.meses[dimensao] = self._indexar_meses(dimensao)
+            return
+        usos, meses = self.usos[dimensao], self.meses[dimensao]
+        if id_antigo in usos:
+            usos[id_novo] = usos.get(id_novo, 0) + usos.pop(id_antigo)
+        for ano, mes in meses.pop(id_antigo, ()):
+            valores = totais.pop((id_antigo, ano, mes))
+            total = totais.setdefault((id_novo, ano, mes), [0, 0, 0.0, 0.0])
+            meses.setdefault(id_novo, set()).add((ano, mes))
+            for i, valor in enumerate(valores):
+                total[i] += valor
+
+    def tabela(self, dimensao, inicio=None, fim=None, por_mes=False):
+        """Mercados, greens, stake e profit de cada nome (ou de cada ano e mês) no período [inicio, fim)"""
+        primeiro, ultimo = meses_do_periodo(inicio, fim)
+        linhas = [
+            (id_nome, ano, mes, *valores) for (id_nome, ano, mes), valores in self.totais[dimensao].items()
+            if primeiro <= ano * 12 + mes - 1 < ultimo
+        ]
+        df = pd.DataFrame(linhas, columns=['chave', 'ano', 'mes', 'mercados', 'greens', 'stake', 'profit'])
+        df = df.astype({'mercados': 'int64', 'greens': 'int64', 'stake': 'float64', 'profit': 'float64'})
+        if por_mes:
+            return df.groupby(['ano', 'mes'])[['mercados', 'greens', 'stake', 'profit']].sum()
+        tabela = df.groupby('chave', sort=False)[['mercados', 'greens', 'stake', 'profit']].sum()
+        return nomear_indice(tabela, self.dicionarios.get(dimensao))
+
+    def total(self, dimensao, nome, inicio=None, fim=None):
+        """Mercados, greens, stake e profit de um só nome no período, somando só os meses desse nome"""
+        id_nome = self.dicionarios[dimensao].procurar(nome)
+        primeiro, ultimo = meses_do_periodo(inicio, fim)
+        soma = [0, 0, 0.0, 0.0]
+        for ano, mes in self.meses[dimensao].get(id_nome, ()):
+            if primeiro <= ano * 12 + mes - 1 < ultimo:
+                for i, valor in enumerate(self.totais[dimensao][(id_nome, ano, mes)]):
+                    soma[i] += valor
+        return dict(zip(['mercados', 'greens', 'stake', 'profit'], soma))
+
+    def para_json(self):
+        """Totais por colunas, no mesmo formato do ledger"""
+        colunas = {nome: [] for nome in self.CAMPOS}
+        for dimensao, totais in self.totais.items():
+            for (chave, ano, mes), valores in totais.items():
+                for nome, valor in zip(colunas, (dimensao, chave, ano, mes, *valores)):
+                    colunas[nome].append(valor)
+        return colunas
+
+    @classmethod
+    def de_json(cls, colunas, dicionarios):
+        totais = {dimensao: {} for dimensao in cls.DIMENSOES}
+        for dimensao, chave, ano, mes, *valores in zip(*(colunas[nome] for nome in cls.CAMPOS)):
+            totais[dimensao][(int(chave), int(ano), int(mes))] = list(valores)
+        return cls(dicionarios, totais)
+
+    def jogos_com(self, dimensao, nome):
+        """Número de jogos que usam o nome na dimensão dada, sem percorrer os jogos"""
+        return self.usos[dimensao].get(self.dicionarios[dimensao].procurar(nome), 0)
+
+
+def nomear_indice(tabela, dicionario):
+    """Troca os IDs do índice de uma tabela de totais pelos nomes ('' na dimensão mês)"""
+    nomes = [dicionario.nomes[id_nome] for id_nome in tabela.index] if dicionario else [''] * len(tabela)
+    return tabela.set_axis(pd.Index(nomes, dtype=object, name='chave'))
+
+
+def criar_estrutura_vazia():
+    """Cria a estrutura de dados inicial, sem jogos"""
+    dicionarios = criar_dicionarios()
+    return {
+        'equipas': pd.DataFrame(columns=['Nome']),
+        'campeonatos': pd.DataFrame(columns=['Nome', 'Temporada', 'Jogos']),
+        'estrategias': pd.DataFrame(columns=['Nome', 'Descrição', 'Equipa', 'Tags']),
+        'tags': ["Normal", "Arbitrage", "Value Bet", "Sure Bet"],
+        'jogos': Ledger(dicionarios=dicionarios),
+        'resumo': Resumo(dicionarios),
+        'dicionarios': dicionarios,
+        'proximo_id': 0,
+        'seq': 0
+    }
+
+
+def normalizar_datas(df):
+    """Converte a coluna Data em objetos date"""
+    if 'Data' in df.columns:
+        try:
+            df['Data'] = pd.to_datetime(df['Data']).dt.date
+        except (ValueError, TypeError):
+            df['Data'] = datetime.now().date()
+    return df
+
+
+def normalizar_indice(df):
+    """Garante índices inteiros, tal como ficam em memória após um pd.concat"""
+    if len(df.index):
+        df.index = df.index.astype(int)
+    return df
+
+
+def converter_mensal(dados):
+    """Converte o formato antigo (um DataFrame por mês) no ledger único, numerando os jogos"""
+    frames = [df for df in dados.pop('mensal').values() if not df.empty]
+    jogos = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=COLUNAS_JOGO)
+    dados['jogos'] = Ledger(jogos, dicionarios=dados['dicionarios'])
+    dados['resumo'] = Resumo.de_jogos(dados['jogos'])
+    dados['proximo_id'] = len(jogos)
+    return dados
+
+
+def _ajustar_jogos_campeonatos(dados, competicoes, sinal):
+    """Soma (ou subtrai) à coluna Jogos dos campeonatos os jogos de cada competição"""
+    contagem = pd.Series(competicoes, dtype=object).value_counts()
+    campeonatos = dados['campeonatos']
+    delta = campeonatos['Nome'].map(contagem).fillna(0)
+    if delta.any():
+        campeonatos['Jogos'] = pd.to_numeric(campeonatos['Jogos'], errors='coerce').fillna(0) + sinal * delta
+
+
+def _aplicar_jogo_mensal(dados, op):
+    """Aplica uma operação de jogo do formato antigo (por mês e índice) antes da conversão"""
+    mes, acao = op['mes'], op['acao']
+    df_mes = dados['mensal'][mes]
+    if acao == 'adicionar':
+        novos = normalizar_datas(pd.DataFrame(op['jogos']))
+        dados['mensal'][mes] = novos if df_mes.empty else pd.concat([df_mes, novos], ignore_index=True)
+    elif acao == 'atualizar':
+        jogo = dict(op['jogo'])
+        if 'Data' in jogo:
+            jogo['Data'] = pd.to_datetime(jogo['Data']).date()
+        for coluna, valor in jogo.items():
+            df_mes.at[op['indice'], coluna] = valor
+    elif acao == 'remover':
+        dados['mensal'][mes] = df_mes.drop(op['indice'])
+
+
+def _renomear_referencias(dados, dimensao, antigo, novo):
+    """Muda um nome no dicionário da dimensão; os jogos só são reescritos se o novo nome já existir"""
+    colunas = [coluna for coluna, dim in COLUNAS_CATEGORIA.items() if dim == dimensao]
+    if 'mensal' in dados:
+        for df_mes in dados['mensal'].values():
+            for coluna in colunas:
+                df_mes.loc[df_mes[coluna] == antigo, coluna] = novo
+        return
+    fusao = dados['dicionarios'][dimensao].renomear(antigo, novo)
+    if fusao:
+        dados['jogos'].recodificar(colunas, *fusao)
+        dados['resumo'].fundir(dimensao, *fusao, dados['jogos'])
+
+
+def registo_entidade(dados, entidade):
+    """Registo dos nomes de uma entidade com tabela, criado na primeira utilização e mantido pelas operações"""
+    registos = dados.setdefault('registos', {})
+    if entidade not in registos:
+        registos[entidade] = Registo(dados[TABELAS_ENTIDADE[entidade]]['Nome'])
+    return registos[entidade]
+
+
+def _fundir_entidades(dados, entidade, nomes):
+    """Junta cada nome duplicado (chave) no nome canónico (valor): jogos, contagens e tabela da entidade"""
+    tabela = TABELAS_ENTIDADE[entidade]
+    df = dados[tabela]
+    for antigo, novo in nomes.items():
+        _renomear_referencias(dados, entidade, antigo, novo)
+        if 'Jogos' in df:
+            jogos = pd.to_numeric(df['Jogos'], errors='coerce').fillna(0)
+            df.loc[df['Nome'] == novo, 'Jogos'] = jogos[df['Nome'] == novo] + jogos[df['Nome'] == antigo].sum()
+    dados[tabela] = df[~df['Nome'].isin(list(nomes))].reset_index(drop=True)
+
+
+def aplicar_operacao(dados, op):
+    """Aplica uma operação de adicionar/atualizar/remover à estrutura de dados"""
+    entidade, acao = op['entidade'], op['acao']
+
+    if entidade == 'jogo' and 'mensal' in dados:
+        _aplicar_jogo_mensal(dados, op)
+
+    elif entidade == 'jogo':
+        ledger = dados['jogos']
+        if acao == 'adicionar':
+            novos = tipar_jogos(pd.DataFrame(op['jogos']).set_index('ID'))
+            ledger.adicionar(novos)
+            _ajustar_jogos_campeonatos(dados, novos['Competição'], 1)
+            dados['resumo'].aplicar(novos)
+            dados['proximo_id'] = max(dados['proximo_id'], int(novos.index.max()) + 1)
+        elif acao == 'atualizar':
+            antes = ledger.linhas([op['id']])
+            ledger.atualizar(op['id'], op['jogo'])
+            for jogos, sinal in ((antes, -1), (ledger.linhas([op['id']]), 1)):
+                _ajustar_jogos_campeonatos(dados, jogos['Competição'], sinal)
+                dados['resumo'].aplicar(jogos, sinal)
+        elif acao == 'remover':
+            antes = ledger.linhas([op['id']])
+            _ajustar_jogos_campeonatos(dados, antes['Competição'], -1)
+            dados['resumo'].aplicar(antes, -1)
+            ledger.remover(op['id'])
+
+    elif entidade == 'tag':
+        if acao == 'adicionar':
+            dados['tags'].append(op['nome'])
+        elif acao == 'atualizar':
+            if op['novo_nome'] in dados['tags']:
+                # O novo nome já existe: as duas tags são juntadas, como no dicionário
+                dados['tags'].remove(op['nome'])
+            else:
+                dados['tags'][dados['tags'].index(op['nome'])] = op['novo_nome']
+            _renomear_referencias(dados, 'tag', op['nome'], op['novo_nome'])
+        elif acao == 'remover':
+            dados['tags'].remove(op['nome'])
+
+    else:
+        tabela = TABELAS_ENTIDADE[entidade]
+        df = dados[tabela]
+        # O registo de nomes (se já foi criado) acompanha a tabela
+        registo = dados.get('registos', {}).get(entidade)
+        if acao == 'adicionar':
+            registros = op['registros'] if 'registros' in op else [op['registro']]
+            dados[tabela] = pd.concat([df, pd.DataFrame(registros)], ignore_index=True)
+            for registro in registros if registo else ():
+                registo.adicionar(registro['Nome'])
+        elif acao == 'atualizar':
+            nome_antigo = df.at[op['indice'], 'Nome']
+            for coluna, valor in op['registro'].items():
+                df.at[op['indice'], coluna] = valor
+
+            # Propaga a mudança de nome para os jogos que referenciam a entidade
+            novo_nome = op['registro'].get('Nome', nome_antigo)
+            if novo_nome != nome_antigo:
+                _renomear_referencias(dados, entidade, nome_antigo, novo_nome)
+                if registo:
+                    registo.remover(nome_antigo)
+                    registo.adicionar(novo_nome)
+        elif acao == 'remover':
+            if registo:
+                registo.remover(df.at[op['indice'], 'Nome'])
+            dados[tabela] = df.drop(op['indice']).reset_index(drop=True)
+        elif acao == 'fundir':
+            _fundir_entidades(dados, entidade, op['nomes'])
+            dados.get('registos', {}).pop(entidade, None)
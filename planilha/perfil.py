@@ -0,0 +1,79 @@
+"""Medição opcional do tempo de cada fase (carregar, agregar, formatar, gráficos, gravar) e das gravações"""
+import functools
+import os
+import time
+from contextlib import contextmanager
+
+# "1" mede cada execução (tempo da página e de cada fase, gravações) e mostra-o na barra lateral
+PERFIL_ATIVO = os.environ.get("PLANILHA_PERFIL", "0") == "1"
+
+# Fases medidas em cada execução, pela ordem do painel; o tempo restante fica em "Outros"
+FASES_PERFIL = {
+    'carregar': "Carregar", 'agregar': "Agregar", 'formatar': "Formatar", 'grafico': "Gráficos", 'gravar': "Gravar"
+}
+
+# Função que devolve o registo da execução em curso (ou None); definida pela interface com configurar()
+_obter_registo = None
+
+
+def configurar(obter_registo):
+    """Define onde está o registo do perfil da execução em curso (ex.: no estado da sessão da interface)"""
+    global _obter_registo
+    _obter_registo = obter_registo
+
+
+def novo_registo():
+    """Registo vazio de uma execução: tempo de cada fase e gravações"""
+    return {
+        'inicio': time.perf_counter(), 'pagina': None, 'tempo_pagina': 0.0,
+        'fases': dict.fromkeys(FASES_PERFIL, 0.0), 'pilha': [],
+        'gravacoes': 0, 'bytes': 0, 'mostrado': (0, 0), 'cprofile': None
+    }
+
+
+def perfil_atual():
+    """Registo do perfil da execução em curso, ou None com o perfil desligado"""
+    if not PERFIL_ATIVO or _obter_registo is None:
+        return None
+    return _obter_registo()
+
+
+@contextmanager
+def fase(nome):
+    """Soma o tempo do bloco à fase, sem o das fases medidas dentro dele"""
+    perfil = perfil_atual()
+    if perfil is None:
+        yield
+        return
+    pilha = perfil['pilha']
+    pilha.append(0.0)
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        decorrido = time.perf_counter() - inicio
+        perfil['fases'][nome] += decorrido - pilha.pop()
+        if pilha:
+            pilha[-1] += decorrido
+
+
+def medido(nome):
+    """Decorador que mede a função na fase dada (com o perfil desligado devolve a própria função)"""
+    def decorador(funcao):
+        if not PERFIL_ATIVO:
+            return funcao
+
+        @functools.wraps(funcao)
+        def medida(*args, **kwargs):
+            with fase(nome):
+                return funcao(*args, **kwargs)
+        return medida
+    return decorador
+
+
+def contar_gravacao(bytes_escritos):
+    """Conta uma chamada a salvar_dados e os bytes que escreveu"""
+    perfil = perfil_atual()
+    if perfil is not None:
+        perfil['gravacoes'] += 1
+        perfil['bytes'] += bytes_escritos
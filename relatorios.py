@@ -0,0 +1,268 @@
+"""Relatórios da PlanilhaTrading sem browser: um por mês e um por época, em HTML estático (e os gráficos em PNG).
+
+Uso:
+    python relatorios.py
+    python relatorios.py --epoca 2024 --mes 2025-09 --formato html png --saida relatorios
+
+Sem --epoca nem --mes faz a época atual: um relatório por mês com jogos e o resumo da época.
+Os dados são os da aplicação (na pasta atual, com o armazenamento de PLANILHA_ARMAZENAMENTO), lidos
+só para leitura e com uma trava partilhada, por isso pode correr no cron com a aplicação aberta.
+Os relatórios são desenhados em paralelo, um processo por relatório.
+"""
+import argparse
+import html
+import importlib.util
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+import plotly.express as px
+from plotly.offline import get_plotlyjs
+
+from planilha import (
+    MESES, calcular_desempenho_mensal, calcular_stats_por, carregar_dados, format_currency, format_percent,
+    format_profit, metricas_jogos, resultados_por, trava_leitura
+)
+from planilha.estatisticas import MES_INICIO_EPOCA
+
+FORMATOS = ['html', 'png']
+
+# Biblioteca do Plotly, gravada uma vez na pasta dos relatórios para os abrir sem internet
+PLOTLYJS_FILE = "plotly.min.js"
+
+# Tabelas de estatísticas de cada relatório: título e coluna dos jogos
+TABELAS_RELATORIO = {'Estratégias': 'Estrategia', 'Tags': 'Tag'}
+
+MODELO_HTML = """<!DOCTYPE html>
+<html lang="pt">
+<head>
+<meta charset="utf-8">
+<title>{titulo}</title>
+<script src="{plotlyjs}"></script>
+<style>
+body {{ font-family: sans-serif; margin: 2em auto; max-width: 1100px; color: #262730; }}
+table {{ border-collapse: collapse; margin-bottom: 1.5em; }}
+th, td {{ padding: 4px 12px; border-bottom: 1px solid #ddd; text-align: right; }}
+th:first-child, td:first-child {{ text-align: left; }}
+.metricas {{ display: grid; grid-template-columns: repeat(3, 1fr); gap: 1em; margin-bottom: 1.5em; }}
+.metrica span {{ display: block; font-size: 0.9em; color: #666; }}
+.metrica b {{ font-size: 1.6em; }}
+</style>
+</head>
+<body>
+<h1>{titulo}</h1>
+<p>Gerado em {gerado}</p>
+{corpo}
+</body>
+</html>
+"""
+
+
+def periodo_mes(ano, mes):
+    """(inicio, fim) de um mês"""
+    inicio = pd.Timestamp(ano, mes, 1)
+    return inicio, inicio + pd.DateOffset(months=1)
+
+
+def periodo_epoca(ano):
+    """(inicio, fim) da época que começa no ano dado"""
+    return pd.Timestamp(ano, MES_INICIO_EPOCA, 1), pd.Timestamp(ano + 1, MES_INICIO_EPOCA, 1)
+
+
+def tabela_stats(dados, coluna, titulo, inicio, fim):
+    """Estatísticas de cada estratégia/tag no período, lidas do resumo"""
+    return calcular_stats_por(dados, coluna, inicio, fim).rename_axis(titulo).reset_index()
+
+
+def preparar_relatorio(dados, nome, titulo, jogos, inicio, fim, epoca=False):
+    """Tudo o que o relatório precisa dos dados, para ser desenhado noutro processo sem os voltar a ler"""
+    relatorio = {
+        'nome': nome, 'titulo': titulo, 'jogos': jogos, 'epoca': epoca,
+        'tabelas': {titulo_tabela: tabela_stats(dados, coluna, titulo_tabela, inicio, fim)
+                    for titulo_tabela, coluna in TABELAS_RELATORIO.items()}
+    }
+    if epoca:
+        relatorio['mensal'] = calcular_desempenho_mensal(dados, inicio, fim)
+    return relatorio
+
+
+def preparar_relatorios(dados, meses, epocas):
+    """Relatórios pedidos: cada mês dado e, por cada época, os seus meses com jogos e o resumo da época"""
+    relatorios = []
+    for ano in epocas:
+        inicio, fim = periodo_epoca(ano)
+        jogos = dados['jogos'].periodo(inicio, fim)
+        for ano_mes, mes in sorted(dados['jogos'].meses_com_jogos()):
+            if inicio <= pd.Timestamp(ano_mes, mes, 1) < fim and (ano_mes, mes) not in meses:
+                inicio_mes, fim_mes = periodo_mes(ano_mes, mes)
+                relatorios.append(preparar_relatorio(
+                    dados, f"{ano_mes:04d}-{mes:02d}", f"{MESES[mes - 1]} {ano_mes}",
+                    jogos[(jogos['Data'] >= inicio_mes) & (jogos['Data'] < fim_mes)], inicio_mes, fim_mes
+                ))
+        rotulo = f"{ano}/{(ano + 1) % 100:02d}"
+        relatorios.append(preparar_relatorio(
+            dados, f"epoca_{rotulo.replace('/', '-')}", f"Época {rotulo}", jogos, inicio, fim, epoca=True
+        ))
+    for ano, mes in meses:
+        inicio, fim = periodo_mes(ano, mes)
+        relatorios.append(preparar_relatorio(
+            dados, f"{ano:04d}-{mes:02d}", f"{MESES[mes - 1]} {ano}", dados['jogos'].periodo(inicio, fim), inicio, fim
+        ))
+    return relatorios
+
+
+def html_metricas(jogos):
+    """Métricas da página do mês (stake, profit, ROI, dias e mercados green/red) em HTML"""
+    metricas = metricas_jogos(jogos)
+
+    def contagem(chave, total):
+        # Como o delta das métricas da página: a parte do total em percentagem
+        valor, de = metricas[chave], metricas[total]
+        return f"{valor} ({valor / de * 100:.1f}%)" if de > 0 else str(valor)
+
+    valores = [
+        ("💰 Stake Total", format_currency(metricas['stake'])),
+        ("💸 Profit/Loss Total", format_profit(metricas['profit'])),
+        ("📊 ROI", format_percent(metricas['roi'])),
+        ("📅 Dias Trabalhados", metricas['dias']),
+        ("✅ Dias Green", contagem('dias_green', 'dias')),
+        ("❌ Dias Red", contagem('dias_red', 'dias')),
+        ("🔢 Total Mercados", metricas['mercados']),
+        ("🟢 Mercados Green", contagem('mercados_green', 'mercados')),
+        ("🔴 Mercados Red", contagem('mercados_red', 'mercados')),
+    ]
+    return '<div class="metricas">' + ''.join(
+        f'<div class="metrica"><span>{html.escape(rotulo)}</span><b>{html.escape(str(valor))}</b></div>'
+        for rotulo, valor in valores
+    ) + '</div>'
+
+
+def html_tabela(titulo, tabela):
+    """Tabela com um título, os valores com duas casas decimais"""
+    return f"<h2>{html.escape(titulo)}</h2>" + tabela.to_html(index=False, border=0, float_format='{:.2f}'.format)
+
+
+def graficos(relatorio):
+    """Gráficos do relatório (nome e figura): os da página do mês e, na época, o profit de cada mês e a banca"""
+    jogos = relatorio['jogos']
+    por_dia = resultados_por(jogos, 'Data')
+    figuras = []
+    if relatorio['epoca']:
+        mensal = relatorio['mensal'].iloc[:-1]
+        figuras.append(('lucro_mensal', px.bar(
+            mensal, x='Mês', y='Profit Total', title="Lucro/Prejuízo por Mês",
+            labels={'Profit Total': 'Lucro/Prejuízo (€)'}
+        )))
+        por_dia['Banca'] = por_dia['Profit/Loss'].cumsum()
+        figuras.append(('banca', px.line(
+            por_dia, x='Data', y='Banca', title="Lucro Acumulado", labels={'Banca': 'Lucro acumulado (€)'}
+        )))
+    else:
+        figuras.append(('lucro_diario', px.line(
+            por_dia, x='Data', y='Profit/Loss', title="Lucro/Prejuízo por Dia",
+            labels={'Profit/Loss': 'Lucro/Prejuízo (€)', 'Data': 'Data'}, markers=True
+        )))
+        figuras.append(('stake_diario', px.bar(
+            por_dia, x='Data', y='Stake', title="Stake por Dia", labels={'Stake': 'Stake (€)', 'Data': 'Data'}
+        )))
+    figuras.append(('estrategias', px.bar(
+        resultados_por(jogos, 'Estrategia'), x='Estrategia', y='Profit/Loss', color='ROI',
+        title="Performance por Estratégia",
+        labels={'Profit/Loss': 'Lucro/Prejuízo (€)', 'Estrategia': 'Estratégia'}, color_continuous_scale='RdYlGn'
+    )))
+    return figuras
+
+
+def desenhar_relatorio(relatorio, pasta, formatos):
+    """Grava o relatório em HTML e/ou os seus gráficos em PNG; devolve os arquivos gravados"""
+    jogos = relatorio['jogos']
+    arquivos = []
+    figuras = graficos(relatorio) if len(jogos) else []
+
+    if 'html' in formatos:
+        if len(jogos):
+            partes = [html_metricas(jogos)]
+            if relatorio['epoca']:
+                partes.append(html_tabela("📊 Desempenho Mensal", relatorio['mensal']))
+            partes += [html_tabela(titulo, tabela) for titulo, tabela in relatorio['tabelas'].items()]
+            partes += [figura.to_html(full_html=False, include_plotlyjs=False) for _, figura in figuras]
+        else:
+            partes = [f"<p>Nenhum jogo registrado em {html.escape(relatorio['titulo'])}</p>"]
+        caminho = os.path.join(pasta, f"{relatorio['nome']}.html")
+        with open(caminho, 'w', encoding='utf-8') as f:
+            f.write(MODELO_HTML.format(
+                titulo=html.escape(relatorio['titulo']), plotlyjs=PLOTLYJS_FILE,
+                gerado=datetime.now().strftime('%d/%m/%Y %H:%M'), corpo='\n'.join(partes)
+            ))
+        arquivos.append(caminho)
+
+    if 'png' in formatos:
+        for nome, figura in figuras:
+            caminho = os.path.join(pasta, f"{relatorio['nome']}_{nome}.png")
+            figura.write_image(caminho)
+            arquivos.append(caminho)
+    return arquivos
+
+
+def ler_mes(texto):
+    """(ano, mês) de um texto AAAA-MM"""
+    try:
+        data = datetime.strptime(texto, '%Y-%m')
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"mês inválido: {texto} (use AAAA-MM)")
+    return data.year, data.month
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mes', type=ler_mes, nargs='+', default=[], help="Meses (AAAA-MM)")
+    parser.add_argument('--epoca', type=int, nargs='+', default=[],
+                        help="Épocas, pelo ano em que começam (2024 é a época 2024/25)")
+    parser.add_argument('--formato', nargs='+', choices=FORMATOS, default=['html'])
+    parser.add_argument('--saida', default="relatorios", help="Pasta dos relatórios")
+    parser.add_argument('--processos', type=int, default=os.cpu_count() or 1,
+                        help="Processos que desenham os relatórios em paralelo")
+    args = parser.parse_args()
+    if 'png' in args.formato and importlib.util.find_spec('kaleido') is None:
+        parser.error("O PNG requer o kaleido (pip install kaleido)")
+    logging.basicConfig(format="%(levelname)s: %(message)s")
+
+    epocas = args.epoca
+    if not epocas and not args.mes:
+        hoje = datetime.now()
+        epocas = [hoje.year if hoje.month >= MES_INICIO_EPOCA else hoje.year - 1]
+
+    # Os jogos e as tabelas são lidos de uma vez sob a trava; os processos só desenham
+    with trava_leitura():
+        dados = carregar_dados(so_leitura=True)
+        if dados is None:
+            print("Não foi possível ler os dados.", file=sys.stderr)
+            return 1
+        relatorios = preparar_relatorios(dados, sorted(set(args.mes)), sorted(set(epocas)))
+    conexao = getattr(dados['jogos'], 'conexao', None)
+    if conexao is not None:
+        conexao.close()
+
+    os.makedirs(args.saida, exist_ok=True)
+    if 'html' in args.formato and not os.path.exists(os.path.join(args.saida, PLOTLYJS_FILE)):
+        with open(os.path.join(args.saida, PLOTLYJS_FILE), 'w', encoding='utf-8') as f:
+            f.write(get_plotlyjs())
+
+    processos = max(1, min(args.processos, len(relatorios)))
+    if processos > 1:
+        with ProcessPoolExecutor(max_workers=processos) as executor:
+            gravados = list(executor.map(
+                desenhar_relatorio, relatorios, [args.saida] * len(relatorios), [args.formato] * len(relatorios)
+            ))
+    else:
+        gravados = [desenhar_relatorio(relatorio, args.saida, args.formato) for relatorio in relatorios]
+    for arquivo in (arquivo for arquivos in gravados for arquivo in arquivos):
+        print(arquivo)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
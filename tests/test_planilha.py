@@ -0,0 +1,623 @@
+"""Testes do núcleo: journal, renomear, importação de extratos e coerência do resumo com o ledger"""
+import io
+import json
+import os
+import random
+import sys
+from datetime import date
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import relatorios
+from planilha import armazenamento, carregar_dados, compactar_dados, criar_estrutura_vazia, registrar
+from planilha.armazenamento import DadosAlterados, salvar_dados
+from planilha import estatisticas, extratos, perfil
+from planilha.estatisticas import analisar_risco, calcular_bootstrap, calcular_stats_agrupados, calcular_stats_equipa
+from planilha.extratos import (
+    blocos_jogos, exportar_blocos, ler_extrato, operacoes_extrato, operacoes_lote, preparar_lote_jogos,
+    tabela_exportacao
+)
+from planilha.modelo import COLUNAS_JOGO, Ledger, Resumo, aplicar_operacao
+
+MODOS = ['json', 'colunar', 'sqlite']
+
+
+def usar_armazenamento(modo, tmp_path, monkeypatch):
+    """Pasta de dados vazia com o armazenamento dado"""
+    if modo == 'colunar':
+        pytest.importorskip('pyarrow')
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(armazenamento, 'ARMAZENAMENTO', modo)
+    monkeypatch.setattr(armazenamento, 'MODO_PERSISTENCIA', 'journal')
+    return modo
+
+
+@pytest.fixture(params=MODOS)
+def modo(request, tmp_path, monkeypatch):
+    return usar_armazenamento(request.param, tmp_path, monkeypatch)
+
+
+@pytest.fixture
+def colunar(tmp_path, monkeypatch):
+    return usar_armazenamento('colunar', tmp_path, monkeypatch)
+
+
+def carregar():
+    dados = carregar_dados() or criar_estrutura_vazia()
+    dados.pop('converter_formato', None)
+    return dados
+
+
+def op_jogos(primeiro, *jogos):
+    """Operação que adiciona jogos dados como (data, competição, casa, visitante, profit), com IDs seguidos"""
+    colunas = {coluna: [] for coluna in ['ID', 'Data', 'Competição', 'Casa', 'Visitante', 'Estrategia', 'Tag',
+                                         'Stake', 'Profit/Loss', '% Stake']}
+    for numero, (data, competicao, casa, visitante, profit) in enumerate(jogos):
+        valores = [primeiro + numero, data, competicao, casa, visitante, 'Back', 'Normal', 2.0, profit, profit * 50]
+        for coluna, valor in zip(colunas, valores):
+            colunas[coluna].append(valor)
+    return {'entidade': 'jogo', 'acao': 'adicionar', 'jogos': colunas}
+
+
+def jogos_ordenados(dados):
+    return dados['jogos'].df.sort_index()[['Data', 'Competição', 'Casa', 'Visitante', 'Profit/Loss']]
+
+
+def test_journal_reproduz_operacoes(modo):
+    dados = carregar()
+    salvar_dados(dados)
+    registrar(dados, op_jogos(0, ('2025-03-01', 'Liga', 'Benfica', 'Porto', 1.5),
+                              ('2025-04-02', 'Liga', 'Sporting', 'Braga', -2.0)))
+    registrar(dados, {'entidade': 'jogo', 'acao': 'atualizar', 'id': 1, 'jogo': {'Profit/Loss': 3.0}})
+    registrar(dados, {'entidade': 'tag', 'acao': 'adicionar', 'nome': 'Live'})
+
+    recarregados = carregar()
+    pd.testing.assert_frame_equal(jogos_ordenados(recarregados), jogos_ordenados(dados))
+    assert recarregados['seq'] == dados['seq'] == 3
+    assert 'Live' in recarregados['tags']
+
+    if modo != 'sqlite':
+        compactar_dados(recarregados)
+        registrar(recarregados, {'entidade': 'jogo', 'acao': 'remover', 'id': 0})
+        depois = carregar()
+        assert depois['seq'] == 4
+        assert depois['jogos'].df.index.tolist() == [1]
+
+
+def test_journal_ignora_linha_incompleta(modo):
+    if modo == 'sqlite':
+        pytest.skip("o SQLite não usa journal")
+    dados = carregar()
+    salvar_dados(dados)
+    registrar(dados, op_jogos(0, ('2025-03-01', 'Liga', 'Benfica', 'Porto', 1.0)))
+    with open(armazenamento._caminho_journal(), 'a', encoding='utf-8') as f:
+        f.write('{"entidade": "jogo", "acao": "remo')
+
+    assert len(carregar()['jogos']) == 1
+
+
+def test_sessoes_concorrentes_nao_perdem_operacoes(modo):
+    salvar_dados(carregar())
+    primeira, segunda = carregar(), carregar()
+    registrar(primeira, op_jogos(primeira['proximo_id'], ('2025-03-01', 'Liga', 'Benfica', 'Porto', 1.0)))
+    with pytest.raises(DadosAlterados):
+        registrar(segunda, op_jogos(segunda['proximo_id'], ('2025-03-02', 'Liga', 'Braga', 'Porto', 1.0)))
+
+    segunda = carregar()
+    registrar(segunda, op_jogos(segunda['proximo_id'], ('2025-03-02', 'Liga', 'Braga', 'Porto', 1.0)))
+    assert sorted(carregar()['jogos'].df['Casa'].tolist()) == ['Benfica', 'Braga']
+
+
+def test_falha_ao_gravar_descarta_alteracoes(modo, monkeypatch):
+    salvar_dados(carregar())
+    dados = carregar()
+
+    def falhar(*args):
+        raise OSError("disco cheio")
+
+    with monkeypatch.context() as m:
+        m.setattr(armazenamento, 'salvar_dados', falhar)
+        with pytest.raises(OSError):
+            registrar(dados, op_jogos(0, ('2025-03-01', 'Liga', 'Benfica', 'Porto', 1.0)))
+    armazenamento.descartar_alteracoes(dados)
+
+    # Nada chegou ao disco e outra sessão pode gravar (no SQLite a transação não fica aberta)
+    outra = carregar()
+    assert len(outra['jogos']) == 0
+    registrar(outra, op_jogos(0, ('2025-03-02', 'Liga', 'Braga', 'Porto', 1.0)))
+    assert carregar()['jogos'].df['Casa'].tolist() == ['Braga']
+
+
+def test_compactacao_de_sessao_desatualizada_e_adiada(modo):
+    if modo == 'sqlite':
+        pytest.skip("o SQLite não usa journal")
+    salvar_dados(carregar())
+    primeira, segunda = carregar(), carregar()
+    registrar(primeira, op_jogos(0, ('2025-03-01', 'Liga', 'Benfica', 'Porto', 1.0)))
+    compactar_dados(segunda)
+    assert len(carregar()['jogos']) == 1
+
+
+def particoes_gravadas():
+    with open(f"{armazenamento.LEDGER_DIR}/meta.json", encoding='utf-8') as f:
+        return json.load(f)['particoes']
+
+
+def test_compactacao_so_grava_particoes_alteradas(colunar):
+    dados = carregar()
+    registrar(dados, op_jogos(0, ('2025-01-05', 'Liga', 'Benfica', 'Porto', 1.0),
+                              ('2025-02-05', 'Liga', 'Braga', 'Porto', 1.0)))
+    compactar_dados(dados)
+    antes = particoes_gravadas()
+
+    dados = carregar()
+    registrar(dados, {'entidade': 'jogo', 'acao': 'atualizar', 'id': 0, 'jogo': {'Profit/Loss': 2.0}})
+    assert list(armazenamento._preparar_colunar(dados)['frames']) == [f"2025-01.{dados['seq']}.arrow"]
+    compactar_dados(dados)
+    depois = particoes_gravadas()
+    assert depois['2025-02'] == antes['2025-02']
+    assert depois['2025-01'] != antes['2025-01']
+
+    # Sem alterações nenhuma partição volta a ser gravada
+    assert armazenamento._preparar_colunar(dados)['frames'] == {}
+    assert carregar()['jogos'].jogo(0)['Profit/Loss'] == 2.0
+
+
+def test_sessao_le_particoes_depois_de_outra_compactar(colunar):
+    dados = carregar()
+    registrar(dados, op_jogos(0, ('2025-01-05', 'Liga', 'Benfica', 'Porto', 1.0),
+                              ('2025-02-05', 'Liga', 'Braga', 'Porto', 1.0)))
+    compactar_dados(dados)
+    primeira, segunda, terceira = carregar(), carregar(), carregar()
+
+    registrar(primeira, {'entidade': 'jogo', 'acao': 'atualizar', 'id': 0, 'jogo': {'Profit/Loss': 2.0}})
+    compactar_dados(primeira)
+    # Os arquivos do snapshot anterior ficam mais uma geração
+    assert segunda['jogos'].mes('Janeiro')['Profit/Loss'].tolist() == [1.0]
+
+    registrar(primeira, {'entidade': 'jogo', 'acao': 'atualizar', 'id': 0, 'jogo': {'Profit/Loss': 3.0}})
+    compactar_dados(primeira)
+    # A partição de fevereiro não mudou e continua no mesmo arquivo; a de janeiro já foi apagada
+    assert terceira['jogos'].mes('Fevereiro')['Casa'].tolist() == ['Braga']
+    with pytest.raises(DadosAlterados):
+        terceira['jogos'].mes('Janeiro')
+    assert carregar()['jogos'].mes('Janeiro')['Profit/Loss'].tolist() == [3.0]
+
+
+def test_renomear_equipa(modo):
+    dados = carregar()
+    registrar(dados, {'entidade': 'equipa', 'acao': 'adicionar', 'registros': [{'Nome': 'Braga'}, {'Nome': 'Porto'}]})
+    registrar(dados, op_jogos(0, ('2025-03-01', 'Liga', 'Braga', 'Porto', 1.0),
+                              ('2025-03-08', 'Liga', 'Porto', 'Braga', -1.0)))
+    assert len(dados['jogos'].df) == 2  # lê (e guarda) o ledger antes de renomear
+    indice = dados['equipas'].index[dados['equipas']['Nome'] == 'Braga'][0]
+    registrar(dados, {'entidade': 'equipa', 'acao': 'atualizar', 'indice': indice, 'registro': {'Nome': 'SC Braga'}})
+
+    for vista in (dados, carregar()):
+        jogos = vista['jogos'].df.sort_index()
+        assert jogos['Casa'].tolist() == ['SC Braga', 'Porto']
+        assert jogos['Visitante'].tolist() == ['Porto', 'SC Braga']
+        assert calcular_stats_equipa(vista, 'SC Braga')['Mercados'] == 2
+        assert calcular_stats_equipa(vista, 'Braga')['Mercados'] == 0
+        assert vista['resumo'].jogos_com('equipa', 'SC Braga') == 2
+
+
+def test_renomear_tag_para_nome_existente_junta_jogos(modo):
+    dados = carregar()
+    registrar(dados, op_jogos(0, ('2025-03-01', 'Liga', 'Benfica', 'Porto', 1.0)))
+    registrar(dados, {'entidade': 'tag', 'acao': 'atualizar', 'nome': 'Normal', 'novo_nome': 'Value Bet'})
+    for vista in (dados, carregar()):
+        assert vista['jogos'].df['Tag'].tolist() == ['Value Bet']
+        assert vista['resumo'].jogos_com('tag', 'Value Bet') == 1
+        assert vista['tags'] == ['Arbitrage', 'Value Bet', 'Sure Bet']
+
+
+def test_importar_extrato(modo, tmp_path):
+    dados = carregar()
+    extrato = tmp_path / 'extrato.csv'
+    extrato.write_text(
+        "Date,Event,Competition,Stake,Profit,Strategy,Tag\n"
+        "01/03/2025,Benfica v Porto,Liga,2,1.5,Lay,Live\n"
+        "02/03/2025,benfica v Braga,liga,2,-2,,\n"
+        "03/03/2025,Sporting v Porto,Liga,0,1,Lay,Live\n"
+        "04/03/2025,Sporting v Braga,,2,1,Lay,Live\n",
+        encoding='utf-8'
+    )
+    colunas = {'Data': 'Date', 'Evento': 'Event', 'Competição': 'Competition', 'Stake': 'Stake',
+               'Profit/Loss': 'Profit', 'Estrategia': 'Strategy', 'Tag': 'Tag'}
+    fixos = {'Competição': '', 'Estrategia': '', 'Tag': 'Normal'}
+
+    operacoes, importados, repetidos, invalidos, erros = operacoes_extrato(
+        dados, ler_extrato(str(extrato), 'extrato.csv'), colunas, fixos)
+    registrar(dados, *operacoes)
+
+    # Linha 3 sem estratégia, linha 4 com stake 0 e linha 5 sem competição
+    assert (importados, repetidos, invalidos) == (1, 0, 3)
+    assert any("Estratégia em falta" in erro for erro in erros)
+    recarregados = carregar()
+    assert recarregados['estrategias']['Nome'].tolist() == ['Lay']
+    assert 'Live' in recarregados['tags']
+    assert recarregados['campeonatos'].set_index('Nome')['Jogos'].to_dict() == {'Liga': 1}
+    assert sorted(recarregados['equipas']['Nome']) == ['Benfica', 'Porto']
+
+    # Reimportar o mesmo extrato não repete jogos e usa os nomes já registados
+    fixos['Estrategia'] = 'lay'
+    operacoes, importados, repetidos, _, _ = operacoes_extrato(
+        recarregados, ler_extrato(str(extrato), 'extrato.csv'), colunas, fixos)
+    registrar(recarregados, *operacoes)
+    assert (importados, repetidos) == (1, 1)
+    jogos = carregar()['jogos'].df.sort_index()
+    assert jogos['Casa'].tolist() == ['Benfica', 'Benfica']
+    assert jogos['Estrategia'].tolist() == ['Lay', 'Lay']
+    assert jogos['Competição'].tolist() == ['Liga', 'Liga']
+
+
+def grelha_do_dia(casa, visitante, stake, profit):
+    """Jogos como vêm da grelha do dia, com os valores comuns do formulário aplicados"""
+    grelha = pd.DataFrame({'Casa': casa, 'Visitante': visitante, 'Stake': stake, 'Profit/Loss': profit})
+    return grelha.assign(Data=date(2025, 3, 1), Estrategia='Back', Tag='Normal', **{'Competição': 'Liga'})
+
+
+def test_lote_da_grelha_numa_so_gravacao(modo):
+    dados = carregar()
+    registrar(dados, {'entidade': 'equipa', 'acao': 'adicionar', 'registro': {'Nome': 'Benfica'}})
+    jogos = grelha_do_dia(['benfica', None, 'Sporting', None], ['Porto', None, 'porto', None],
+                          [2.0, np.nan, 4.0, np.nan], [1.0, np.nan, -4.0, np.nan])
+
+    # As linhas vazias da grelha são ignoradas
+    df, erros = preparar_lote_jogos(jogos)
+    assert erros == []
+    assert df['% Stake'].tolist() == [50.0, -100.0]
+
+    # Uma operação por entidade nova e uma só para todos os jogos, gravadas de uma vez
+    operacoes = operacoes_lote(dados, df)
+    assert [op['entidade'] for op in operacoes] == ['equipa', 'campeonato', 'estrategia', 'jogo']
+    registrar(dados, *operacoes)
+
+    recarregados = carregar()
+    jogos = recarregados['jogos'].df.sort_index()
+    assert jogos['Casa'].tolist() == ['Benfica', 'Sporting']
+    assert jogos['Visitante'].tolist() == ['Porto', 'Porto']
+    assert sorted(recarregados['equipas']['Nome']) == ['Benfica', 'Porto', 'Sporting']
+    assert recarregados['campeonatos'].set_index('Nome')['Jogos'].to_dict() == {'Liga': 2}
+    assert recarregados['proximo_id'] == 2
+
+
+def test_lote_da_grelha_com_erros():
+    jogos = grelha_do_dia(['Benfica', 'Braga', 'Sporting'], ['Porto', 'Porto', None],
+                          [2.0, 0.0, 2.0], [1.0, 1.0, 1.0])
+
+    df, erros = preparar_lote_jogos(jogos)
+    assert erros == ["Equipa Casa e Visitante são obrigatórias (jogo 3)", "Stake deve ser maior que zero (jogo 2)"]
+
+    df, erros = preparar_lote_jogos(jogos, descartar_invalidos=True)
+    assert len(erros) == 2
+    assert df['Casa'].tolist() == ['Benfica']
+
+
+def ler_exportacao(arquivo, formato):
+    dados = io.BytesIO(arquivo.read())
+    if formato == 'CSV':
+        return pd.read_csv(dados, encoding='utf-8-sig')
+    if formato == 'Parquet':
+        return pd.read_parquet(dados)
+    return pd.read_excel(dados)
+
+
+@pytest.mark.parametrize('formato', ['CSV', 'Parquet', 'XLSX'])
+def test_exportar_jogos_e_estatisticas(modo, formato):
+    if formato != 'CSV':
+        pytest.importorskip(extratos.MODULOS_FORMATO[formato])
+    dados = carregar()
+    registrar(dados, op_jogos(0, ('2025-03-01', 'Liga', 'Benfica', 'Porto', 1.5),
+                              ('2025-01-02', 'Taça', 'Braga', 'Benfica', -2.0),
+                              ('2024-12-30', 'Liga', 'Porto', 'Braga', 1.0)))
+    dados = carregar()
+
+    # Os jogos saem um mês de cada vez, por ordem de data, e só os do período e do filtro
+    inicio, fim = pd.Timestamp(2025, 1, 1), pd.Timestamp(2026, 1, 1)
+    arquivo = exportar_blocos(blocos_jogos(dados['jogos'], inicio, fim, 'benf'), formato, ['ID'] + COLUNAS_JOGO)
+    jogos = ler_exportacao(arquivo, formato)
+    assert jogos.columns.tolist() == ['ID'] + COLUNAS_JOGO
+    assert jogos['ID'].tolist() == [1, 0]
+    assert jogos['Casa'].tolist() == ['Braga', 'Benfica']
+    assert jogos['Profit/Loss'].tolist() == [-2.0, 1.5]
+
+    tabela = tabela_exportacao(dados, 'equipa', inicio, fim)
+    equipas = ler_exportacao(exportar_blocos([tabela], formato, list(tabela.columns)), formato)
+    assert equipas.set_index('Nome')['Mercados'].to_dict() == {'Benfica': 2, 'Braga': 1, 'Porto': 1}
+
+    # Sem jogos fica só o cabeçalho
+    vazio = ler_exportacao(exportar_blocos(blocos_jogos(dados['jogos'], fim), formato, ['ID'] + COLUNAS_JOGO), formato)
+    assert vazio.empty and vazio.columns.tolist() == ['ID'] + COLUNAS_JOGO
+
+
+def test_exportar_parquet_com_coluna_vazia_no_primeiro_bloco():
+    pytest.importorskip('pyarrow')
+    blocos = [
+        pd.DataFrame({'ID': [0], 'Data': pd.to_datetime(['2025-01-05']), 'Tag': [None], '% Stake': [None]}),
+        pd.DataFrame({'ID': [1], 'Data': pd.to_datetime(['2025-02-05']), 'Tag': ['Live'], '% Stake': [50.0]}),
+    ]
+    jogos = pd.read_parquet(exportar_blocos(blocos, 'Parquet', ['ID', 'Data', 'Tag', '% Stake']))
+    assert jogos['Tag'].tolist()[1:] == ['Live']
+    assert jogos['% Stake'].tolist()[1:] == [50.0]
+    assert str(jogos['% Stake'].dtype) == 'float32'
+
+
+def test_exportar_xlsx_recusa_linhas_a_mais(monkeypatch):
+    pytest.importorskip('openpyxl')
+    monkeypatch.setattr(extratos, 'MAX_LINHAS_XLSX', 2)
+    bloco = pd.DataFrame({'Nome': ['A', 'B'], 'Mercados': [1, 2]})
+    exportar_blocos([bloco], 'XLSX', ['Nome', 'Mercados'])
+    with pytest.raises(ValueError):
+        exportar_blocos([bloco, bloco], 'XLSX', ['Nome', 'Mercados'])
+
+
+@pytest.mark.parametrize('modo', ['json', 'colunar'])
+def test_copia_do_ledger_nao_muda_com_a_sessao(modo, tmp_path, monkeypatch):
+    usar_armazenamento(modo, tmp_path, monkeypatch)
+    dados = carregar()
+    registrar(dados, op_jogos(0, ('2025-01-05', 'Liga', 'Benfica', 'Porto', 1.0),
+                              ('2025-02-05', 'Liga', 'Braga', 'Porto', 1.0)))
+    compactar_dados(dados)
+    dados = carregar()
+    copia = dados['jogos'].copia()
+
+    # A sessão lê partições e altera jogos depois de a cópia ser tirada (como o download noutra thread)
+    registrar(dados, {'entidade': 'jogo', 'acao': 'atualizar', 'id': 0, 'jogo': {'Profit/Loss': 5.0}})
+    registrar(dados, {'entidade': 'jogo', 'acao': 'remover', 'id': 1})
+    jogos = pd.concat(list(blocos_jogos(copia)))
+    assert jogos['Profit/Loss'].tolist() == [1.0, 1.0]
+
+
+def operacoes_aleatorias(dados, passos, semente):
+    """Aplica uma sequência aleatória de jogos adicionados, alterados e removidos, e de renomeações"""
+    aleatorio = random.Random(semente)
+    ids = []
+
+    def jogo():
+        return {
+            'Data': f"{aleatorio.choice([2024, 2025])}-{aleatorio.randint(1, 12):02d}-{aleatorio.randint(1, 28):02d}",
+            'Competição': aleatorio.choice(['L1', 'L2']), 'Casa': aleatorio.choice('ABCD'),
+            'Visitante': aleatorio.choice('ABCD'), 'Stake': round(aleatorio.uniform(1, 10), 2),
+            'Profit/Loss': aleatorio.choice([0.0, round(aleatorio.uniform(-10, 10), 2)]), '% Stake': 0.0,
+            'Estrategia': aleatorio.choice(['S1', 'S2']), 'Tag': aleatorio.choice(dados['tags'])
+        }
+
+    for _ in range(passos):
+        sorteio = aleatorio.random()
+        if sorteio < 0.5 or not ids:
+            novos = [{'ID': dados['proximo_id'] + i, **jogo()} for i in range(aleatorio.randint(1, 4))]
+            aplicar_operacao(dados, {'entidade': 'jogo', 'acao': 'adicionar',
+                                     'jogos': pd.DataFrame(novos).to_dict('list')})
+            ids += [novo['ID'] for novo in novos]
+        elif sorteio < 0.75:
+            novo = jogo()
+            campos = aleatorio.sample(list(novo), 3)
+            aplicar_operacao(dados, {'entidade': 'jogo', 'acao': 'atualizar', 'id': aleatorio.choice(ids),
+                                     'jogo': {campo: novo[campo] for campo in campos}})
+        elif sorteio < 0.97:
+            id_jogo = aleatorio.choice(ids)
+            ids.remove(id_jogo)
+            aplicar_operacao(dados, {'entidade': 'jogo', 'acao': 'remover', 'id': id_jogo})
+        elif not dados['equipas'].empty:
+            # Renomear para um nome que já existe junta as duas equipas
+            indice = aleatorio.randrange(len(dados['equipas']))
+            aplicar_operacao(dados, {'entidade': 'equipa', 'acao': 'atualizar', 'indice': indice,
+                                     'registro': {'Nome': aleatorio.choice('ABCDEF')}})
+
+
+def test_resumo_coerente_com_ledger():
+    dados = criar_estrutura_vazia()
+    dados['equipas'] = pd.DataFrame({'Nome': list('ABCD')})
+    operacoes_aleatorias(dados, 600, semente=3)
+
+    de_raiz = Resumo.de_jogos(dados['jogos'])
+    incremental = Resumo.de_json(dados['resumo'].para_json(), dados['dicionarios'])
+    for dimensao in Resumo.DIMENSOES:
+        assert de_raiz.totais[dimensao].keys() == incremental.totais[dimensao].keys()
+        for entrada, valores in de_raiz.totais[dimensao].items():
+            assert incremental.totais[dimensao][entrada][:2] == valores[:2]
+            assert np.allclose(incremental.totais[dimensao][entrada][2:], valores[2:])
+        assert dados['resumo'].usos[dimensao] == de_raiz.usos[dimensao]
+        assert dados['resumo'].meses[dimensao] == de_raiz.meses[dimensao]
+
+    # As estatísticas do resumo batem com as contas feitas sobre os próprios jogos
+    jogos = dados['jogos'].df
+    for inicio, fim in [(None, None), (pd.Timestamp(2024, 8, 1), pd.Timestamp(2025, 8, 1))]:
+        periodo = jogos[(jogos['Data'] >= (inicio or pd.Timestamp.min))
+                        & (jogos['Data'] < (fim or pd.Timestamp.max))]
+        agrupados = calcular_stats_agrupados(dados, inicio, fim)
+        for equipa in 'ABCDEF':
+            da_equipa = periodo[(periodo['Casa'] == equipa) | (periodo['Visitante'] == equipa)]
+            stats = calcular_stats_equipa(dados, equipa, inicio, fim)
+            assert stats['Mercados'] == len(da_equipa)
+            assert stats['Greens'] == int((da_equipa['Profit/Loss'] >= 0).sum())
+            assert stats['Profit/Loss'] == pytest.approx(da_equipa['Profit/Loss'].sum())
+            if len(da_equipa):
+                assert agrupados['equipas'].loc[equipa].to_dict() == pytest.approx(stats)
+        por_campeonato = periodo.groupby('Competição', observed=True)['Profit/Loss'].sum()
+        assert agrupados['campeonatos']['total_profit'].to_dict() == pytest.approx(por_campeonato.to_dict())
+
+
+def test_sqlite_usa_o_caminho_configurado(tmp_path, monkeypatch):
+    usar_armazenamento('sqlite', tmp_path, monkeypatch)
+    base = tmp_path / 'outra' / 'apostas.db'
+    base.parent.mkdir()
+    monkeypatch.setattr(armazenamento, 'SQLITE_FILE', str(base))
+    dados = carregar()
+    registrar(dados, op_jogos(0, ('2025-03-01', 'Liga', 'Benfica', 'Porto', 1.0)))
+
+    assert base.exists()
+    assert not (tmp_path / 'dados_apostas.db').exists()
+    assert len(carregar()['jogos']) == 1
+
+
+def test_resumo_sqlite_igual_ao_resumo_em_memoria(tmp_path, monkeypatch):
+    dados = criar_estrutura_vazia()
+    dados['equipas'] = pd.DataFrame({'Nome': list('ABCD')})
+    operacoes_aleatorias(dados, 300, semente=5)
+
+    monkeypatch.chdir(tmp_path)
+    conexao = armazenamento._abrir_sqlite()
+    ledger = armazenamento.LedgerSQLite(conexao, dados['dicionarios'])
+    ledger.adicionar(dados['jogos'].df_ids)
+    resumo = armazenamento.ResumoSQLite(conexao, dados['dicionarios'])
+    for dimensao in Resumo.DIMENSOES:
+        for inicio, fim in [(None, None), (pd.Timestamp(2025, 1, 1), None)]:
+            esperado = dados['resumo'].tabela(dimensao, inicio, fim).sort_index()
+            obtido = resumo.tabela(dimensao, inicio, fim).sort_index()
+            pd.testing.assert_frame_equal(obtido, esperado, check_like=True)
+            if dimensao != 'mes':
+                for nome in esperado.index:
+                    assert resumo.total(dimensao, nome, inicio, fim) == pytest.approx(
+                        dados['resumo'].total(dimensao, nome, inicio, fim))
+
+
+def test_ledger_ultimos_do_periodo():
+    dados = criar_estrutura_vazia()
+    operacoes_aleatorias(dados, 200, semente=7)
+    ledger = Ledger(dados['jogos'].df)
+    for inicio, fim in [(None, None), (pd.Timestamp(2024, 8, 1), pd.Timestamp(2025, 8, 1))]:
+        esperado = ledger.periodo(inicio, fim).sort_values('Data', ascending=False).head(5)
+        assert ledger.ultimos(5, inicio, fim)['Data'].tolist() == esperado['Data'].tolist()
+
+
+def test_series_contam_profit_zero_como_green():
+    jogos = pd.DataFrame({
+        'Data': pd.date_range('2025-01-01', periods=7), 'Stake': 1.0,
+        'Profit/Loss': [1.0, 0.0, 1.0, -1.0, -1.0, 0.0, -1.0],
+        'Estrategia': 'E', 'Tag': 'T', 'Competição': 'L', 'Casa': 'A', 'Visitante': 'B'
+    })
+    _, metricas = analisar_risco(jogos, 'Estrategia')
+    assert metricas.loc['E', 'Maior Série Green'] == 3
+    assert metricas.loc['E', 'Maior Série Red'] == 2
+
+
+def jogos_bootstrap():
+    aleatorio = np.random.default_rng(11)
+    return pd.DataFrame({
+        'Stake': aleatorio.uniform(1, 10, 300).round(2),
+        'Profit/Loss': aleatorio.normal(0.3, 5, 300).round(2),
+        'Estrategia': aleatorio.choice(['Back', 'Lay', 'Under'], 300),
+        'Tag': aleatorio.choice(['Normal', 'Live'], 300),
+        'Competição': ['Liga'] * 299 + ['Taça']
+    })
+
+
+def test_bootstrap_intervalos_do_roi():
+    jogos = jogos_bootstrap()
+    jogos.loc[jogos['Estrategia'] == 'Under', 'Profit/Loss'] = 1.0
+    intervalos = calcular_bootstrap(jogos, reamostragens=500)
+    inferior, superior, positivo = intervalos['Estrategia'].columns
+
+    # O intervalo contém o ROI de cada grupo e é o mesmo sempre que os jogos são os mesmos
+    roi = jogos.groupby('Estrategia')['Profit/Loss'].sum() / jogos.groupby('Estrategia')['Stake'].sum() * 100
+    tabela = intervalos['Estrategia'].join(roi.rename('ROI'))
+    assert ((tabela[inferior] <= tabela['ROI']) & (tabela['ROI'] <= tabela[superior])).all()
+    pd.testing.assert_frame_equal(calcular_bootstrap(jogos, reamostragens=500)['Estrategia'], intervalos['Estrategia'])
+
+    assert intervalos['Estrategia'].loc['Under', positivo] == 100
+    # Com um só jogo não há variação
+    taca = intervalos['Competição'].loc['Taça']
+    assert taca[inferior] == taca[superior]
+    assert sorted(intervalos['Tag'].index) == ['Live', 'Normal']
+
+
+def test_bootstrap_em_processos_igual_ao_sequencial(monkeypatch, caplog):
+    jogos = jogos_bootstrap()
+    sequencial = calcular_bootstrap(jogos, reamostragens=200)
+
+    monkeypatch.setattr(estatisticas, 'SORTEIOS_PROCESSOS', 0)
+    monkeypatch.setattr(estatisticas.os, 'cpu_count', lambda: 2)
+    paralelo = calcular_bootstrap(jogos, reamostragens=200)
+
+    assert "Erro no bootstrap em paralelo" not in caplog.text
+    for coluna in estatisticas.COLUNAS_BOOTSTRAP:
+        pd.testing.assert_frame_equal(paralelo[coluna], sequencial[coluna])
+
+
+def test_perfil_desligado_nao_mede(monkeypatch):
+    monkeypatch.setattr(perfil, 'PERFIL_ATIVO', False)
+    funcao = lambda: 'ok'
+    assert perfil.medido('agregar')(funcao) is funcao
+    with perfil.fase('agregar'):
+        assert perfil.perfil_atual() is None
+
+
+def test_perfil_fases_sem_o_tempo_das_de_dentro(monkeypatch):
+    monkeypatch.setattr(perfil, 'PERFIL_ATIVO', True)
+    registo = perfil.novo_registo()
+    monkeypatch.setattr(perfil, '_obter_registo', lambda: registo)
+    # Início e fim de agregar em 0 e 6; formatar corre dentro dele, de 1 a 3
+    relogio = iter([0.0, 1.0, 3.0, 6.0])
+    monkeypatch.setattr(perfil, 'time', SimpleNamespace(perf_counter=lambda: next(relogio)))
+
+    @perfil.medido('agregar')
+    def agregar():
+        with perfil.fase('formatar'):
+            pass
+        return 'ok'
+
+    assert agregar() == 'ok'
+    assert registo['fases']['agregar'] == 4.0
+    assert registo['fases']['formatar'] == 2.0
+    assert registo['pilha'] == []
+
+
+def test_perfil_conta_gravacoes(modo, monkeypatch):
+    monkeypatch.setattr(perfil, 'PERFIL_ATIVO', True)
+    monkeypatch.setattr(armazenamento, 'PERFIL_ATIVO', True)
+    dados = carregar()
+    salvar_dados(dados)
+    registo = perfil.novo_registo()
+    monkeypatch.setattr(perfil, '_obter_registo', lambda: registo)
+
+    journal = armazenamento._caminho_journal()
+    tamanho = os.path.getsize(journal) if os.path.exists(journal) else 0
+    registrar(dados, op_jogos(0, ('2025-03-01', 'Liga', 'Benfica', 'Porto', 1.5)))
+    registrar(dados, {'entidade': 'tag', 'acao': 'adicionar', 'nome': 'Live'})
+
+    assert registo['gravacoes'] == 2
+    if modo == 'sqlite':
+        # Na base conta-se o crescimento do arquivo e do WAL
+        assert registo['bytes'] > 0
+    else:
+        # No journal os bytes contados são os acrescentados ao arquivo
+        assert registo['bytes'] == os.path.getsize(journal) - tamanho > 0
+
+
+def correr_relatorios(monkeypatch, *argumentos):
+    monkeypatch.setattr(sys, 'argv', ['relatorios.py', '--processos', '1', *argumentos])
+    return relatorios.main()
+
+
+def test_relatorios_da_epoca_e_dos_meses(modo, monkeypatch, capsys):
+    dados = carregar()
+    salvar_dados(dados)
+    registrar(dados, op_jogos(0, ('2024-09-14', 'Liga', 'Benfica', 'Porto', 1.5),
+                              ('2024-09-20', 'Liga', 'Sporting', 'Braga', -2.0),
+                              ('2025-03-02', 'Taça', 'Porto', 'Braga', 0.5),
+                              ('2025-09-01', 'Liga', 'Benfica', 'Braga', 1.0)))
+
+    assert correr_relatorios(monkeypatch, '--epoca', '2024', '--mes', '2024-12', '--saida', 'saida') == 0
+    gravados = capsys.readouterr().out.split()
+    # Um relatório por mês da época com jogos, o da época e os meses pedidos, mesmo sem jogos
+    assert sorted(os.path.basename(arquivo) for arquivo in gravados) == [
+        '2024-09.html', '2024-12.html', '2025-03.html', 'epoca_2024-25.html'
+    ]
+    assert os.path.exists(os.path.join('saida', relatorios.PLOTLYJS_FILE))
+    with open(os.path.join('saida', 'epoca_2024-25.html'), encoding='utf-8') as f:
+        epoca = f.read()
+    assert 'Época 2024/25' in epoca and 'Desempenho Mensal' in epoca
+    with open(os.path.join('saida', '2024-12.html'), encoding='utf-8') as f:
+        assert 'Nenhum jogo registrado em Dezembro 2024' in f.read()
+
+
+def test_relatorios_recusa_mes_invalido(monkeypatch, capsys):
+    with pytest.raises(SystemExit):
+        correr_relatorios(monkeypatch, '--mes', '2025-13')
+    assert 'mês inválido' in capsys.readouterr().err